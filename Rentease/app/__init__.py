@@ -1,16 +1,28 @@
 ﻿# Main app factory - creates and configures Flask app
 from flask import Flask, jsonify
+import os
+import time
 from .extensions import init_extensions
+from .admission import init_admission
+from .compress import init_compression
+from .health import init_health, mark_started
+from .serialize import init_json
 from .properties.routes import properties_app
 from .auth.routes import auth_app
 from .agent.routes import agent_app
 from .admin.routes import admin_app
 from .user.routes import user_app
+from .images.routes import images_app
+from .bookings.routes import bookings_app
 
 def create_app():
+    started = time.perf_counter()
     app = Flask(__name__)
     app.url_map.strict_slashes = False  # prevents redirect issues with CORS
+    # app.logger is the "app" logger, so the app.* module loggers share its level and handler
+    app.logger.setLevel(os.environ.get("LOG_LEVEL", "INFO"))
     
+    init_json(app)  # before anything serializes
     init_extensions(app)
     
     # register all blueprints with their url prefixes
@@ -19,9 +31,20 @@ def create_app():
     app.register_blueprint(agent_app, url_prefix="/api/v1/agent")
     app.register_blueprint(admin_app, url_prefix="/api/v1/admin")
     app.register_blueprint(user_app, url_prefix="/api/v1/users")
+    app.register_blueprint(images_app, url_prefix="/api/v1/images")
+    app.register_blueprint(bookings_app, url_prefix="/api/v1/bookings")
+
+    # per-route priority classes, concurrency caps and rate limits (opt-in)
+    init_admission(app)
+    # gzip/br/zstd for large JSON and exports
+    init_compression(app)
 
     @app.route("/")
     def index():
         return jsonify({"msg": "RentEase API running"}), 200
 
+    # /healthz (liveness) and /readyz (Mongo + indexes)
+    init_health(app)
+
+    mark_started(time.perf_counter() - started)
     return app
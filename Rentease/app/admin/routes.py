@@ -1,48 +1,64 @@
 ﻿# Admin routes - admin only operations
 from flask import Blueprint, request, jsonify, make_response
-from flask_jwt_extended import jwt_required, get_jwt
 from bson import ObjectId
+from pymongo import ReturnDocument
+from datetime import datetime
 import app.extensions as ext
+import app.cache as cache
+import app.admission as admission
+import app.geo as geo
+import app.stats as stats
+import app.bulk as bulk
+from app.serialize import get_data, PROPERTY_DOC
+from app.export import stream_export, FORMATS
+from app.authz import role_required
 
 admin_app = Blueprint("admin", __name__)
 
-# helper to get request data
-def get_data():
-    return request.get_json() if request.is_json else request.form
-
-# check if user is admin
-def _check_admin_role():
-    role = get_jwt().get("role", "user")
-    return role == "admin"
+# export columns - heavy fields (images, description, password hashes) stay out
+PROPERTY_EXPORT_COLUMNS = ["_id", "title", "price", "location", "property_type", "bedrooms",
+                           "bathrooms", "area", "available", "agent_id", "createdAt", "updatedAt"]
+USER_EXPORT_COLUMNS = ["_id", "email", "first_name", "last_name", "role", "phone"]
 
 
 # GET /properties - all properties
 @admin_app.route("/properties", methods=["GET"])
-@jwt_required()
+@role_required("admin")
 def admin_all_properties():
     if ext.db is None:
         return make_response(jsonify({"Error": "Database not connected"}), 500)
     
-    if not _check_admin_role():
-        return make_response(jsonify({"Error": "Admin role required"}), 403)
-    
     coll = ext.db["biz"]
-    docs = list(coll.find({"type": "property"}))
-    for d in docs:
-        d["_id"] = str(d["_id"])
+    # ?format=ndjson|csv streams instead of building the whole list
+    fmt = request.args.get("format")
+    if fmt in FORMATS:
+        return stream_export(coll, {"type": "property"}, fmt, PROPERTY_EXPORT_COLUMNS, "properties")
+
+    docs = PROPERTY_DOC.many(coll.find({"type": "property"}, PROPERTY_DOC.projection))
     return make_response(jsonify(docs), 200)
 
 
+# GET /cache/stats - property cache counters
+@admin_app.route("/cache/stats", methods=["GET"])
+@role_required("admin")
+def cache_stats():
+    return make_response(jsonify(cache.property_cache.stats()), 200)
+
+
+# GET /admission/stats - admitted and shed request counts
+@admin_app.route("/admission/stats", methods=["GET"])
+@role_required("admin")
+def admission_stats():
+    return make_response(jsonify(admission.controller.stats()), 200)
+
+
 # PUT /properties/<id> - update any property
 @admin_app.route("/properties/<string:pid>", methods=["PUT", "PATCH"])
-@jwt_required()
+@role_required("admin")
 def admin_update_property(pid):
     if ext.db is None:
         return make_response(jsonify({"Error": "Database not connected"}), 500)
     
-    if not _check_admin_role():
-        return make_response(jsonify({"Error": "Admin role required"}), 403)
-    
     data = get_data()
     coll = ext.db["biz"]
 
@@ -54,66 +70,72 @@ def admin_update_property(pid):
     update = {}
     for k in ["title", "price", "location", "available", "property_type"]:
         if k in data:
-            update[k] = int(data[k]) if k == "price" else data[k]
+            update[k] = data[k]
+    if "price" in update:
+        try:
+            update["price"] = bulk.to_int(update["price"])
+        except (ValueError, TypeError):
+            return make_response(jsonify({"Error": "price must be a whole number"}), 400)
     
     if not update:
         return make_response(jsonify({"Error": "No valid fields"}), 400)
+    update["updatedAt"] = datetime.utcnow()  # keeps ETags in step with the data
+    if "location" in update:
+        update["geo"] = geo.geocode(update["location"])
 
-    res = coll.update_one({"_id": oid, "type": "property"}, {"$set": update})
-    if res.matched_count == 0:
+    before = coll.find_one_and_update({"_id": oid, "type": "property"}, {"$set": update},
+                                      projection={"available": 1, "agent_id": 1, "price": 1}, return_document=ReturnDocument.BEFORE)
+    if before is None:
         return make_response(jsonify({"Error": "Not found"}), 404)
+    cache.property_cache.invalidate_property(oid)
+    stats.property_updated(before, dict(before, **update))
     return make_response(jsonify({"msg": "Updated"}), 200)
 
 
 # DELETE /properties/<id> - delete any property
 @admin_app.route("/properties/<string:pid>", methods=["DELETE"])
-@jwt_required()
+@role_required("admin")
 def admin_delete_property(pid):
     if ext.db is None:
         return make_response(jsonify({"Error": "Database not connected"}), 500)
     
-    if not _check_admin_role():
-        return make_response(jsonify({"Error": "Admin role required"}), 403)
-    
     coll = ext.db["biz"]
     try:
         oid = ObjectId(pid)
     except Exception:
         return make_response(jsonify({"Error": "Bad id"}), 400)
 
-    res = coll.delete_one({"_id": oid, "type": "property"})
-    if res.deleted_count == 0:
+    res = coll.find_one_and_delete({"_id": oid, "type": "property"}, projection={"available": 1, "agent_id": 1, "price": 1})
+    if res is None:
         return make_response(jsonify({"Error": "Not found"}), 404)
+    cache.property_cache.invalidate_property(oid)
+    stats.property_deleted(res)
     return make_response(jsonify({"msg": "Deleted"}), 200)
 
 
 # GET /users - all users
 @admin_app.route("/users", methods=["GET"])
-@jwt_required()
+@role_required("admin")
 def admin_all_users():
     if ext.db is None:
         return make_response(jsonify({"Error": "Database not connected"}), 500)
     
-    if not _check_admin_role():
-        return make_response(jsonify({"Error": "Admin role required"}), 403)
-    
     coll = ext.db["biz"]
+    fmt = request.args.get("format")
+    if fmt in FORMATS:
+        return stream_export(coll, {"type": "user"}, fmt, USER_EXPORT_COLUMNS, "users")
+
     docs = list(coll.find({"type": "user"}, {"password_hash": 0}))
-    for d in docs:
-        d["_id"] = str(d["_id"])
     return make_response(jsonify(docs), 200)
 
 
 # PUT /users/<id>/role - update user role
 @admin_app.route("/users/<string:uid>/role", methods=["PUT"])
-@jwt_required()
+@role_required("admin")
 def set_user_role(uid):
     if ext.db is None:
         return make_response(jsonify({"Error": "Database not connected"}), 500)
     
-    if not _check_admin_role():
-        return make_response(jsonify({"Error": "Admin role required"}), 403)
-    
     data = get_data()
     role = data.get("role")
     if not role:
@@ -133,19 +155,15 @@ def set_user_role(uid):
 
 # GET /statistics - system stats
 @admin_app.route("/statistics", methods=["GET"])
-@jwt_required()
+@role_required("admin")
 def statistics():
     if ext.db is None:
         return make_response(jsonify({"Error": "Database not connected"}), 500)
     
-    if not _check_admin_role():
-        return make_response(jsonify({"Error": "Admin role required"}), 403)
-    
-    coll = ext.db["biz"]
-    stats = {
-        "users": coll.count_documents({"type": "user"}),
-        "properties": coll.count_documents({"type": "property"}),
-        "favorites": coll.count_documents({"type": "favorite"}),
-        "inquiries": coll.count_documents({"type": "inquiry"})
-    }
-    return make_response(jsonify(stats), 200)
+    # one aggregation, or the counters document when it's maintained
+    if stats.enabled:
+        stats.ensure_reconciler()
+        raw = stats.read_counters(ext.db)
+    else:
+        raw = stats.aggregate_stats(ext.db)
+    return make_response(jsonify(stats.format_stats(raw)), 200)
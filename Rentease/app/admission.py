@@ -0,0 +1,257 @@
+﻿# Admission control - sheds low-priority work before a worker's threads are all busy
+# Every route has a priority class (browse > write > bulk). Lower classes are
+# refused (503) once fewer threads are left free, so cheap reads keep
+# running while bcrypt logins or admin full scans pile up. Some routes also
+# have their own concurrency cap, and every client gets a token bucket per
+# class (429). Buckets are in-process by default; anything implementing
+# RateLimitBackend (e.g. a Redis-compatible client wrapper) can be swapped in
+# in_flight only counts requests a worker thread already picked up, so it
+# never exceeds the gunicorn thread count: with capacity = threads, browse
+# and write are never shed for overload, only by queue time, route caps and
+# rates. Set ADMISSION_CAPACITY below the thread count to shed them earlier.
+import math
+import os
+import threading
+import time
+from flask import g, jsonify, make_response, request
+
+BROWSE, WRITE, BULK = "browse", "write", "bulk"
+CLASSES = (BROWSE, WRITE, BULK)
+
+# a class is shed once in-flight requests reach this share of capacity
+SHED_AT = {BROWSE: 1.0, WRITE: 0.8, BULK: 0.5}
+# ...or once a request waited longer than this (ms) in a proxy queue
+# (needs X-Request-Start, e.g. nginx: proxy_set_header X-Request-Start "t=${msec}")
+MAX_QUEUE_MS = {BROWSE: 2000, WRITE: 1000, BULK: 500}
+# per-client token buckets: class -> (tokens per second, burst)
+DEFAULT_RATES = "browse=20/40,write=5/20,bulk=0.5/3"
+
+# routes that aren't plain reads/writes by method
+ROUTE_CLASSES = {
+    "bookings.check_availability": BROWSE,
+    "admin.admin_all_properties": BULK,
+    "admin.admin_all_users": BULK,
+    "agent.bulk_create": BULK,
+    "agent.bulk_update": BULK,
+}
+# share of capacity one route may hold at once (at least one request)
+ROUTE_SHARES = {
+    "auth.login_user": 0.25,
+    "auth.register_user": 0.25,
+    "images.upload_images": 0.25,
+    "properties.add_property_images": 0.25,
+    "admin.admin_all_properties": 0.1,
+    "admin.admin_all_users": 0.1,
+    "agent.bulk_create": 0.1,
+    "agent.bulk_update": 0.1,
+}
+# never shed: health/monitoring and the stats needed to see shedding
+EXEMPT = {"index", "static", "metrics", "healthz", "readyz", "admin.admission_stats"}
+
+
+class Shed(Exception):
+    def __init__(self, status, reason, retry_after):
+        super().__init__(reason)
+        self.status = status
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+# backend interface - take one token from key's bucket
+# returns 0 when allowed, else the seconds until a token is available
+class RateLimitBackend:
+    def take(self, key, rate, burst):
+        raise NotImplementedError
+
+    def stats(self):
+        return {}
+
+
+# in-process buckets; idle (full) buckets are dropped when there are too many
+class MemoryRateLimitBackend(RateLimitBackend):
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self._buckets = {}  # key -> [tokens, last refill]
+        self._lock = threading.Lock()
+
+    def take(self, key, rate, burst):
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                if len(self._buckets) >= self.max_keys:
+                    self._prune(now)
+                bucket = self._buckets[key] = [burst, now]
+            tokens = min(burst, bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+            if tokens >= 1:
+                bucket[0] = tokens - 1
+                return 0
+            bucket[0] = tokens
+            return (1 - tokens) / rate if rate > 0 else 60
+
+    def _prune(self, now):
+        # a bucket idle for a minute is full again for any sane rate
+        for key in [k for k, (_, stamp) in self._buckets.items() if now - stamp > 60]:
+            del self._buckets[key]
+
+    def stats(self):
+        with self._lock:
+            return {"clients": len(self._buckets)}
+
+
+def parse_rates(value):
+    rates = {}
+    for part in (value or "").split(","):
+        if "=" not in part:
+            continue
+        name, spec = part.split("=", 1)
+        rate, _, burst = spec.partition("/")
+        rates[name.strip()] = (float(rate), float(burst or rate))
+    return rates
+
+
+# seconds since the proxy got the request, from "t=<seconds|ms|us>"
+def queued_seconds(header, now=None):
+    if not header:
+        return None
+    try:
+        stamp = float(header.strip().lstrip("t="))
+    except ValueError:
+        return None
+    if stamp > 1e14:
+        stamp /= 1e6
+    elif stamp > 1e11:
+        stamp /= 1e3
+    return max(0.0, (now or time.time()) - stamp)
+
+
+class AdmissionController:
+    def __init__(self, capacity=32, rates=None, backend=None, retry_after=1, enabled=True):
+        self.capacity = capacity
+        self.rates = dict(parse_rates(DEFAULT_RATES), **(rates or {}))
+        self.backend = backend or MemoryRateLimitBackend()
+        self.retry_after = retry_after
+        self.enabled = enabled
+        self.limits = {name: max(1, int(capacity * share)) for name, share in ROUTE_SHARES.items()}
+        self.in_flight = 0
+        self._routes = {}  # endpoint -> in flight
+        self._lock = threading.Lock()
+        self.admitted = {c: 0 for c in CLASSES}
+        self.shed = {c: {} for c in CLASSES}  # class -> reason -> count
+        self.shed_routes = {}  # endpoint -> count
+
+    @staticmethod
+    def classify(endpoint, method):
+        if endpoint in ROUTE_CLASSES:
+            return ROUTE_CLASSES[endpoint]
+        return BROWSE if method in ("GET", "HEAD") else WRITE
+
+    def _count_shed(self, cls, endpoint, reason):
+        self.shed[cls][reason] = self.shed[cls].get(reason, 0) + 1
+        self.shed_routes[endpoint] = self.shed_routes.get(endpoint, 0) + 1
+
+    # takes a slot or raises Shed; release() must follow an admit
+    def admit(self, endpoint, cls, client, queued=None):
+        with self._lock:
+            reason = None
+            if queued is not None and queued * 1000 > MAX_QUEUE_MS[cls]:
+                reason = "queue"
+            elif self.in_flight >= self.capacity * SHED_AT[cls]:
+                reason = "overload"
+            elif endpoint in self.limits and self._routes.get(endpoint, 0) >= self.limits[endpoint]:
+                reason = "concurrency"
+            if reason:
+                self._count_shed(cls, endpoint, reason)
+                raise Shed(503, reason, self.retry_after)
+            self.in_flight += 1
+            self._routes[endpoint] = self._routes.get(endpoint, 0) + 1
+
+        rate, burst = self.rates.get(cls, (0, 0))
+        wait = self.backend.take(f"{cls}:{client}", rate, burst) if rate else 0
+        if wait:
+            self.release(endpoint)
+            with self._lock:
+                self._count_shed(cls, endpoint, "rate")
+            raise Shed(429, "rate", max(1, math.ceil(wait)))
+        with self._lock:
+            self.admitted[cls] += 1
+
+    def release(self, endpoint):
+        with self._lock:
+            self.in_flight -= 1
+            self._routes[endpoint] -= 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "capacity": self.capacity,
+                "in_flight": self.in_flight,
+                "route_limits": dict(self.limits),
+                "rates": {c: {"per_s": r, "burst": b} for c, (r, b) in self.rates.items()},
+                "admitted": dict(self.admitted),
+                "shed": {c: dict(r) for c, r in self.shed.items()},
+                "shed_by_route": dict(self.shed_routes),
+                "backend": self.backend.stats()
+            }
+
+
+controller = AdmissionController(enabled=False)
+
+
+# behind a trusted proxy the client is the first X-Forwarded-For hop
+def client_key(remote_addr, access_route=()):
+    if os.environ.get("ADMISSION_TRUST_PROXY", "0") == "1" and access_route:
+        return access_route[0]
+    return remote_addr or "unknown"
+
+
+def _client():
+    return client_key(request.remote_addr, request.access_route)
+
+
+def shed_message(e):
+    return "Too many requests, slow down" if e.status == 429 else "Server busy, try again shortly"
+
+
+def _before_request():
+    endpoint = request.endpoint
+    if endpoint is None or endpoint in EXEMPT or request.method == "OPTIONS":
+        return None
+    cls = controller.classify(endpoint, request.method)
+    try:
+        controller.admit(endpoint, cls, _client(), queued_seconds(request.headers.get("X-Request-Start")))
+    except Shed as e:
+        resp = make_response(jsonify({"Error": shed_message(e)}), e.status)
+        resp.headers["Retry-After"] = str(e.retry_after)
+        return resp
+    g._admission_endpoint = endpoint
+    return None
+
+
+# runs for every request, including shed and failed ones
+def _teardown_request(exc):
+    endpoint = g.pop("_admission_endpoint", None)
+    if endpoint is not None:
+        controller.release(endpoint)
+
+
+# call in create_app after the blueprints, with an optional shared rate-limit backend
+def init_admission(app, backend=None):
+    global controller
+    app.config.setdefault("ADMISSION_ENABLED", os.environ.get("ADMISSION_ENABLED", "0") == "1")
+    app.config.setdefault("ADMISSION_CAPACITY", int(os.environ.get("ADMISSION_CAPACITY", 32)))
+    app.config.setdefault("ADMISSION_RATES", os.environ.get("ADMISSION_RATES", DEFAULT_RATES))
+    app.config.setdefault("ADMISSION_RETRY_AFTER", int(os.environ.get("ADMISSION_RETRY_AFTER", 1)))
+
+    enabled = app.config["ADMISSION_ENABLED"]
+    controller = AdmissionController(capacity=app.config["ADMISSION_CAPACITY"],
+                                     rates=parse_rates(app.config["ADMISSION_RATES"]), backend=backend,
+                                     retry_after=app.config["ADMISSION_RETRY_AFTER"], enabled=enabled)
+    if not enabled:
+        return controller
+    app.before_request(_before_request)
+    app.teardown_request(_teardown_request)
+    app.logger.info("Admission control on: capacity %d per process", controller.capacity)
+    return controller
@@ -1,81 +1,66 @@
 ﻿# Agent routes - property management for agents
 from flask import Blueprint, request, jsonify, make_response
-from flask_jwt_extended import jwt_required, get_jwt
 from bson import ObjectId
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError
+from datetime import datetime
 import app.extensions as ext
+import app.cache as cache
+import app.geo as geo
+import app.stats as stats
+import app.bulk as bulk
+from app.serialize import get_data, PROPERTY_DOC
+from app.authz import role_required, current_user_id
 
 agent_app = Blueprint("agent", __name__)
 
-# helper to get request data
-def get_data():
-    return request.get_json() if request.is_json else request.form
-
 # get agent id from token
 def _agent_id():
-    return get_jwt().get("user_id")
-
-# check if user is agent or admin
-def _check_agent_role():
-    role = get_jwt().get("role", "user")
-    return role in ["agent", "admin"]
+    return current_user_id()
 
 
 # POST /properties - create property
 @agent_app.route("/properties", methods=["POST"])
-@jwt_required()
+@role_required("agent", "admin")
 def create_property():
     if ext.db is None:
         return make_response(jsonify({"Error": "Database not connected"}), 500)
     
-    if not _check_agent_role():
-        return make_response(jsonify({"Error": "Agent role required"}), 403)
-    
     data = get_data()
 
     if not all(k in data for k in ("title", "price", "location")):
         return make_response(jsonify({"Error": "Missing required fields"}), 400)
 
+    new_doc, errors = bulk.validate_property(data, _agent_id())
+    if errors:
+        return make_response(jsonify({"Error": "; ".join(errors)}), 400)
+
     coll = ext.db["biz"]
-    new_doc = {
-        "type": "property",
-        "title": data.get("title"),
-        "price": int(data.get("price")),
-        "location": data.get("location"),
-        "property_type": data.get("type", "apartment"),
-        "agent_id": _agent_id(),
-        "available": data.get("available", True)
-    }
     res = coll.insert_one(new_doc)
+    cache.property_cache.invalidate_property(res.inserted_id)
+    stats.property_created(new_doc)
     return make_response(jsonify({"msg": "Created", "id": str(res.inserted_id)}), 201)
 
 
 # GET /properties - get my properties
 @agent_app.route("/properties", methods=["GET"])
-@jwt_required()
+@role_required("agent", "admin")
 def my_properties():
     if ext.db is None:
         return make_response(jsonify({"Error": "Database not connected"}), 500)
     
-    if not _check_agent_role():
-        return make_response(jsonify({"Error": "Agent role required"}), 403)
-    
     coll = ext.db["biz"]
-    docs = list(coll.find({"type": "property", "agent_id": _agent_id()}))
-    for d in docs:
-        d["_id"] = str(d["_id"])
+    docs = PROPERTY_DOC.many(coll.find({"type": "property", "agent_id": _agent_id()}, PROPERTY_DOC.projection))
     return make_response(jsonify(docs), 200)
 
 
 # PUT /properties/<id> - update property
 @agent_app.route("/properties/<string:pid>", methods=["PUT", "PATCH"])
-@jwt_required()
+@role_required("agent", "admin")
 def update_property(pid):
     if ext.db is None:
         return make_response(jsonify({"Error": "Database not connected"}), 500)
     
-    if not _check_agent_role():
-        return make_response(jsonify({"Error": "Agent role required"}), 403)
-    
     data = get_data()
     coll = ext.db["biz"]
 
@@ -88,34 +73,177 @@ def update_property(pid):
     update = {}
     for k in ["title", "price", "location", "available", "property_type"]:
         if k in data:
-            update[k] = int(data[k]) if k == "price" else data[k]
+            update[k] = data[k]
+    if "price" in update:
+        try:
+            update["price"] = bulk.to_int(update["price"])
+        except (ValueError, TypeError):
+            return make_response(jsonify({"Error": "price must be a whole number"}), 400)
     
     if not update:
         return make_response(jsonify({"Error": "No valid fields"}), 400)
+    update["updatedAt"] = datetime.utcnow()  # keeps ETags in step with the data
+    if "location" in update:
+        update["geo"] = geo.geocode(update["location"])
 
-    res = coll.update_one({"_id": oid, "type": "property", "agent_id": _agent_id()}, {"$set": update})
-    if res.matched_count == 0:
+    before = coll.find_one_and_update({"_id": oid, "type": "property", "agent_id": _agent_id()}, {"$set": update},
+                                      projection={"available": 1, "agent_id": 1, "price": 1}, return_document=ReturnDocument.BEFORE)
+    if before is None:
         return make_response(jsonify({"Error": "Not found or not owner"}), 404)
+    cache.property_cache.invalidate_property(oid)
+    stats.property_updated(before, dict(before, **update))
     return make_response(jsonify({"msg": "Updated"}), 200)
 
 
 # DELETE /properties/<id> - delete property
 @agent_app.route("/properties/<string:pid>", methods=["DELETE"])
-@jwt_required()
+@role_required("agent", "admin")
 def delete_property(pid):
     if ext.db is None:
         return make_response(jsonify({"Error": "Database not connected"}), 500)
     
-    if not _check_agent_role():
-        return make_response(jsonify({"Error": "Agent role required"}), 403)
-    
     coll = ext.db["biz"]
     try:
         oid = ObjectId(pid)
     except Exception:
         return make_response(jsonify({"Error": "Bad id"}), 400)
 
-    res = coll.delete_one({"_id": oid, "type": "property", "agent_id": _agent_id()})
-    if res.deleted_count == 0:
+    res = coll.find_one_and_delete({"_id": oid, "type": "property", "agent_id": _agent_id()}, projection={"available": 1, "agent_id": 1, "price": 1})
+    if res is None:
         return make_response(jsonify({"Error": "Not found or not owner"}), 404)
+    cache.property_cache.invalidate_property(oid)
+    stats.property_deleted(res)
     return make_response(jsonify({"msg": "Deleted"}), 200)
+
+
+# POST /properties/bulk - import many properties (JSON array, CSV or NDJSON)
+# every row is validated first; valid rows are written unordered in chunks
+# and the response reports what happened to each row
+@agent_app.route("/properties/bulk", methods=["POST"])
+@role_required("agent", "admin")
+def bulk_create():
+    if ext.db is None:
+        return make_response(jsonify({"Error": "Database not connected"}), 500)
+
+    try:
+        rows = bulk.parse_rows(request)
+    except (bulk.BulkError, UnicodeDecodeError) as e:
+        return make_response(jsonify({"Error": str(e)}), 400)
+    if not rows:
+        return make_response(jsonify({"Error": "No rows"}), 400)
+
+    agent_id = _agent_id()
+    report = []
+    valid = []
+    for n, row in enumerate(rows):
+        doc, errors = bulk.validate_property(row, agent_id)
+        if errors:
+            report.append({"row": n, "status": "invalid", "errors": errors})
+        else:
+            report.append({"row": n, "status": "created"})
+            valid.append((n, doc))
+
+    coll = ext.db["biz"]
+    created = []
+    for chunk in bulk.chunks(valid):
+        docs = [doc for _, doc in chunk]
+        failed = {}
+        try:
+            coll.insert_many(docs, ordered=False)
+        except BulkWriteError as e:
+            failed = {err["index"]: err.get("errmsg", "Write failed") for err in e.details.get("writeErrors", [])}
+        for i, (n, doc) in enumerate(chunk):
+            if i in failed:
+                report[n] = {"row": n, "status": "failed", "error": failed[i]}
+            else:
+                report[n]["id"] = str(doc["_id"])
+                created.append(doc)
+
+    if created:
+        cache.property_cache.invalidate_property()
+        stats.properties_created(created)
+    status = 201 if len(created) == len(rows) else 207 if created else 400
+    return make_response(jsonify({
+        "created": len(created),
+        "invalid": sum(1 for r in report if r["status"] == "invalid"),
+        "failed": sum(1 for r in report if r["status"] == "failed"),
+        "rows": report
+    }), status)
+
+
+# PATCH /properties/bulk - set price / available on many of my properties
+# {"updates": [{"id", "price"?, "available"?}, ...]}
+# or {"ids": [...], "price"?, "available"?} to apply the same change to all
+@agent_app.route("/properties/bulk", methods=["PATCH"])
+@role_required("agent", "admin")
+def bulk_update():
+    if ext.db is None:
+        return make_response(jsonify({"Error": "Database not connected"}), 500)
+
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return make_response(jsonify({"Error": "Expected a JSON object"}), 400)
+    if isinstance(data.get("ids"), list):
+        shared = {k: data[k] for k in ("price", "available") if k in data}
+        rows = [dict(shared, id=pid) for pid in data["ids"]]
+    else:
+        rows = data.get("updates")
+    if not isinstance(rows, list) or not rows:
+        return make_response(jsonify({"Error": "No updates"}), 400)
+    if len(rows) > bulk.MAX_ROWS:
+        return make_response(jsonify({"Error": f"At most {bulk.MAX_ROWS} rows per request"}), 400)
+
+    report = []
+    pending = {}
+    for n, row in enumerate(rows):
+        pid, update, errors = bulk.validate_update(row)
+        if not errors:
+            try:
+                pending[n] = (ObjectId(pid), update)
+            except Exception:
+                errors = ["Bad id"]
+        report.append({"row": n, "id": pid, "status": "invalid", "errors": errors} if errors else {"row": n, "id": pid, "status": "updated"})
+
+    # one read up front: ownership plus the before-values the counters need
+    coll = ext.db["biz"]
+    agent_id = _agent_id()
+    owned = {}
+    for chunk in bulk.chunks(list({oid for oid, _ in pending.values()})):
+        for doc in coll.find({"_id": {"$in": chunk}, "type": "property", "agent_id": agent_id},
+                             {"available": 1, "agent_id": 1, "price": 1}):
+            owned[doc["_id"]] = doc
+
+    now = datetime.utcnow()
+    ops = []
+    changes = {}
+    for n, (oid, update) in pending.items():
+        if oid not in owned:
+            report[n] = {"row": n, "id": report[n]["id"], "status": "not_found"}
+            continue
+        update["updatedAt"] = now
+        ops.append((n, UpdateOne({"_id": oid, "type": "property", "agent_id": agent_id}, {"$set": update})))
+        before = owned[oid]
+        owned[oid] = dict(before, **update)  # a later row for the same id starts from this one
+        changes[n] = (oid, before, owned[oid])
+
+    for chunk in bulk.chunks(ops):
+        try:
+            coll.bulk_write([op for _, op in chunk], ordered=False)
+        except BulkWriteError as e:
+            for err in e.details.get("writeErrors", []):
+                n = chunk[err["index"]][0]
+                report[n] = {"row": n, "id": report[n]["id"], "status": "failed", "error": err.get("errmsg", "Write failed")}
+                changes.pop(n, None)
+
+    updated = [r for r in report if r["status"] == "updated"]
+    if updated:
+        cache.property_cache.invalidate_many({oid for oid, _, _ in changes.values()})
+        stats.properties_updated([(before, after) for _, before, after in changes.values()])
+    status = 200 if len(updated) == len(rows) else 207 if updated else 400
+    return make_response(jsonify({
+        "updated": len(updated),
+        "not_found": sum(1 for r in report if r["status"] == "not_found"),
+        "invalid": sum(1 for r in report if r["status"] == "invalid"),
+        "failed": sum(1 for r in report if r["status"] == "failed"),
+        "rows": report
+    }), status)
@@ -1,23 +1,36 @@
 ﻿# Auth routes - handles user registration and login
-from flask import Blueprint, request, jsonify, make_response
-from flask_jwt_extended import create_access_token
-import bcrypt
-from datetime import timedelta
-import uuid
+from concurrent.futures import TimeoutError as HashTimeout
+from flask import Blueprint, request
+from flask_jwt_extended import create_access_token, get_jwt
+from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
 import app.extensions as ext
+import app.tokens as tokens
+import app.passwords as passwords
+import app.authz as authz
+from app.serialize import get_data, api_response
 
 auth_app = Blueprint("auth", __name__)
 
-# helper to get request data
-def get_data():
-    return request.get_json() if request.is_json else request.form
+# access token (short lived, see JWT_ACCESS_TOKEN_EXPIRES) + stored refresh token
+def issue_tokens(user_id, role):
+    access_token = create_access_token(
+        identity=user_id,
+        additional_claims={"role": role, "user_id": user_id}
+    )
+    return access_token, tokens.issue(user_id)
 
-# helper to create api response
-def api_response(success, message, data=None, status_code=200):
-    response = {"success": success, "message": message}
-    if data is not None:
-        response["data"] = data
-    return make_response(jsonify(response), status_code)
+# auth pool is saturated - tell the client when to come back
+def busy_response(e):
+    resp = api_response(False, "Too many login attempts, try again shortly", status_code=429)
+    resp.headers["Retry-After"] = str(e.retry_after)
+    return resp
+
+# a queued hash didn't finish within the pool timeout - the pool is backed up
+def slow_response():
+    resp = api_response(False, "Authentication is busy, try again shortly", status_code=503)
+    resp.headers["Retry-After"] = str(passwords.hash_pool.retry_after)
+    return resp
 
 
 # POST /register - create new user account
@@ -43,9 +56,13 @@ def register_user():
     if coll.find_one({"email": email}):
         return api_response(False, "User already exists", status_code=409)
 
-    # hash password
-    pwd_bytes = password.encode('utf-8')[:72]
-    hashed = bcrypt.hashpw(pwd_bytes, bcrypt.gensalt())
+    # hash password (in the auth worker pool)
+    try:
+        hashed = passwords.hash_pool.hash(password)
+    except passwords.PoolBusy as e:
+        return busy_response(e)
+    except HashTimeout:
+        return slow_response()
     
     # create user document
     new_user = {
@@ -56,16 +73,15 @@ def register_user():
         "role": role,
         "phone": phone
     }
-    res = coll.insert_one(new_user)
+    # the unique email index settles concurrent registrations
+    try:
+        res = coll.insert_one(new_user)
+    except DuplicateKeyError:
+        return api_response(False, "User already exists", status_code=409)
     user_id = str(res.inserted_id)
     
     # generate tokens
-    access_token = create_access_token(
-        identity=user_id,
-        expires_delta=timedelta(hours=24),
-        additional_claims={"role": role, "user_id": user_id}
-    )
-    refresh_token = str(uuid.uuid4())
+    access_token, refresh_token = issue_tokens(user_id, role)
     
     user_data = {
         "_id": user_id,
@@ -102,21 +118,27 @@ def login_user():
     if not user:
         return api_response(False, "Invalid credentials", status_code=401)
 
-    # verify password
-    pwd_bytes = password.encode('utf-8')[:72]
-    if not bcrypt.checkpw(pwd_bytes, user.get("password_hash")):
+    # verify password (in the auth worker pool)
+    try:
+        valid = passwords.hash_pool.check(password, user.get("password_hash"))
+    except passwords.PoolBusy as e:
+        return busy_response(e)
+    except HashTimeout:
+        return slow_response()
+    if not valid:
         return api_response(False, "Invalid credentials", status_code=401)
 
+    # cost factor changed since this hash was made - upgrade it in the background
+    if passwords.hash_pool.needs_rehash(user.get("password_hash")):
+        match = {"_id": user["_id"], "password_hash": user.get("password_hash")}
+        passwords.hash_pool.hash_async(
+            password, lambda new_hash: coll.update_one(match, {"$set": {"password_hash": new_hash}}))
+
     user_id = str(user["_id"])
     role = user.get("role", "customer")
     
     # generate tokens
-    access_token = create_access_token(
-        identity=user_id,
-        expires_delta=timedelta(hours=24),
-        additional_claims={"role": role, "user_id": user_id}
-    )
-    refresh_token = str(uuid.uuid4())
+    access_token, refresh_token = issue_tokens(user_id, role)
     
     user_data = {
         "_id": user_id,
@@ -132,3 +154,47 @@ def login_user():
         "refresh_token": refresh_token,
         "user": user_data
     })
+
+
+# POST /refresh - swap a refresh token for a new access + refresh token pair
+@auth_app.route("/refresh", methods=["POST"])
+def refresh_tokens():
+    if ext.db is None:
+        return api_response(False, "Database not connected", status_code=500)
+
+    raw = get_data().get("refresh_token")
+    if not raw or not isinstance(raw, str):
+        return api_response(False, "refresh_token required", status_code=400)
+
+    try:
+        user_id, refresh_token = tokens.rotate(raw)
+    except tokens.TokenError as e:
+        return api_response(False, str(e), status_code=401)
+
+    # role may have changed since login, so read it again (indexed _id lookup)
+    user = ext.db["users"].find_one({"_id": ObjectId(user_id)}, {"role": 1})
+    if not user:
+        return api_response(False, "User not found", status_code=401)
+
+    access_token = create_access_token(
+        identity=user_id,
+        additional_claims={"role": user.get("role", "customer"), "user_id": user_id}
+    )
+    return api_response(True, "Token refreshed", {
+        "access_token": access_token,
+        "refresh_token": refresh_token
+    })
+
+
+# POST /logout - revoke the current access token (and refresh token if sent)
+@auth_app.route("/logout", methods=["POST"])
+@authz.role_required()
+def logout_user():
+    raw = (request.get_json(silent=True) or {}).get("refresh_token")
+    if raw and not isinstance(raw, str):
+        return api_response(False, "refresh_token must be a string", status_code=400)
+    claims = get_jwt()
+    authz.revocation.revoke(claims["jti"], claims["exp"])
+    if raw:
+        tokens.revoke(raw)
+    return api_response(True, "Logged out successfully")
@@ -0,0 +1,120 @@
+﻿# Authorization - shared role decorator and token revocation checks
+# Revoked token ids (jti) live in an in-memory set that a background thread
+# refreshes incrementally from the blacklist collection, so checking a token
+# on each request never touches MongoDB
+from datetime import datetime, timezone
+from functools import wraps
+from flask import g, jsonify, make_response
+from flask_jwt_extended import verify_jwt_in_request, get_jwt
+import logging
+import os
+import threading
+import time
+import app.extensions as ext
+
+log = logging.getLogger(__name__)
+
+
+# route decorator: valid token, not revoked, and (optionally) one of roles
+# role/user id are stashed on g so handlers don't re-read the claims
+def role_required(*roles):
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            verify_jwt_in_request()
+            claims = get_jwt()
+            g.user_id = claims.get("user_id")
+            g.role = claims.get("role", "user")
+            if roles and g.role not in roles:
+                return make_response(jsonify({"Error": f"{roles[0].capitalize()} role required"}), 403)
+            return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def current_user_id():
+    return g.get("user_id")
+
+
+def current_role():
+    return g.get("role")
+
+
+class RevocationChecker:
+    def __init__(self, refresh_interval=5):
+        self.refresh_interval = refresh_interval
+        self._revoked = {}  # jti -> expiry timestamp
+        self._last_id = None
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+
+    def is_revoked(self, jti):
+        self._ensure_refresher()
+        return jti in self._revoked
+
+    # revoke a token - written to the blacklist and applied locally right away
+    def revoke(self, jti, exp):
+        expires_at = datetime.fromtimestamp(exp, tz=timezone.utc)
+        if ext.db is not None:
+            ext.db["blacklist"].update_one(
+                {"jti": jti},
+                {"$setOnInsert": {"jti": jti, "expires_at": expires_at, "createdAt": datetime.utcnow()}},
+                upsert=True
+            )
+        with self._lock:
+            self._revoked[jti] = exp
+
+    # pull blacklist entries newer than the last one seen, drop expired ones
+    def refresh(self):
+        if ext.db is None:
+            return
+        query = {"_id": {"$gt": self._last_id}} if self._last_id else {}
+        docs = list(ext.db["blacklist"].find(query, {"jti": 1, "expires_at": 1}).sort("_id", 1))
+        now = time.time()
+        with self._lock:
+            for doc in docs:
+                exp = doc.get("expires_at")
+                if exp is not None and exp.tzinfo is None:
+                    exp = exp.replace(tzinfo=timezone.utc)
+                self._revoked[doc["jti"]] = exp.timestamp() if exp else float("inf")
+                self._last_id = doc["_id"]
+            for jti in [j for j, exp in self._revoked.items() if exp < now]:
+                del self._revoked[jti]
+
+    def _loop(self):
+        while True:
+            try:
+                self.refresh()
+            except Exception as e:
+                log.warning("Revocation refresh failed: %s", e)
+            time.sleep(self.refresh_interval)
+
+    # started lazily (and again after a fork) so it runs in the serving process
+    def _ensure_refresher(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._loop, name="jwt-revocation", daemon=True)
+            self._thread.start()
+
+    def stats(self):
+        return {"revoked": len(self._revoked), "refresh_interval": self.refresh_interval}
+
+
+revocation = RevocationChecker()
+
+
+def init_authz(app, jwt):
+    global revocation
+    app.config.setdefault("JWT_REVOCATION_REFRESH", float(os.environ.get("JWT_REVOCATION_REFRESH", 5)))
+    revocation = RevocationChecker(refresh_interval=app.config["JWT_REVOCATION_REFRESH"])
+
+    @jwt.token_in_blocklist_loader
+    def _token_revoked(jwt_header, jwt_payload):
+        return revocation.is_revoked(jwt_payload.get("jti"))
+
+    return revocation
@@ -0,0 +1,187 @@
+﻿# Blob store - content-addressed image storage on the local filesystem
+# Files are keyed by SHA-256 of their bytes, so the same image is only
+# stored once and a key's content never changes (safe to cache forever)
+import base64
+import binascii
+import hashlib
+import json
+import os
+import re
+import tempfile
+
+MAX_IMAGE_BYTES = 10 * 1024 * 1024
+
+# magic bytes -> (extension, content type)
+_SIGNATURES = [
+    (b"\xff\xd8\xff", ("jpg", "image/jpeg")),
+    (b"\x89PNG\r\n\x1a\n", ("png", "image/png")),
+    (b"GIF87a", ("gif", "image/gif")),
+    (b"GIF89a", ("gif", "image/gif")),
+]
+CONTENT_TYPES = {"jpg": "image/jpeg", "png": "image/png", "gif": "image/gif", "webp": "image/webp"}
+
+KEY_RE = re.compile(r"^[0-9a-f]{64}\.(jpg|png|gif|webp)$")
+DATA_URL_RE = re.compile(r"^data:image/[\w.+-]+;base64,", re.IGNORECASE)
+
+
+class BlobError(ValueError):
+    pass
+
+
+# work out the image type from its bytes, not from what the client claims
+def sniff_image(data):
+    for magic, kind in _SIGNATURES:
+        if data.startswith(magic):
+            return kind
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return ("webp", "image/webp")
+    return None
+
+
+# decode a data: URL (what the frontend's image compression produces)
+def decode_data_url(value):
+    match = DATA_URL_RE.match(value)
+    if not match:
+        raise BlobError("Not a base64 image data URL")
+    try:
+        return base64.b64decode(value[match.end():], validate=False)
+    except (binascii.Error, ValueError):
+        raise BlobError("Invalid base64 image data")
+
+
+class BlobStore:
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    # root/ab/abcdef....jpg - two-char fan-out keeps directories small
+    def path(self, key):
+        if not KEY_RE.match(key):
+            raise BlobError("Invalid image key")
+        return os.path.join(self.root, key[:2], key)
+
+    def exists(self, key):
+        return os.path.exists(self.path(key))
+
+    # store bytes, returns the image reference saved on documents
+    def put(self, data):
+        if not data:
+            raise BlobError("Empty image")
+        if len(data) > MAX_IMAGE_BYTES:
+            raise BlobError("Image too large")
+        kind = sniff_image(data)
+        if kind is None:
+            raise BlobError("Unsupported image type")
+        ext, content_type = kind
+
+        key = f"{hashlib.sha256(data).hexdigest()}.{ext}"
+        path = self.path(key)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # write to a temp file then rename so readers never see half a file
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    f.write(data)
+                os.replace(tmp, path)
+            except Exception:
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+                raise
+        return {"key": key, "content_type": content_type, "size": len(data)}
+
+    def read(self, key):
+        with open(self.path(key), "rb") as f:
+            return f.read()
+
+    def delete(self, key):
+        try:
+            os.remove(self.path(key))
+        except FileNotFoundError:
+            pass
+
+    # sidecar json next to a blob, used to remember its derivatives
+    def get_meta(self, key):
+        try:
+            with open(self.path(key) + ".json", "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def put_meta(self, key, meta):
+        path = self.path(key) + ".json"
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(tmp, path)
+
+
+IMAGE_URL_PREFIX = "/api/v1/images/"
+
+
+# IMAGE_BASE_URL (e.g. https://api.example.com) when the frontend runs on
+# another origin; relative paths otherwise. Never taken from the request -
+# these URLs end up in cached response bodies shared by every client
+base_url = ""
+
+
+def _key_url(key):
+    return base_url + IMAGE_URL_PREFIX + key
+
+
+# public URL for an image reference (legacy plain strings pass through)
+def image_url(ref):
+    if isinstance(ref, dict) and "key" in ref:
+        return _key_url(ref["key"])
+    return ref
+
+
+# URL of a derivative (e.g. "thumb", "webp"), falling back to the original
+def variant_url(ref, name):
+    if isinstance(ref, dict) and name in ref.get("variants", {}):
+        return _key_url(ref["variants"][name])
+    return image_url(ref)
+
+
+# rebuild a reference from its key alone - nothing else the client sent is
+# kept, and the blob has to be in the store
+def _key_ref(store, key):
+    if not isinstance(key, str) or not KEY_RE.match(key) or not store.exists(key):
+        raise BlobError("Unknown image key")
+    ref = {"key": key, "content_type": CONTENT_TYPES[key.rsplit(".", 1)[-1]],
+           "size": os.path.getsize(store.path(key))}
+    # pick up derivatives already generated for this blob
+    variants = store.get_meta(key)
+    if variants:
+        ref["variants"] = variants
+    return ref
+
+
+# turn what a client sent for an image into what we store: a data URL is
+# moved into the store, one of our image URLs or {"key": ...} maps back to
+# its reference, anything else is rejected
+def to_image_ref(store, value):
+    if isinstance(value, str) and DATA_URL_RE.match(value):
+        return _key_ref(store, store.put(decode_data_url(value))["key"])
+    if isinstance(value, str) and IMAGE_URL_PREFIX in value:
+        return _key_ref(store, value.rsplit("/", 1)[-1])
+    if isinstance(value, dict) and "key" in value:
+        return _key_ref(store, value["key"])
+    raise BlobError("images must be data URLs, image URLs or {\"key\": ...} references")
+
+
+blob_store = None
+
+
+# default location, same as the Flask instance folder
+DEFAULT_ROOT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "instance", "images")
+
+
+def init_blob_store(app):
+    global blob_store, base_url
+    root = os.environ.get("IMAGE_STORE_DIR", DEFAULT_ROOT)
+    app.config.setdefault("IMAGE_STORE_DIR", root)
+    app.config.setdefault("IMAGE_BASE_URL", os.environ.get("IMAGE_BASE_URL", ""))
+    base_url = app.config["IMAGE_BASE_URL"].rstrip("/")
+    blob_store = BlobStore(app.config["IMAGE_STORE_DIR"])
+    return blob_store
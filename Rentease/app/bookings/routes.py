@@ -0,0 +1,284 @@
+﻿# Booking routes - bookings and availability for properties
+# Overlaps are found with an indexed interval query on bookings
+# (property_id + check_out_date/check_in_date). Double-booking is prevented
+# by a conditional upsert on the property's calendar document, which only
+# succeeds if none of its upcoming holds overlap - one atomic write, no
+# transaction needed.
+from flask import Blueprint, request
+from bson import ObjectId
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from datetime import datetime
+import app.extensions as ext
+import app.blobstore as blobs
+from app.serialize import get_data, api_response, format_booking
+from app.authz import role_required, current_user_id, current_role
+
+bookings_app = Blueprint("bookings", __name__)
+
+ACTIVE_STATUSES = ["pending", "confirmed"]
+MAX_NIGHTS = 365
+MAX_GUESTS = 20
+MAX_SUGGESTIONS = 3
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+
+# "2026-01-31" or an ISO timestamp -> midnight of that day
+def _parse_date(value):
+    if not isinstance(value, str) or not value:
+        raise ValueError
+    day = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    return datetime(day.year, day.month, day.day)
+
+
+def _parse_stay(data):
+    try:
+        start = _parse_date(data.get("check_in_date"))
+        end = _parse_date(data.get("check_out_date"))
+    except ValueError:
+        raise ValueError("check_in_date and check_out_date must be dates (YYYY-MM-DD)")
+    if end <= start:
+        raise ValueError("check_out_date must be after check_in_date")
+    if (end - start).days > MAX_NIGHTS:
+        raise ValueError(f"Stays are limited to {MAX_NIGHTS} nights")
+    return start, end
+
+
+def _today():
+    now = datetime.utcnow()
+    return datetime(now.year, now.month, now.day)
+
+
+# active bookings overlapping [start, end) - the index bounds check_out_date,
+# so past bookings of a busy property are never scanned
+def _overlapping(pid, start, end, limit=0):
+    return list(ext.db["bookings"].find({
+        "property_id": pid,
+        "check_out_date": {"$gt": start},
+        "check_in_date": {"$lt": end},
+        "status": {"$in": ACTIVE_STATUSES}
+    }, {"check_in_date": 1, "check_out_date": 1}).sort("check_out_date", 1).limit(limit))
+
+
+# next free windows of the same length, walking active bookings in order
+# (they never overlap, so check_out order is also check_in order)
+def _suggest(pid, start, end):
+    nights = end - start
+    candidate = start
+    out = []
+    for b in ext.db["bookings"].find({
+        "property_id": pid,
+        "check_out_date": {"$gt": start},
+        "status": {"$in": ACTIVE_STATUSES}
+    }, {"check_in_date": 1, "check_out_date": 1}).sort("check_out_date", 1).limit(200):
+        if b["check_in_date"] >= candidate + nights:
+            out.append({"check_in": candidate, "check_out": candidate + nights})
+            if len(out) == MAX_SUGGESTIONS:
+                return out
+        candidate = max(candidate, b["check_out_date"])
+    if len(out) < MAX_SUGGESTIONS:
+        out.append({"check_in": candidate, "check_out": candidate + nights})
+    return out
+
+
+# claim [start, end) on the property's calendar; False if anything overlaps.
+# Only upcoming holds are kept there, so the array stays short however long
+# the booking history gets.
+def _hold(pid, booking_id, start, end):
+    calendar = ext.db["booking_calendar"]
+    calendar.update_one({"_id": pid}, {"$pull": {"holds": {"end": {"$lte": _today()}}}})
+    try:
+        calendar.update_one(
+            {"_id": pid, "holds": {"$not": {"$elemMatch": {"start": {"$lt": end}, "end": {"$gt": start}}}}},
+            {"$push": {"holds": {"booking_id": booking_id, "start": start, "end": end}}},
+            upsert=True)
+    except DuplicateKeyError:
+        # the calendar exists but the filter didn't match - an overlapping hold
+        return False
+    return True
+
+
+def _release(pid, booking_id):
+    ext.db["booking_calendar"].update_one({"_id": pid}, {"$pull": {"holds": {"booking_id": booking_id}}})
+
+
+def _validate_guests(data):
+    guests = data.get("guests", [])
+    if not isinstance(guests, list) or not all(isinstance(g, dict) for g in guests):
+        raise ValueError("guests must be a list")
+    try:
+        count = int(data.get("number_of_guests", len(guests) or 1))
+    except (ValueError, TypeError):
+        raise ValueError("number_of_guests must be a whole number")
+    if not 1 <= count <= MAX_GUESTS:
+        raise ValueError(f"number_of_guests must be between 1 and {MAX_GUESTS}")
+    return [{k: g.get(k) for k in ("name", "email", "phone", "age") if k in g} for g in guests], count
+
+
+def _load_booking(bid):
+    try:
+        oid = ObjectId(bid)
+    except Exception:
+        return None, api_response(False, "Invalid booking ID", status_code=400)
+    doc = ext.db["bookings"].find_one({"_id": oid})
+    if doc is None or (doc["user_id"] != current_user_id() and current_role() != "admin"):
+        return None, api_response(False, "Booking not found", status_code=404)
+    return doc, None
+
+
+# POST /check-availability - is the property free for these dates?
+@bookings_app.route("/check-availability", methods=["POST"])
+def check_availability():
+    if ext.db is None:
+        return api_response(False, "Database not connected", status_code=500)
+
+    data = get_data()
+    pid = data.get("property_id")
+    if not pid:
+        return api_response(False, "property_id required", status_code=400)
+    try:
+        start, end = _parse_stay(data)
+    except ValueError as e:
+        return api_response(False, str(e), status_code=400)
+
+    conflicts = _overlapping(pid, start, end)
+    result = {
+        "available": not conflicts,
+        "is_available": not conflicts,
+        "conflicting_bookings": [str(b["_id"]) for b in conflicts]
+    }
+    if conflicts:
+        result["suggested_dates"] = _suggest(pid, start, end)
+    return api_response(True, "Availability checked", result)
+
+
+# POST / - book a property
+@bookings_app.route("/", methods=["POST"])
+@role_required()
+def create_booking():
+    if ext.db is None:
+        return api_response(False, "Database not connected", status_code=500)
+
+    data = get_data()
+    pid = data.get("property_id")
+    if not pid:
+        return api_response(False, "property_id required", status_code=400)
+    try:
+        start, end = _parse_stay(data)
+        guests, count = _validate_guests(data)
+        prop_oid = ObjectId(pid)
+    except ValueError as e:
+        return api_response(False, str(e), status_code=400)
+    except Exception:
+        return api_response(False, "Invalid property ID", status_code=400)
+    if start < _today():
+        return api_response(False, "check_in_date is in the past", status_code=400)
+
+    prop = ext.db["biz"].find_one({"_id": prop_oid, "type": "property"},
+                                  {"title": 1, "price": 1, "available": 1, "images": {"$slice": 1}})
+    if prop is None:
+        return api_response(False, "Property not found", status_code=404)
+    if prop.get("available", True) is False:
+        return api_response(False, "Property is not available", status_code=409)
+
+    # cheap indexed pre-check; the calendar hold below is what actually decides
+    if _overlapping(pid, start, end, limit=1):
+        return api_response(False, "Property is already booked for these dates", status_code=409)
+    booking_id = ObjectId()
+    if not _hold(pid, booking_id, start, end):
+        return api_response(False, "Property is already booked for these dates", status_code=409)
+
+    nights = (end - start).days
+    images = prop.get("images") or []
+    now = datetime.utcnow()
+    doc = {
+        "_id": booking_id,
+        "property_id": pid,
+        "property_title": prop.get("title", ""),
+        "property_image": blobs.variant_url(images[0], "thumb") if images else None,
+        "user_id": current_user_id(),
+        "check_in_date": start,
+        "check_out_date": end,
+        "guests": guests,
+        "number_of_guests": count,
+        "nights": nights,
+        "total_price": nights * prop.get("price", 0),
+        "status": "confirmed",
+        "payment_status": "pending",
+        "special_requests": data.get("special_requests", ""),
+        "createdAt": now,
+        "updatedAt": now
+    }
+    try:
+        ext.db["bookings"].insert_one(doc)
+    except Exception:
+        _release(pid, booking_id)
+        raise
+    return api_response(True, "Booking created", format_booking(doc), status_code=201)
+
+
+# GET /my-bookings - my bookings, newest first (limit, cursor)
+@bookings_app.route("/my-bookings", methods=["GET"])
+@role_required()
+def my_bookings():
+    if ext.db is None:
+        return api_response(False, "Database not connected", status_code=500)
+
+    query = {"user_id": current_user_id()}
+    limit = request.args.get("limit", DEFAULT_PAGE_SIZE, type=int)
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    cursor = request.args.get("cursor")
+    if cursor:
+        try:
+            query["_id"] = {"$lt": ObjectId(cursor)}
+        except Exception:
+            return api_response(False, "Invalid cursor", status_code=400)
+    status = request.args.get("status")
+    if status:
+        query["status"] = status
+
+    docs = list(ext.db["bookings"].find(query).sort("_id", -1).limit(limit + 1))
+    has_next = len(docs) > limit
+    docs = docs[:limit]
+    meta = {"limit": limit, "has_next": has_next, "next_cursor": str(docs[-1]["_id"]) if has_next else None}
+    return api_response(True, "Bookings retrieved", [format_booking(d) for d in docs], meta=meta)
+
+
+# GET /<id> - one booking (owner or admin)
+@bookings_app.route("/<string:bid>", methods=["GET"])
+@role_required()
+def get_booking(bid):
+    if ext.db is None:
+        return api_response(False, "Database not connected", status_code=500)
+
+    doc, error = _load_booking(bid)
+    if error:
+        return error
+    return api_response(True, "Booking retrieved", format_booking(doc))
+
+
+# PATCH /<id>/cancel - cancel an upcoming booking and free its dates
+@bookings_app.route("/<string:bid>/cancel", methods=["PATCH"])
+@role_required()
+def cancel_booking(bid):
+    if ext.db is None:
+        return api_response(False, "Database not connected", status_code=500)
+
+    doc, error = _load_booking(bid)
+    if error:
+        return error
+    if doc["status"] not in ACTIVE_STATUSES:
+        return api_response(False, f"Booking is already {doc['status']}", status_code=409)
+    if doc["check_in_date"] <= _today() and current_role() != "admin":
+        return api_response(False, "Booking has already started", status_code=409)
+
+    # conditional on the status so two cancels can't both release the hold
+    updated = ext.db["bookings"].find_one_and_update(
+        {"_id": doc["_id"], "status": {"$in": ACTIVE_STATUSES}},
+        {"$set": {"status": "cancelled", "updatedAt": datetime.utcnow()}},
+        return_document=ReturnDocument.AFTER)
+    if updated is None:
+        return api_response(False, "Booking is already cancelled", status_code=409)
+    _release(doc["property_id"], doc["_id"])
+    return api_response(True, "Booking cancelled", format_booking(updated))
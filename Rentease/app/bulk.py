@@ -0,0 +1,147 @@
+﻿# Bulk helpers - parse uploaded rows (JSON array, CSV or NDJSON) and
+# validate property rows before anything is written
+from datetime import datetime
+import csv
+import io
+import json
+import app.geo as geo
+
+MAX_ROWS = 5000
+CHUNK_SIZE = 500
+
+INT_FIELDS = ["price", "bedrooms", "bathrooms", "area"]
+TRUE_VALUES = {"true", "1", "yes", "y"}
+FALSE_VALUES = {"false", "0", "no", "n"}
+
+
+class BulkError(ValueError):
+    pass
+
+
+# rows from a JSON array / {"properties": [...]}, a csv or ndjson body,
+# or an uploaded "file" (type from its extension)
+def parse_rows(request):
+    upload = request.files.get("file")
+    if upload is not None:
+        text = upload.read().decode("utf-8-sig")
+        kind = "csv" if upload.filename.lower().endswith(".csv") else "ndjson"
+    elif request.is_json:
+        data = request.get_json(silent=True)
+        if isinstance(data, dict):
+            data = data.get("properties")
+        if not isinstance(data, list):
+            raise BulkError("Expected a JSON array of properties")
+        return _limit(data)
+    else:
+        text = request.get_data(as_text=True)
+        kind = "csv" if request.mimetype == "text/csv" else "ndjson"
+
+    if kind == "csv":
+        return _limit(list(csv.DictReader(io.StringIO(text))))
+    rows = []
+    for n, line in enumerate(text.splitlines(), start=1):
+        if line.strip():
+            try:
+                rows.append(json.loads(line))
+            except ValueError:
+                raise BulkError(f"Line {n} is not valid JSON")
+    return _limit(rows)
+
+
+def _limit(rows):
+    if len(rows) > MAX_ROWS:
+        raise BulkError(f"At most {MAX_ROWS} rows per request")
+    return rows
+
+
+def to_int(value):
+    if isinstance(value, bool):
+        raise ValueError
+    if isinstance(value, str):
+        value = value.strip()
+    return int(value)
+
+
+def to_bool(value):
+    if isinstance(value, bool):
+        return value
+    text = str(value).strip().lower()
+    if text in TRUE_VALUES:
+        return True
+    if text in FALSE_VALUES:
+        return False
+    raise ValueError
+
+
+# one row -> (document, errors); document is None when there are errors
+def validate_property(row, agent_id):
+    if not isinstance(row, dict):
+        return None, ["Row must be an object"]
+    errors = []
+    for field in ("title", "price", "location"):
+        if row.get(field) in (None, ""):
+            errors.append(f"{field} is required")
+
+    doc = {
+        "type": "property",
+        "title": row.get("title"),
+        "description": row.get("description", ""),
+        "location": row.get("location"),
+        "property_type": row.get("type") or row.get("property_type") or "apartment",
+        "agent_id": agent_id,
+        "available": True,
+        "bedrooms": 1,
+        "bathrooms": 1,
+        "area": 0,
+        "amenities": [],
+        "favorite_count": 0
+    }
+    for field in INT_FIELDS:
+        if row.get(field) not in (None, ""):
+            try:
+                doc[field] = to_int(row[field])
+            except (ValueError, TypeError):
+                errors.append(f"{field} must be a whole number")
+    if doc.get("price") is not None and doc["price"] < 0:
+        errors.append("price must not be negative")
+    if row.get("available") not in (None, ""):
+        try:
+            doc["available"] = to_bool(row["available"])
+        except ValueError:
+            errors.append("available must be true or false")
+    amenities = row.get("amenities")
+    if isinstance(amenities, str):
+        doc["amenities"] = [a.strip() for a in amenities.split(";") if a.strip()]
+    elif isinstance(amenities, list):
+        doc["amenities"] = amenities
+
+    if errors:
+        return None, errors
+    now = datetime.utcnow()
+    doc.update({"geo": geo.geocode(doc["location"]), "images": [], "createdAt": now, "updatedAt": now})
+    return doc, []
+
+
+# {"id", "price"?, "available"?} -> (ObjectId-able id, $set dict, errors)
+def validate_update(row):
+    if not isinstance(row, dict) or not row.get("id"):
+        return None, None, ["id is required"]
+    update, errors = {}, []
+    if "price" in row:
+        try:
+            update["price"] = to_int(row["price"])
+        except (ValueError, TypeError):
+            errors.append("price must be a whole number")
+    if "available" in row:
+        try:
+            update["available"] = to_bool(row["available"])
+        except ValueError:
+            errors.append("available must be true or false")
+    if not update and not errors:
+        errors.append("Nothing to update (price or available)")
+    return row["id"], update, errors
+
+
+def chunks(items, size=CHUNK_SIZE):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
@@ -0,0 +1,280 @@
+﻿# Response cache - read-through cache for property list/detail responses
+# Default backend is an in-process LRU with TTL; anything implementing
+# CacheBackend (e.g. a Redis-compatible client wrapper) can be swapped in.
+# With the in-process backend every worker has its own entries, so property
+# writes are also logged to Mongo (SharedInvalidations) and every worker
+# polls the log: a write in one worker retires the others' entries within a
+# second or so.
+from bson import ObjectId
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from pymongo import errors
+import logging
+import os
+import threading
+import time
+import app.extensions as ext
+
+log = logging.getLogger(__name__)
+
+
+# backend interface - values must be picklable, ttl is in seconds
+class CacheBackend:
+    def get(self, key):
+        raise NotImplementedError
+
+    def set(self, key, value, ttl=None):
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+    def incr(self, key):
+        raise NotImplementedError
+
+    # read a counter written by incr()
+    def get_counter(self, key):
+        return self.get(key) or 0
+
+    def clear(self):
+        raise NotImplementedError
+
+    def stats(self):
+        return {}
+
+
+# in-process LRU with per-entry expiry and a max entry count
+class LRUCacheBackend(CacheBackend):
+    def __init__(self, max_entries=1024, default_ttl=60):
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self._data = OrderedDict()  # key -> (expires_at, value)
+        self._counters = {}  # kept apart so they are never evicted
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            expires_at, value = item
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl=None):
+        ttl = self.default_ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    # counters never expire and don't count as hits/misses
+    def incr(self, key):
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + 1
+            return self._counters[key]
+
+    def get_counter(self, key):
+        with self._lock:
+            return self._counters.get(key, 0)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._data),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations
+            }
+
+
+# normalize query args so ?a=1&b=2 and ?b=2&a=1 share an entry
+def normalize_args(args):
+    items = sorted((k, ",".join(sorted(args.getlist(k)))) for k in args.keys())
+    return "&".join(f"{k}={v}" for k, v in items)
+
+
+# cross-worker invalidation log - every property write inserts one
+# {"ids": [...]} entry, every worker polls for entries it hasn't applied yet
+# ObjectIds from different processes aren't strictly ordered, so each poll
+# looks back LOOKBACK seconds before the previous one and skips entries it saw
+class SharedInvalidations:
+    COLLECTION = "cache_invalidations"
+    LOOKBACK = 10
+    MAX_BACKOFF = 30
+
+    def __init__(self, apply, refresh_interval=1):
+        self.apply = apply  # callback(ids) - drops the local entries
+        self.refresh_interval = refresh_interval
+        self._seen = set()
+        self._last_poll = None
+        self._failing = False
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+
+    # record a write; this worker has already applied it locally
+    def publish(self, ids):
+        if ext.db is None:
+            return
+        try:
+            res = ext.db[self.COLLECTION].insert_one({"ids": ids, "createdAt": datetime.utcnow()})
+        except errors.PyMongoError as e:
+            # other workers catch up when their entries expire
+            log.warning("Cache invalidation not shared: %s", e)
+            return
+        with self._lock:
+            self._seen.add(res.inserted_id)
+
+    def refresh(self):
+        if ext.db is None:
+            return
+        now = datetime.now(timezone.utc)
+        since = (self._last_poll or now) - timedelta(seconds=self.LOOKBACK)
+        docs = list(ext.db[self.COLLECTION].find({"_id": {"$gte": ObjectId.from_datetime(since)}}, {"ids": 1}))
+        with self._lock:
+            new = [d for d in docs if d["_id"] not in self._seen]
+            self._seen.update(d["_id"] for d in new)
+            self._seen = {oid for oid in self._seen if oid.generation_time >= since}
+        self._last_poll = now
+        for doc in new:
+            self.apply(doc.get("ids", []))
+
+    # polls every refresh_interval; while Mongo is unreachable it backs off
+    # and logs once, not once per poll
+    def _loop(self):
+        delay = self.refresh_interval
+        while True:
+            try:
+                self.refresh()
+                if self._failing:
+                    log.warning("Cache invalidation log reachable again")
+                self._failing = False
+                delay = self.refresh_interval
+            except Exception as e:
+                if not self._failing:
+                    log.warning("Cache invalidation refresh failed, backing off: %s", e)
+                self._failing = True
+                delay = min(delay * 2, self.MAX_BACKOFF)
+            time.sleep(delay)
+
+    # started lazily (and again after a fork) so it runs in the serving process
+    def start(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._loop, name="cache-invalidations", daemon=True)
+            self._thread.start()
+
+
+# property response cache on top of a backend
+# detail entries are dropped per id; list entries are keyed on a generation
+# number that every property write bumps, so stale pages are never served.
+# With shared invalidations, other workers' writes are applied the same way
+class PropertyCache:
+    GEN_KEY = "properties:gen"
+
+    def __init__(self, backend, ttl=60, enabled=True, shared=None):
+        self.backend = backend
+        self.ttl = ttl
+        self.enabled = enabled
+        self.shared = shared
+
+    def _generation(self):
+        return self.backend.get_counter(self.GEN_KEY)
+
+    # kind keeps different list-shaped endpoints apart (list, search, ...)
+    def list_key(self, args, kind="list"):
+        return f"properties:{kind}:{self._generation()}:{normalize_args(args)}"
+
+    def detail_key(self, prop_id):
+        return f"properties:detail:{prop_id}"
+
+    def get(self, key):
+        if not self.enabled:
+            return None
+        if self.shared is not None:
+            self.shared.start()
+        return self.backend.get(key)
+
+    # value is a (body, etag) pair
+    def set(self, key, value):
+        if self.enabled:
+            self.backend.set(key, value, self.ttl)
+
+    # drop the detail entries and retire every list page, in this worker only
+    def apply(self, prop_ids):
+        self.drop_details(prop_ids)
+        self.backend.incr(self.GEN_KEY)
+
+    def drop_details(self, prop_ids):
+        for prop_id in prop_ids:
+            self.backend.delete(self.detail_key(str(prop_id)))
+
+    # call after any write touching a property
+    def invalidate_property(self, prop_id=None):
+        self.invalidate_many([] if prop_id is None else [prop_id])
+
+    # bulk writes - drop each detail entry, bump the generation once
+    def invalidate_many(self, prop_ids):
+        ids = [str(p) for p in prop_ids]
+        self.apply(ids)
+        if self.shared is not None:
+            self.shared.publish(ids)
+
+    def stats(self):
+        stats = self.backend.stats()
+        stats["enabled"] = self.enabled
+        stats["ttl"] = self.ttl
+        stats["shared_invalidations"] = self.shared is not None
+        return stats
+
+
+property_cache = PropertyCache(LRUCacheBackend())
+
+
+# configure from env / app config, optionally with a custom backend
+# a custom backend is assumed to be shared already, so it gets no Mongo log
+def init_cache(app, backend=None):
+    global property_cache
+    app.config.setdefault("PROPERTY_CACHE_ENABLED", os.environ.get("PROPERTY_CACHE_ENABLED", "1") != "0")
+    app.config.setdefault("PROPERTY_CACHE_TTL", int(os.environ.get("PROPERTY_CACHE_TTL", 60)))
+    app.config.setdefault("PROPERTY_CACHE_SIZE", int(os.environ.get("PROPERTY_CACHE_SIZE", 1024)))
+    app.config.setdefault("PROPERTY_CACHE_REFRESH", float(os.environ.get("PROPERTY_CACHE_REFRESH", 1)))
+
+    ttl = app.config["PROPERTY_CACHE_TTL"]
+    per_worker = backend is None
+    if per_worker:
+        backend = LRUCacheBackend(max_entries=app.config["PROPERTY_CACHE_SIZE"], default_ttl=ttl)
+    property_cache = PropertyCache(backend, ttl=ttl, enabled=app.config["PROPERTY_CACHE_ENABLED"])
+    if per_worker and property_cache.enabled and app.config["PROPERTY_CACHE_REFRESH"] > 0:
+        property_cache.shared = SharedInvalidations(property_cache.apply,
+                                                    refresh_interval=app.config["PROPERTY_CACHE_REFRESH"])
+    return property_cache
@@ -0,0 +1,149 @@
+﻿# Compression - gzip / brotli / zstd for JSON and text responses, picked from Accept-Encoding
+# brotli and zstandard are optional; without them only gzip is offered.
+# Small bodies go out as they are; streamed responses (exports) are
+# compressed chunk by chunk. Compressible responses always get
+# "Vary: Accept-Encoding" so shared caches keep one copy per encoding.
+from flask import request
+from werkzeug.http import parse_accept_header
+import hashlib
+import os
+import zlib
+from .cache import LRUCacheBackend
+
+try:
+    import brotli
+except ImportError:  # optional - no "br" without it
+    brotli = None
+try:
+    import zstandard
+except ImportError:  # optional - no "zstd" without it
+    zstandard = None
+
+DEFAULT_MIN_SIZE = 1024
+# streamed bodies are flushed at least this often so rows keep flowing
+STREAM_FLUSH_BYTES = 64 * 1024
+
+# compressible types -> level per encoding. API pages are compressed on
+# every request, so they stay at cheap-but-good levels; exports are big and
+# streamed, where a low level keeps up with the cursor (brotli below 3
+# barely compresses when fed chunk by chunk)
+LEVELS = {
+    "application/json": {"zstd": 3, "br": 4, "gzip": 6},
+    "application/x-ndjson": {"zstd": 1, "br": 3, "gzip": 1},
+    "text/csv": {"zstd": 1, "br": 3, "gzip": 1},
+    "text/plain": {"zstd": 3, "br": 4, "gzip": 6},
+}
+
+# server preference when the client rates encodings equally
+ENCODINGS = [e for e, lib in (("zstd", zstandard), ("br", brotli), ("gzip", zlib)) if lib is not None]
+
+enabled = True
+min_size = DEFAULT_MIN_SIZE
+# compressed copies of ETagged bodies (list/detail pages are served over and over)
+memo = LRUCacheBackend(max_entries=256, default_ttl=300)
+
+
+# best encoding the client accepts (q > 0), or None for identity
+def negotiate(header):
+    if not header or not enabled:
+        return None
+    accept = parse_accept_header(header)
+    best = max(ENCODINGS, key=lambda e: (accept.quality(e), -ENCODINGS.index(e)))
+    return best if accept.quality(best) > 0 else None
+
+
+# (compress, flush, finish) for an incremental compressor
+def compressor(encoding, level):
+    if encoding == "zstd":
+        c = zstandard.ZstdCompressor(level=level).compressobj()
+        return c.compress, lambda: c.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK), c.flush
+    if encoding == "br":
+        c = brotli.Compressor(quality=level)
+        return c.process, c.flush, c.finish
+    c = zlib.compressobj(level, zlib.DEFLATED, 31)  # wbits 31 = gzip container
+    return c.compress, lambda: c.flush(zlib.Z_SYNC_FLUSH), c.flush
+
+
+def compress(data, encoding, level):
+    if encoding == "zstd":
+        return zstandard.ZstdCompressor(level=level).compress(data)
+    if encoding == "br":
+        return brotli.compress(data, quality=level)
+    c = zlib.compressobj(level, zlib.DEFLATED, 31)
+    return c.compress(data) + c.flush()
+
+
+# compress with a memo keyed by content, for bodies that repeat
+def compress_cached(data, encoding, level):
+    key = (encoding, level, hashlib.sha1(data).digest())
+    out = memo.get(key)
+    if out is None:
+        out = compress(data, encoding, level)
+        memo.set(key, out)
+    return out
+
+
+def compress_stream(chunks, encoding, level):
+    feed, flush, finish = compressor(encoding, level)
+    pending = 0
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode("utf-8")
+            out = feed(chunk)
+            pending += len(chunk)
+            if pending >= STREAM_FLUSH_BYTES:
+                out += flush()
+                pending = 0
+            if out:
+                yield out
+        yield finish()
+    finally:
+        close = getattr(chunks, "close", None)
+        if close is not None:
+            close()
+
+
+def _after_request(response):
+    levels = LEVELS.get(response.mimetype)
+    if levels is None:
+        return response
+    response.vary.add("Accept-Encoding")
+    if (request.method == "HEAD" or response.status_code != 200 or response.direct_passthrough
+            or "Content-Encoding" in response.headers
+            or "no-transform" in response.headers.get("Cache-Control", "")):
+        return response
+    encoding = negotiate(request.headers.get("Accept-Encoding"))
+    if encoding is None:
+        return response
+
+    if response.is_streamed:
+        response.response = compress_stream(response.response, encoding, levels[encoding])
+        response.headers.pop("Content-Length", None)
+    else:
+        data = response.get_data()
+        if len(data) < min_size:
+            return response
+        etag, _ = response.get_etag()
+        out = compress_cached(data, encoding, levels[encoding]) if etag else compress(data, encoding, levels[encoding])
+        response.set_data(out)
+    response.headers["Content-Encoding"] = encoding
+    # a strong ETag names exact bytes; the compressed copy only matches weakly
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+
+# call in create_app after the blueprints; runs before the metrics hook,
+# so response sizes are counted compressed
+def init_compression(app):
+    global enabled, min_size
+    app.config.setdefault("COMPRESS_ENABLED", os.environ.get("COMPRESS_ENABLED", "1") != "0")
+    app.config.setdefault("COMPRESS_MIN_SIZE", int(os.environ.get("COMPRESS_MIN_SIZE", DEFAULT_MIN_SIZE)))
+    enabled = app.config["COMPRESS_ENABLED"]
+    min_size = app.config["COMPRESS_MIN_SIZE"]
+    if not enabled:
+        return
+    app.after_request(_after_request)
+    app.logger.info("Compression: %s (>= %d bytes)", ", ".join(ENCODINGS), min_size)
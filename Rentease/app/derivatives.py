@@ -0,0 +1,112 @@
+﻿# Image derivatives - thumbnails and WebP variants, built in a background
+# worker pool after upload so requests never wait on image encoding
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from io import BytesIO
+import logging
+import os
+import app.blobstore as blobs
+import app.cache as cache
+import app.extensions as ext
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow is optional - without it the originals are served everywhere
+    Image = None
+
+log = logging.getLogger(__name__)
+
+THUMB_SIZE = (400, 300)
+THUMB_QUALITY = 70
+WEBP_QUALITY = 80
+
+_executor = None
+
+
+def _encode_webp(img, quality):
+    out = BytesIO()
+    img.save(out, format="WEBP", quality=quality, method=4)
+    return out.getvalue()
+
+
+# build derivative bytes for one image: name -> bytes
+def build_variants(data):
+    img = Image.open(BytesIO(data))
+    img = ImageOps.exif_transpose(img)
+    if img.mode not in ("RGB", "RGBA"):
+        img = img.convert("RGBA" if "transparency" in img.info else "RGB")
+
+    variants = {"thumb": _encode_webp(ImageOps.fit(img, THUMB_SIZE), THUMB_QUALITY)}
+    if blobs.sniff_image(data)[1] != "image/webp":
+        variants["webp"] = _encode_webp(img, WEBP_QUALITY)
+    return variants
+
+
+# generate (or reuse) derivatives for a stored blob and record them
+def generate(key):
+    store = blobs.blob_store
+    variants = store.get_meta(key)
+    if variants is None:
+        built = build_variants(store.read(key))
+        variants = {name: store.put(data)["key"] for name, data in built.items()}
+        store.put_meta(key, variants)
+    attach(key, variants)
+    return variants
+
+
+# write the derivative keys onto every property that uses the image
+# the variants are in the property body, so updatedAt (the ETag) moves too
+def attach(key, variants):
+    if ext.db is None:
+        return
+    coll = ext.db["biz"]
+    query = {"type": "property", "images.key": key}
+    ids = [d["_id"] for d in coll.find(query, {"_id": 1})]
+    if not ids:
+        return
+    coll.update_many(
+        {"_id": {"$in": ids}},
+        {"$set": {"images.$[img].variants": variants, "updatedAt": datetime.utcnow()}},
+        array_filters=[{"img.key": key}]
+    )
+    cache.property_cache.invalidate_many(ids)
+
+
+def _run(key):
+    try:
+        generate(key)
+    except Exception as e:
+        # a bad image shouldn't take the worker down - the original still works
+        log.warning("Derivative generation failed for %s - %s", key, e)
+
+
+# queue derivative generation for references that don't have it yet
+# call after the referencing document is written so attach() can find it
+def enqueue(refs):
+    if _executor is None:
+        return []
+    futures = []
+    for ref in refs:
+        if isinstance(ref, dict) and "key" in ref and not ref.get("variants"):
+            futures.append(_executor.submit(_run, ref["key"]))
+    return futures
+
+
+# wait for queued jobs on exit so uploads don't lose their thumbnails
+def shutdown(wait=True):
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=wait)
+        _executor = None
+
+
+def init_derivatives(app):
+    global _executor
+    app.config.setdefault("IMAGE_WORKERS", int(os.environ.get("IMAGE_WORKERS", 2)))
+    if Image is None:
+        app.logger.info("Pillow not installed - image derivatives disabled")
+        return None
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=app.config["IMAGE_WORKERS"],
+                                       thread_name_prefix="image-derivatives")
+    return _executor
@@ -0,0 +1,59 @@
+﻿# Export - stream a Mongo cursor as NDJSON or CSV with constant memory
+# Rows are written as the cursor yields them, so the first byte goes out
+# after the first batch instead of after the whole collection is loaded
+from bson import ObjectId
+from datetime import datetime
+from flask import Response
+import csv
+import io
+import json
+from app.serialize import iso_utc
+
+BATCH_SIZE = 500
+FORMATS = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+
+def _plain(value):
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, datetime):
+        return iso_utc(value)
+    return value
+
+
+def _ndjson_rows(cursor):
+    for doc in cursor:
+        yield json.dumps(doc, default=_plain, separators=(",", ":")) + "\n"
+
+
+def _csv_rows(cursor, columns):
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+
+    def flush():
+        data = buf.getvalue()
+        buf.seek(0)
+        buf.truncate(0)
+        return data
+
+    writer.writerow(columns)
+    yield flush()
+    for doc in cursor:
+        row = []
+        for col in columns:
+            value = _plain(doc.get(col, ""))
+            if isinstance(value, (list, dict)):
+                value = json.dumps(value, default=_plain)
+            row.append(value)
+        writer.writerow(row)
+        yield flush()
+
+
+# streamed response for format in FORMATS; columns only matter for csv
+def stream_export(coll, query, fmt, columns, filename):
+    projection = {col: 1 for col in columns}
+    cursor = coll.find(query, projection, batch_size=BATCH_SIZE)
+    rows = _csv_rows(cursor, columns) if fmt == "csv" else _ndjson_rows(cursor)
+    resp = Response(rows, mimetype=FORMATS[fmt])
+    resp.headers["Content-Disposition"] = f"attachment; filename={filename}.{fmt}"
+    return resp
@@ -1,49 +1,124 @@
 ﻿# Extensions setup - JWT auth, CORS, and MongoDB connection
+from flask import current_app, jsonify, make_response
 from flask_jwt_extended import JWTManager
 from flask_cors import CORS
 from pymongo import MongoClient, errors
+from .cache import init_cache
+from .blobstore import init_blob_store
+from .derivatives import init_derivatives
+from .passwords import init_passwords
+from .authz import init_authz
+from .stats import init_stats
+from .metrics import init_metrics
+from . import derivatives, passwords, metrics
 import os
 
+MONGO_URI = os.environ.get("MONGO_URI", "mongodb://127.0.0.1:27017/")
+DB_NAME = os.environ.get("MONGO_DB", "rentease")
+
+# MongoClient pool / timeout settings, e.g. MONGO_MAX_POOL_SIZE=20
+# unset ones keep the pymongo default
+MONGO_OPTIONS = {
+    "maxPoolSize": ("MONGO_MAX_POOL_SIZE", None),
+    "minPoolSize": ("MONGO_MIN_POOL_SIZE", None),
+    "maxIdleTimeMS": ("MONGO_MAX_IDLE_TIME_MS", None),
+    "waitQueueTimeoutMS": ("MONGO_WAIT_QUEUE_TIMEOUT_MS", None),
+    "connectTimeoutMS": ("MONGO_CONNECT_TIMEOUT_MS", None),
+    "socketTimeoutMS": ("MONGO_SOCKET_TIMEOUT_MS", None),
+    "serverSelectionTimeoutMS": ("MONGO_SERVER_SELECTION_TIMEOUT_MS", 5000),
+}
+
+# Angular frontend
+CORS_ORIGINS = ["http://localhost:4200", "http://127.0.0.1:4200"]
+
 jwt = JWTManager()
 mongo_client = None
 db = None
 
-def init_extensions(app):
+
+def mongo_options():
+    options = {}
+    for name, (env, default) in MONGO_OPTIONS.items():
+        value = os.environ.get(env, default)
+        if value is not None:
+            options[name] = int(value)
+    if metrics.listener is not None:
+        options["event_listeners"] = [metrics.listener]
+    return options
+
+
+# new client + db handle for this process
+def connect_mongo():
     global mongo_client, db
-    
+    mongo_client = MongoClient(MONGO_URI, **mongo_options())
+    db = mongo_client[DB_NAME]
+    return db
+
+
+# a MongoClient must not be shared across fork - forked workers (gunicorn
+# post_fork) open their own pool. The inherited client is dropped, not
+# closed: closing would talk to the server over the parent's sockets.
+def reconnect():
+    return connect_mongo()
+
+
+def close_mongo():
+    global mongo_client
+    if mongo_client is not None:
+        mongo_client.close()
+        mongo_client = None
+
+
+# graceful worker exit: let queued image jobs and hashes finish, then close
+def shutdown():
+    derivatives.shutdown()
+    if passwords.hash_pool is not None:
+        passwords.hash_pool.shutdown()
+    close_mongo()
+
+
+# Mongo unreachable (server selection timed out, connection dropped)
+def database_unavailable(e):
+    current_app.logger.warning("MongoDB unavailable: %s", e)
+    resp = make_response(jsonify({"Error": "Database unavailable"}), 503)
+    resp.headers["Retry-After"] = "1"
+    return resp
+
+
+def init_extensions(app):
     # allow requests from Angular frontend
-    CORS(app, origins=["http://localhost:4200", "http://127.0.0.1:4200"], 
+    CORS(app, origins=CORS_ORIGINS, 
          supports_credentials=True,
          allow_headers=["Content-Type", "Authorization"],
-         methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"])
+         methods=["GET", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"])
     
     # JWT config
     app.config["JWT_SECRET_KEY"] = os.environ.get("JWT_SECRET_KEY", "your-secret-key-change-in-production")
-    app.config["JWT_ACCESS_TOKEN_EXPIRES"] = 86400  # 24 hours
+    # access tokens are short lived - clients renew them with /auth/refresh
+    app.config["JWT_ACCESS_TOKEN_EXPIRES"] = int(os.environ.get("ACCESS_TOKEN_MINUTES", 15)) * 60
     jwt.init_app(app)
+    init_authz(app, jwt)
+
+    # bcrypt worker pool
+    init_passwords(app)
+
+    # property response cache
+    init_cache(app)
+
+    # content-addressed image storage
+    init_blob_store(app)
+    init_derivatives(app)
+
+    # admin statistics source
+    init_stats(app)
+
+    # opt-in /metrics (before connecting so the client gets the listener)
+    init_metrics(app)
 
-    # connect to MongoDB
-    try:
-        mongo_client = MongoClient("mongodb://127.0.0.1:27017/", serverSelectionTimeoutMS=5000)
-        mongo_client.admin.command("ping")
-        db = mongo_client["rentease"]
-        
-        # create collections if they don't exist
-        if "biz" not in db.list_collection_names():
-            db.create_collection("biz")
-        if "blacklist" not in db.list_collection_names():
-            db.create_collection("blacklist")
-        if "users" not in db.list_collection_names():
-            db.create_collection("users")
-        
-        app.db = db
-        print("MongoDB connected:", db)
-        print("Collections:", db.list_collection_names())
-        
-        return db
-    except errors.ServerSelectionTimeoutError as e:
-        print("MongoDB connection failed:", str(e))
-        raise
-    except Exception as e:
-        print("Error:", e)
-        raise
+    # the client connects in the background on first use, so a worker boots
+    # even while Mongo is briefly away; collections and indexes are set up
+    # by indexes.bootstrap() once per deploy, not here
+    connect_mongo()
+    app.db = db
+    app.register_error_handler(errors.ConnectionFailure, database_unavailable)
+    return db
@@ -0,0 +1,176 @@
+﻿# Geo - offline geocoding of property locations to GeoJSON points
+# Uses a small built-in table of UK towns, London districts and postcode
+# areas, so it needs no network; unknown places simply get no point
+#   python -m app.geo --backfill   (geocode existing properties)
+import re
+import sys
+
+# town -> (latitude, longitude)
+PLACES = {
+    "london": (51.5074, -0.1278),
+    "birmingham": (52.4862, -1.8904),
+    "manchester": (53.4808, -2.2426),
+    "leeds": (53.8008, -1.5491),
+    "liverpool": (53.4084, -2.9916),
+    "sheffield": (53.3811, -1.4701),
+    "bristol": (51.4545, -2.5879),
+    "newcastle": (54.9783, -1.6178),
+    "nottingham": (52.9548, -1.1581),
+    "leicester": (52.6369, -1.1398),
+    "coventry": (52.4068, -1.5197),
+    "bradford": (53.7960, -1.7594),
+    "cardiff": (51.4816, -3.1791),
+    "edinburgh": (55.9533, -3.1883),
+    "glasgow": (55.8642, -4.2518),
+    "belfast": (54.5973, -5.9301),
+    "southampton": (50.9097, -1.4044),
+    "portsmouth": (50.8198, -1.0880),
+    "brighton": (50.8225, -0.1372),
+    "oxford": (51.7520, -1.2577),
+    "cambridge": (52.2053, 0.1218),
+    "york": (53.9600, -1.0873),
+    "reading": (51.4543, -0.9781),
+    "norwich": (52.6309, 1.2974),
+    "plymouth": (50.3755, -4.1427),
+    "exeter": (50.7184, -3.5339),
+    "bath": (51.3811, -2.3590),
+    "aberdeen": (57.1497, -2.0943),
+    "dundee": (56.4620, -2.9707),
+    "swansea": (51.6214, -3.9436),
+    "hull": (53.7676, -0.3274),
+    "stoke-on-trent": (53.0027, -2.1794),
+    "derby": (52.9225, -1.4746),
+    "wolverhampton": (52.5862, -2.1288),
+    "milton keynes": (52.0406, -0.7594),
+    "luton": (51.8787, -0.4200),
+    "northampton": (52.2405, -0.9027),
+    "preston": (53.7632, -2.7031),
+    "sunderland": (54.9069, -1.3838),
+    "middlesbrough": (54.5742, -1.2350),
+    "bournemouth": (50.7192, -1.8808),
+    "ipswich": (52.0567, 1.1482),
+    "peterborough": (52.5695, -0.2405),
+    "gloucester": (51.8642, -2.2382),
+    "cheltenham": (51.8994, -2.0783),
+    "canterbury": (51.2802, 1.0789),
+    "lancaster": (54.0466, -2.8007),
+    "durham": (54.7761, -1.5733),
+    "chester": (53.1934, -2.8931),
+    "inverness": (57.4778, -4.2247),
+    "stirling": (56.1165, -3.9369),
+}
+
+# London districts - checked before towns since they are more specific
+DISTRICTS = {
+    "camden": (51.5390, -0.1426),
+    "westminster": (51.4975, -0.1357),
+    "islington": (51.5362, -0.1033),
+    "hackney": (51.5450, -0.0553),
+    "greenwich": (51.4826, 0.0077),
+    "croydon": (51.3762, -0.0982),
+    "shoreditch": (51.5262, -0.0779),
+    "brixton": (51.4613, -0.1156),
+    "kensington": (51.4990, -0.1938),
+    "chelsea": (51.4875, -0.1687),
+    "stratford": (51.5416, -0.0022),
+    "canary wharf": (51.5054, -0.0235),
+}
+
+# postcode area -> (latitude, longitude) or a place name above
+POSTCODE_AREAS = {
+    "E": (51.5300, -0.0300), "EC": (51.5180, -0.0950), "N": (51.5700, -0.1100),
+    "NW": (51.5500, -0.1900), "SE": (51.4600, -0.0600), "SW": (51.4600, -0.1700),
+    "W": (51.5100, -0.2200), "WC": (51.5170, -0.1200),
+    "B": "birmingham", "M": "manchester", "L": "liverpool", "LS": "leeds", "S": "sheffield",
+    "BS": "bristol", "NE": "newcastle", "NG": "nottingham", "LE": "leicester", "CV": "coventry",
+    "BD": "bradford", "CF": "cardiff", "EH": "edinburgh", "G": "glasgow", "BT": "belfast",
+    "SO": "southampton", "PO": "portsmouth", "BN": "brighton", "OX": "oxford", "CB": "cambridge",
+    "YO": "york", "RG": "reading", "NR": "norwich", "PL": "plymouth", "EX": "exeter", "BA": "bath",
+    "AB": "aberdeen", "DD": "dundee", "SA": "swansea", "HU": "hull", "ST": "stoke-on-trent",
+    "DE": "derby", "WV": "wolverhampton", "MK": "milton keynes", "LU": "luton", "NN": "northampton",
+    "PR": "preston", "SR": "sunderland", "TS": "middlesbrough", "BH": "bournemouth", "IP": "ipswich",
+    "PE": "peterborough", "GL": "gloucester", "CT": "canterbury", "LA": "lancaster", "DH": "durham",
+    "CH": "chester", "IV": "inverness", "FK": "stirling",
+}
+
+# full postcode ("SW1A 1AA") or outward code on its own ("LS1")
+POSTCODE_RE = re.compile(r"\b([A-Z]{1,2})[0-9][0-9A-Z]?(?:\s*[0-9][A-Z]{2})?\b")
+
+
+def _point(lat, lng):
+    return {"type": "Point", "coordinates": [lng, lat]}
+
+
+# free-text location -> GeoJSON point, or None if we don't know the place
+def geocode(location):
+    if not isinstance(location, str) or not location.strip():
+        return None
+    text = location.strip().lower()
+    if text in DISTRICTS:
+        return _point(*DISTRICTS[text])
+    if text in PLACES:
+        return _point(*PLACES[text])
+
+    # most specific first: a postcode beats a town name mentioned in passing
+    for match in POSTCODE_RE.finditer(location.upper()):
+        area = POSTCODE_AREAS.get(match.group(1))
+        if area is not None:
+            return _point(*(PLACES[area] if isinstance(area, str) else area))
+
+    # a district anywhere wins ("flat 2, camden, london" -> camden)
+    for name, coords in DISTRICTS.items():
+        if _find(name, text) >= 0:
+            return _point(*coords)
+
+    # otherwise the town mentioned last, since street names often contain
+    # other towns ("bath road, reading" -> reading)
+    best, best_pos = None, -1
+    for name, coords in PLACES.items():
+        pos = _find(name, text)
+        if pos > best_pos:
+            best, best_pos = coords, pos
+    return _point(*best) if best else None
+
+
+# last position of a whole-word match, -1 if absent
+def _find(name, text):
+    matches = list(re.finditer(r"\b" + re.escape(name) + r"\b", text))
+    return matches[-1].start() if matches else -1
+
+
+# (lat, lng) from a GeoJSON point, (0, 0) when missing
+def lat_lng(point):
+    if isinstance(point, dict) and point.get("coordinates"):
+        lng, lat = point["coordinates"]
+        return lat, lng
+    return 0, 0
+
+
+# geocode existing properties that don't have a point yet
+def backfill(db):
+    coll = db["biz"]
+    done = missed = 0
+    for doc in coll.find({"type": "property", "geo": {"$exists": False}}, {"location": 1}):
+        point = geocode(doc.get("location"))
+        if point is None:
+            missed += 1
+            continue
+        coll.update_one({"_id": doc["_id"]}, {"$set": {"geo": point}})
+        done += 1
+    return {"geocoded": done, "unknown": missed}
+
+
+def main(argv=None):
+    from pymongo import MongoClient
+    from .extensions import MONGO_URI, DB_NAME
+    argv = sys.argv[1:] if argv is None else argv
+    if "--backfill" not in argv:
+        print("usage: python -m app.geo --backfill")
+        return 1
+    db = MongoClient(MONGO_URI, serverSelectionTimeoutMS=5000)[DB_NAME]
+    print("Backfill", backfill(db))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,72 @@
+﻿# Health - liveness (/healthz) and readiness (/readyz) probes, plus startup timing
+# /healthz never touches Mongo: it only says the process is serving.
+# /readyz pings Mongo with a short deadline and checks that the declared
+# indexes exist, so a load balancer only routes to workers that can answer.
+# A unique index blocked by duplicate data only makes it "degraded": every
+# worker would fail the same way until someone dedupes, and pulling them all
+# out of rotation doesn't help.
+from flask import jsonify, make_response
+import logging
+import os
+import time
+import pymongo
+import app.extensions as ext
+from .indexes import missing_indexes, unique_index_names
+
+log = logging.getLogger(__name__)
+
+READY_TIMEOUT = 0.5  # seconds for the ping + index check (probes time out at 1s)
+
+started_at = time.time()
+startup_seconds = None
+# indexes don't disappear, so once they are all there stop listing them
+_indexes_ok = False
+
+
+def mark_started(seconds):
+    global startup_seconds
+    startup_seconds = seconds
+    log.info("App ready in %.0f ms (pid %d)", seconds * 1000, os.getpid())
+
+
+def healthz():
+    return make_response(jsonify({
+        "status": "ok",
+        "pid": os.getpid(),
+        "uptime_s": round(time.time() - started_at, 1),
+        "startup_ms": round(startup_seconds * 1000, 1) if startup_seconds is not None else None
+    }), 200)
+
+
+def readyz():
+    global _indexes_ok
+    checks = {"mongo": "ok", "indexes": "ok"}
+    try:
+        if ext.mongo_client is None:
+            raise pymongo.errors.ConnectionFailure("no client")
+        with pymongo.timeout(READY_TIMEOUT):
+            ext.mongo_client.admin.command("ping")
+            if not _indexes_ok:
+                missing = missing_indexes(ext.db)
+                unique = unique_index_names()
+                blocked = [name for name in missing if name in unique]
+                if len(blocked) < len(missing):
+                    checks["indexes"] = {"missing": missing}
+                elif blocked:
+                    checks["indexes"] = {"degraded": blocked}
+                _indexes_ok = not missing
+    except pymongo.errors.PyMongoError as e:
+        checks["mongo"] = str(e)[:200] or e.__class__.__name__
+        checks["indexes"] = "unknown"
+    degraded = checks["mongo"] == "ok" and "degraded" in checks["indexes"]
+    ready = degraded or checks == {"mongo": "ok", "indexes": "ok"}
+    status = "degraded" if degraded else "ready" if ready else "not ready"
+    resp = make_response(jsonify({"status": status, "checks": checks}), 200 if ready else 503)
+    if not ready:
+        resp.headers["Retry-After"] = "1"
+    return resp
+
+
+def init_health(app):
+    app.add_url_rule("/healthz", "healthz", healthz)
+    app.add_url_rule("/readyz", "readyz", readyz)
@@ -0,0 +1,69 @@
+﻿# One-off migration - move base64 images embedded in property documents
+# into the blob store and keep only references in biz
+#   python -m app.images.migrate [--dry-run]
+# thumbnails / WebP variants are queued like uploads and built before exit
+from pymongo import UpdateOne
+import sys
+import app.blobstore as blobs
+import app.derivatives as derivatives
+
+BATCH_SIZE = 200
+
+
+# convert one images array, returns (new list, number of images moved)
+def migrate_images(store, images, dry_run=False):
+    out = []
+    moved = 0
+    for img in images:
+        if isinstance(img, str) and blobs.DATA_URL_RE.match(img):
+            if not dry_run:
+                img = store.put(blobs.decode_data_url(img))
+            moved += 1
+        out.append(img)
+    return out, moved
+
+
+def migrate(db, store, dry_run=False):
+    coll = db["biz"]
+    query = {"type": "property", "images": {"$elemMatch": {"$regex": "^data:image/"}}}
+    ops, refs = [], []
+    docs = moved = failed = 0
+
+    for doc in coll.find(query, {"images": 1}, batch_size=BATCH_SIZE):
+        try:
+            images, n = migrate_images(store, doc["images"], dry_run)
+        except blobs.BlobError as e:
+            print("Skipping", doc["_id"], "-", e)
+            failed += 1
+            continue
+        docs += 1
+        moved += n
+        if not dry_run:
+            ops.append(UpdateOne({"_id": doc["_id"]}, {"$set": {"images": images}}))
+            refs.extend(images)
+        if len(ops) >= BATCH_SIZE:
+            coll.bulk_write(ops, ordered=False)
+            derivatives.enqueue(refs)  # after the write, so attach() finds the documents
+            ops, refs = [], []
+
+    if ops:
+        coll.bulk_write(ops, ordered=False)
+        derivatives.enqueue(refs)
+    return {"documents": docs, "images": moved, "failed": failed}
+
+
+def main(argv=None):
+    # the app sets up the store, the derivative pool and cache invalidation
+    # from the same settings the server uses
+    from app import create_app
+    import app.extensions as ext
+    argv = sys.argv[1:] if argv is None else argv
+    create_app()
+    result = migrate(ext.db, blobs.blob_store, dry_run="--dry-run" in argv)
+    print("Migrated", result)
+    derivatives.shutdown()  # wait for the queued variants
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
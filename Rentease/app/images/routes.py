@@ -0,0 +1,61 @@
+﻿# Image routes - upload and serve content-addressed property images
+from flask import Blueprint, request, jsonify, make_response, send_file
+import app.blobstore as blobs
+import app.derivatives as derivatives
+from app.authz import role_required
+
+images_app = Blueprint("images", __name__)
+
+# one year - keys are content hashes so the bytes behind a URL never change
+IMMUTABLE_MAX_AGE = 31536000
+
+
+# read uploaded images from multipart "images" files or a JSON list of data URLs
+def read_uploads():
+    if request.files:
+        return [f.read() for f in request.files.getlist("images")]
+    data = request.get_json(silent=True) or {}
+    images = data.get("images", [])
+    if not isinstance(images, list):
+        raise blobs.BlobError("images must be a list")
+    return [blobs.decode_data_url(v) for v in images]
+
+
+# store a batch of uploads, returns their references
+def store_uploads():
+    return [blobs.to_image_ref(blobs.blob_store, blobs.blob_store.put(data)) for data in read_uploads()]
+
+
+# POST / - upload images, returns references to put on a property
+@images_app.route("/", methods=["POST"])
+@role_required("agent", "admin")
+def upload_images():
+    try:
+        refs = store_uploads()
+    except blobs.BlobError as e:
+        return make_response(jsonify({"Error": str(e)}), 400)
+    if not refs:
+        return make_response(jsonify({"Error": "No images uploaded"}), 400)
+
+    # build thumbnails now so they're ready when the image is put on a property
+    derivatives.enqueue(refs)
+    for ref in refs:
+        ref["url"] = blobs.image_url(ref)
+    return make_response(jsonify(refs), 201)
+
+
+# GET /<key> - stream an image (supports Range and conditional requests)
+@images_app.route("/<string:key>", methods=["GET"])
+def get_image(key):
+    try:
+        path = blobs.blob_store.path(key)
+    except blobs.BlobError:
+        return make_response(jsonify({"Error": "Invalid image key"}), 400)
+    ext = key.rsplit(".", 1)[-1]
+    try:
+        resp = send_file(path, mimetype=blobs.CONTENT_TYPES[ext], conditional=True,
+                         etag=key.split(".")[0], max_age=IMMUTABLE_MAX_AGE)
+    except FileNotFoundError:
+        return make_response(jsonify({"Error": "Image not found"}), 404)
+    resp.headers["Cache-Control"] = f"public, max-age={IMMUTABLE_MAX_AGE}, immutable"
+    return resp
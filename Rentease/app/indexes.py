@@ -0,0 +1,209 @@
+﻿# Index management - declares the indexes each route's queries rely on
+# and checks with explain() that none of them fall back to a COLLSCAN
+from datetime import datetime
+from pymongo import ASCENDING, DESCENDING, GEOSPHERE, TEXT, MongoClient, errors
+import logging
+import sys
+
+log = logging.getLogger(__name__)
+
+COLLECTIONS = ["biz", "blacklist", "users", "refresh_tokens", "bookings", "booking_calendar", "cache_invalidations"]
+
+# collection -> list of (name, keys, options)
+# biz is single-table with a "type" field, so every index leads with type
+INDEXES = {
+    "biz": [
+        # list_properties filters
+        ("property_search", [("type", ASCENDING), ("location", ASCENDING),
+                             ("property_type", ASCENDING), ("price", ASCENDING)], {}),
+        ("property_price", [("type", ASCENDING), ("price", ASCENDING), ("_id", ASCENDING)], {}),
+        ("property_created", [("type", ASCENDING), ("createdAt", ASCENDING), ("_id", ASCENDING)], {}),
+        # /properties/search keywords (a collection can only have one text index)
+        ("property_text", [("title", TEXT), ("description", TEXT), ("amenities", TEXT)],
+         {"weights": {"title": 10, "amenities": 5, "description": 1},
+          "partialFilterExpression": {"type": "property"}}),
+        # radius / bounding box queries (2dsphere skips docs without a point)
+        ("property_geo", [("geo", GEOSPHERE), ("type", ASCENDING)], {}),
+        # sort_by=favorites
+        ("property_favorites", [("type", ASCENDING), ("favorite_count", ASCENDING), ("_id", ASCENDING)], {}),
+        # agent my_properties
+        ("agent_properties", [("type", ASCENDING), ("agent_id", ASCENDING)], {}),
+        # favorites / inquiries by user, newest first
+        ("user_docs_recent", [("type", ASCENDING), ("user_id", ASCENDING), ("_id", DESCENDING)], {}),
+        ("favorite_unique", [("type", ASCENDING), ("user_id", ASCENDING), ("property_id", ASCENDING)],
+         {"unique": True, "partialFilterExpression": {"type": "favorite"}}),
+    ],
+    "bookings": [
+        # overlap checks: check_out_date > start bounds the scan to current bookings
+        ("property_interval", [("property_id", ASCENDING), ("check_out_date", ASCENDING),
+                               ("check_in_date", ASCENDING)], {}),
+        ("user_bookings", [("user_id", ASCENDING), ("_id", DESCENDING)], {}),
+    ],
+    "users": [
+        ("email_unique", [("email", ASCENDING)], {"unique": True}),
+    ],
+    "blacklist": [
+        ("jti_unique", [("jti", ASCENDING)], {"unique": True}),
+        # revoked tokens are only needed until they would have expired anyway
+        ("expires_ttl", [("expires_at", ASCENDING)], {"expireAfterSeconds": 0}),
+    ],
+    "cache_invalidations": [
+        # pollers only look a few seconds back
+        ("created_ttl", [("createdAt", ASCENDING)], {"expireAfterSeconds": 3600}),
+    ],
+    "refresh_tokens": [
+        ("token_hash_unique", [("token_hash", ASCENDING)], {"unique": True}),
+        ("family", [("family_id", ASCENDING)], {}),
+        ("expires_ttl", [("expires_at", ASCENDING)], {"expireAfterSeconds": 0}),
+    ],
+}
+
+# indexes earlier versions created that are now covered by another one
+DROPPED = {
+    "biz": ["user_docs"],  # (type, user_id) - prefix of user_docs_recent
+}
+
+# representative query for each route - (label, collection, kind, filter, sort)
+# admin statistics is left out: stats.aggregate_stats is one $facet over all
+# of biz by design (or a single counters read with STATS_COUNTERS=1)
+ROUTE_QUERIES = [
+    ("list_properties", "biz", "find", {"type": "property"}, [("_id", ASCENDING)]),
+    ("list_properties filtered", "biz", "find",
+     {"type": "property", "location": "London", "property_type": "flat",
+      "price": {"$gte": 500, "$lte": 2000}}, None),
+    ("list_properties by price", "biz", "find", {"type": "property"}, [("price", ASCENDING), ("_id", ASCENDING)]),
+    ("list_properties by createdAt", "biz", "find", {"type": "property"},
+     [("createdAt", ASCENDING), ("_id", ASCENDING)]),
+    ("list_properties by favorites", "biz", "find", {"type": "property"},
+     [("favorite_count", DESCENDING), ("_id", DESCENDING)]),
+    ("search", "biz", "find", {"type": "property", "$text": {"$search": "garden"}}, None),
+    ("list_properties bbox", "biz", "find",
+     {"type": "property", "geo": {"$geoWithin": {"$geometry": {"type": "Polygon", "coordinates": [
+         [[-0.5, 51.3], [0.3, 51.3], [0.3, 51.7], [-0.5, 51.7], [-0.5, 51.3]]]}}}}, None),
+    ("my_properties", "biz", "find", {"type": "property", "agent_id": "x"}, None),
+    ("list_favorites", "biz", "find", {"type": "favorite", "user_id": "x"}, None),
+    ("add_favorite", "biz", "find", {"type": "favorite", "user_id": "x", "property_id": "y"}, None),
+    ("list_favorites expanded", "biz", "find", {"type": "favorite", "user_id": "x"}, [("_id", DESCENDING)]),
+    ("list_inquiries", "biz", "find", {"type": "inquiry", "user_id": "x"}, None),
+    ("check_availability", "bookings", "find",
+     {"property_id": "x", "check_out_date": {"$gt": datetime(2030, 1, 1)},
+      "check_in_date": {"$lt": datetime(2030, 1, 8)}}, None),
+    ("my_bookings", "bookings", "find", {"user_id": "x"}, [("_id", DESCENDING)]),
+    ("login", "users", "find", {"email": "x@example.com"}, None),
+    ("refresh", "refresh_tokens", "find", {"token_hash": "x"}, None),
+]
+
+
+# create all declared indexes - safe to call on every startup
+def ensure_indexes(db):
+    created = []
+    for coll_name, specs in INDEXES.items():
+        coll = db[coll_name]
+        for name, keys, options in specs:
+            try:
+                coll.create_index(keys, name=name, **options)
+                created.append(name)
+            except errors.OperationFailure as e:
+                # e.g. duplicate data blocking a unique index - don't stop startup
+                log.warning("Index %s not created: %s", name, e)
+    return created
+
+
+def drop_retired_indexes(db):
+    dropped = []
+    for coll_name, names in DROPPED.items():
+        have = {ix["name"] for ix in db[coll_name].list_indexes()}
+        for name in names:
+            if name in have:
+                db[coll_name].drop_index(name)
+                dropped.append(name)
+    return dropped
+
+
+def ensure_collections(db):
+    existing = set(db.list_collection_names())
+    for name in COLLECTIONS:
+        if name not in existing:
+            db.create_collection(name)
+
+
+# one-time setup per deploy (python -m app.indexes, the gunicorn master or
+# python run.py) - app workers never run it
+def bootstrap(db):
+    ensure_collections(db)
+    created = ensure_indexes(db)
+    drop_retired_indexes(db)
+    return created
+
+
+# "collection.index" names declared above but not on the server
+def missing_indexes(db):
+    missing = []
+    for coll_name, specs in INDEXES.items():
+        have = {ix["name"] for ix in db[coll_name].list_indexes()}
+        missing += [f"{coll_name}.{name}" for name, _, _ in specs if name not in have]
+    return missing
+
+
+# unique indexes whose build can fail on existing duplicates (see ensure_indexes)
+def unique_index_names():
+    return {f"{coll_name}.{name}" for coll_name, specs in INDEXES.items()
+            for name, _, options in specs if options.get("unique")}
+
+
+# collect every stage name in an explain plan tree
+def _plan_stages(plan):
+    stages = []
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            stages.append(plan["stage"])
+        for value in plan.values():
+            stages.extend(_plan_stages(value))
+    elif isinstance(plan, list):
+        for item in plan:
+            stages.extend(_plan_stages(item))
+    return stages
+
+
+def _explain(db, coll_name, kind, query, sort):
+    if kind == "count":
+        return db.command("explain", {"count": coll_name, "query": query})
+    cursor = db[coll_name].find(query)
+    if sort:
+        cursor = cursor.sort(sort)
+    return cursor.explain()
+
+
+# run explain() on each route query, return the ones that scan the collection
+def check_query_plans(db):
+    failures = []
+    for label, coll_name, kind, query, sort in ROUTE_QUERIES:
+        plan = _explain(db, coll_name, kind, query, sort)
+        winning = plan.get("queryPlanner", {}).get("winningPlan", {})
+        stages = _plan_stages(winning)
+        if "COLLSCAN" in stages:
+            failures.append((label, stages))
+    return failures
+
+
+# python -m app.indexes [--check]
+def main(argv=None):
+    from .extensions import MONGO_URI, DB_NAME
+    argv = sys.argv[1:] if argv is None else argv
+    db = MongoClient(MONGO_URI, serverSelectionTimeoutMS=5000)[DB_NAME]
+
+    for name in bootstrap(db):
+        print("ok", name)
+
+    if "--check" in argv:
+        failures = check_query_plans(db)
+        for label, stages in failures:
+            print("COLLSCAN:", label, "->", " > ".join(stages))
+        if failures:
+            return 1
+        print("All route queries use an index")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
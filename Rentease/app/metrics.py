@@ -0,0 +1,272 @@
+﻿# Metrics - opt-in request and Mongo instrumentation, served as Prometheus
+# text on /metrics. Off by default (METRICS_ENABLED=1 to turn on); when off
+# no hooks, listener or route are registered, so there is nothing to pay.
+# Numbers are per process - under gunicorn every worker has its own.
+from bisect import bisect_left
+from contextvars import ContextVar
+from flask import Response, g, request
+from pymongo import monitoring
+import hmac
+import os
+import threading
+import time
+import app.admission as admission
+import app.cache as cache
+import app.health as health
+import app.passwords as passwords
+
+LATENCY_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+SIZE_BUCKETS = [256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304]
+DOC_BUCKETS = [0, 1, 10, 20, 50, 100, 500, 1000, 5000]
+
+enabled = False
+listener = None
+
+# per-request time spent in Mongo and in JSON encoding
+_request_timing = ContextVar("request_timing", default=None)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=""):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Histogram:
+    def __init__(self, name, help_text, labels, buckets):
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self.buckets = buckets
+        self._series = {}  # label values -> [bucket counts, sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, values, amount):
+        i = bisect_left(self.buckets, amount)
+        with self._lock:
+            series = self._series.get(values)
+            if series is None:
+                series = self._series[values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][i] += 1
+            series[1] += amount
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = [(k, list(v[0]), v[1], v[2]) for k, v in sorted(self._series.items())]
+        for values, counts, total, count in items:
+            running = 0
+            for bound, n in zip(self.buckets + ["+Inf"], counts):
+                running += n
+                le = 'le="%s"' % bound
+                lines.append(f"{self.name}_bucket{_labels(self.labels, values, le)} {running}")
+            lines.append(f"{self.name}_sum{_labels(self.labels, values)} {total}")
+            lines.append(f"{self.name}_count{_labels(self.labels, values)} {count}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name, help_text, labels):
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def inc(self, values, amount=1):
+        with self._lock:
+            self._series[values] = self._series.get(values, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._series.items())
+        lines.extend(f"{self.name}{_labels(self.labels, values)} {n}" for values, n in items)
+        return lines
+
+
+REQUEST_LABELS = ("endpoint", "method")
+requests_total = Counter("http_requests_total", "Requests by endpoint and status",
+                         ("endpoint", "method", "status"))
+request_seconds = Histogram("http_request_duration_seconds", "Request latency",
+                            REQUEST_LABELS, LATENCY_BUCKETS)
+request_mongo_seconds = Histogram("http_request_mongo_seconds", "Time in Mongo commands per request",
+                                  REQUEST_LABELS, LATENCY_BUCKETS)
+request_encode_seconds = Histogram("http_request_encode_seconds", "Time encoding JSON per request",
+                                   REQUEST_LABELS, LATENCY_BUCKETS)
+response_bytes = Histogram("http_response_size_bytes", "Response body size (streamed responses excluded)",
+                           REQUEST_LABELS, SIZE_BUCKETS)
+
+MONGO_LABELS = ("command", "collection")
+mongo_seconds = Histogram("mongo_command_duration_seconds", "Mongo command latency",
+                          MONGO_LABELS, LATENCY_BUCKETS)
+mongo_documents = Histogram("mongo_command_documents_returned", "Documents in a command's reply",
+                            MONGO_LABELS, DOC_BUCKETS)
+mongo_failures = Counter("mongo_command_failures_total", "Failed Mongo commands", MONGO_LABELS)
+
+METRICS = [requests_total, request_seconds, request_mongo_seconds, request_encode_seconds,
+           response_bytes, mongo_seconds, mongo_documents, mongo_failures]
+
+
+# docs in a reply: cursor batches for find/aggregate/getMore, n for counts
+def _returned(reply):
+    cursor = reply.get("cursor")
+    if isinstance(cursor, dict):
+        return len(cursor.get("firstBatch") or cursor.get("nextBatch") or [])
+    n = reply.get("n")
+    return n if isinstance(n, int) else 0
+
+
+class CommandTimer(monitoring.CommandListener):
+    def __init__(self):
+        self._pending = {}  # (connection, request id) -> (command, collection)
+        self._lock = threading.Lock()
+
+    def started(self, event):
+        collection = event.command.get(event.command_name)
+        if event.command_name == "getMore":
+            collection = event.command.get("collection")
+        if not isinstance(collection, str):
+            collection = ""
+        with self._lock:
+            self._pending[(event.connection_id, event.request_id)] = (event.command_name, collection)
+
+    def _finish(self, event):
+        with self._lock:
+            labels = self._pending.pop((event.connection_id, event.request_id), None)
+        seconds = event.duration_micros / 1e6
+        timing = _request_timing.get()
+        if timing is not None:
+            timing["mongo"] += seconds
+        return labels or (event.command_name, ""), seconds
+
+    def succeeded(self, event):
+        labels, seconds = self._finish(event)
+        mongo_seconds.observe(labels, seconds)
+        mongo_documents.observe(labels, _returned(event.reply))
+
+    def failed(self, event):
+        labels, seconds = self._finish(event)
+        mongo_seconds.observe(labels, seconds)
+        mongo_failures.inc(labels)
+
+
+# per-request Mongo/encode timers; also used by the async read path,
+# which doesn't go through the Flask hooks
+def start_timing():
+    timing = {"mongo": 0.0, "encode": 0.0}
+    return timing, _request_timing.set(timing)
+
+
+def stop_timing(token):
+    _request_timing.reset(token)
+
+
+def observe_request(endpoint, method, status, seconds, timing, size=None):
+    labels = (endpoint, method)
+    requests_total.inc(labels + (str(status),))
+    request_seconds.observe(labels, seconds)
+    request_mongo_seconds.observe(labels, timing["mongo"])
+    request_encode_seconds.observe(labels, timing["encode"])
+    if size is not None:
+        response_bytes.observe(labels, size)
+
+
+def _before_request():
+    g._metrics_start = time.perf_counter()
+    g._metrics_timing, g._metrics_token = start_timing()
+
+
+def _record(status, size=None):
+    start = g.pop("_metrics_start", None)
+    if start is None:
+        return
+    observe_request(request.endpoint or "unmatched", request.method, status,
+                    time.perf_counter() - start, g._metrics_timing, size)
+
+
+def _after_request(response):
+    _record(response.status_code, None if response.is_streamed else response.calculate_content_length())
+    return response
+
+
+# unhandled errors skip after_request - count them here
+def _teardown_request(exc):
+    if exc is not None:
+        _record(500)
+    token = g.pop("_metrics_token", None)
+    if token is not None:
+        stop_timing(token)
+
+
+# wrap an encoder so its time counts as the request's encode time
+def timed_encode(encode):
+    def timed(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return encode(*args, **kwargs)
+        finally:
+            timing = _request_timing.get()
+            if timing is not None:
+                timing["encode"] += time.perf_counter() - start
+    return timed
+
+
+def _gauges():
+    lines = []
+    if health.startup_seconds is not None:
+        lines += ["# TYPE app_startup_seconds gauge", f"app_startup_seconds {health.startup_seconds:.6f}"]
+    stats = cache.property_cache.stats()
+    for key in ("entries", "hits", "misses", "evictions", "expirations"):
+        if key in stats:
+            kind = "gauge" if key == "entries" else "counter"
+            lines += [f"# TYPE property_cache_{key} {kind}", f"property_cache_{key} {stats[key]}"]
+    if passwords.hash_pool is not None:
+        lines += ["# TYPE auth_pool_rejected counter",
+                  f"auth_pool_rejected {passwords.hash_pool.stats()['rejected']}"]
+    if admission.controller.enabled:
+        stats = admission.controller.stats()
+        lines += ["# TYPE admission_in_flight gauge", f"admission_in_flight {stats['in_flight']}",
+                  "# TYPE admission_shed_total counter"]
+        for cls, reasons in stats["shed"].items():
+            lines += [f'admission_shed_total{{class="{cls}",reason="{reason}"}} {n}' for reason, n in reasons.items()]
+    return lines
+
+
+def render():
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    lines.extend(_gauges())
+    return "\n".join(lines) + "\n"
+
+
+def metrics_view():
+    token = os.environ.get("METRICS_TOKEN")
+    if token:
+        sent = request.headers.get("Authorization", "")
+        if not hmac.compare_digest(sent, f"Bearer {token}"):
+            return Response("unauthorized\n", status=401, mimetype="text/plain")
+    return Response(render(), mimetype="text/plain; version=0.0.4")
+
+
+# call before the Mongo clients are created - they pick up the listener
+def init_metrics(app):
+    global enabled, listener
+    app.config.setdefault("METRICS_ENABLED", os.environ.get("METRICS_ENABLED", "0") == "1")
+    enabled = app.config["METRICS_ENABLED"]
+    if not enabled:
+        return
+    listener = listener or CommandTimer()
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.teardown_request(_teardown_request)
+    app.json.response = timed_encode(app.json.response)
+    app.add_url_rule("/metrics", "metrics", metrics_view)
+    app.logger.info("Metrics enabled on /metrics")
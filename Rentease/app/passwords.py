@@ -0,0 +1,101 @@
+﻿# Password hashing - bcrypt runs in a bounded worker pool so a burst of
+# logins can't tie up every request worker, with a configurable cost
+from concurrent.futures import ThreadPoolExecutor
+import os
+import threading
+import bcrypt
+
+DEFAULT_ROUNDS = 12
+
+
+class PoolBusy(Exception):
+    def __init__(self, retry_after=1):
+        super().__init__("Auth worker pool is full")
+        self.retry_after = retry_after
+
+
+# bcrypt releases the GIL while hashing, so threads run it in parallel
+# the semaphore caps running + queued jobs; past that we refuse instead of queueing
+class HashPool:
+    def __init__(self, workers=2, max_queue=32, rounds=DEFAULT_ROUNDS, timeout=10, retry_after=1):
+        self.rounds = rounds
+        self.timeout = timeout
+        self.retry_after = retry_after
+        self.max_pending = workers + max_queue
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="auth-hash")
+        self.rejected = 0
+
+    def _submit(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            self.rejected += 1
+            raise PoolBusy(self.retry_after)
+        try:
+            future = self._executor.submit(fn, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    # bcrypt only uses the first 72 bytes
+    @staticmethod
+    def _bytes(password):
+        return password.encode("utf-8")[:72]
+
+    def hash(self, password):
+        pwd = self._bytes(password)
+        return self._submit(lambda: bcrypt.hashpw(pwd, bcrypt.gensalt(self.rounds))).result(self.timeout)
+
+    def check(self, password, hashed):
+        if not hashed:
+            return False
+        pwd = self._bytes(password)
+        return self._submit(bcrypt.checkpw, pwd, hashed).result(self.timeout)
+
+    # hash in the background and hand the result to callback, e.g. rehash-on-login
+    # skipped silently when the pool is busy - it will be retried on the next login
+    def hash_async(self, password, callback):
+        pwd = self._bytes(password)
+        try:
+            future = self._submit(lambda: bcrypt.hashpw(pwd, bcrypt.gensalt(self.rounds)))
+        except PoolBusy:
+            return None
+        future.add_done_callback(lambda f: f.exception() is None and callback(f.result()))
+        return future
+
+    # stored hash uses a different cost than configured
+    def needs_rehash(self, hashed):
+        return hash_rounds(hashed) != self.rounds
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
+
+    def stats(self):
+        return {"rounds": self.rounds, "max_pending": self.max_pending, "rejected": self.rejected}
+
+
+# cost factor from a "$2b$12$..." hash
+def hash_rounds(hashed):
+    if isinstance(hashed, str):
+        hashed = hashed.encode("utf-8")
+    try:
+        return int(hashed.split(b"$")[2])
+    except (IndexError, ValueError):
+        return None
+
+
+hash_pool = None
+
+
+def init_passwords(app):
+    global hash_pool
+    app.config.setdefault("BCRYPT_ROUNDS", int(os.environ.get("BCRYPT_ROUNDS", DEFAULT_ROUNDS)))
+    app.config.setdefault("AUTH_POOL_WORKERS", int(os.environ.get("AUTH_POOL_WORKERS", 2)))
+    app.config.setdefault("AUTH_POOL_QUEUE", int(os.environ.get("AUTH_POOL_QUEUE", 32)))
+    hash_pool = HashPool(
+        workers=app.config["AUTH_POOL_WORKERS"],
+        max_queue=app.config["AUTH_POOL_QUEUE"],
+        rounds=app.config["BCRYPT_ROUNDS"]
+    )
+    return hash_pool
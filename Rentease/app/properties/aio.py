@@ -0,0 +1,281 @@
+﻿# Async property reads - an ASGI app that answers GET list / search / detail
+# with pymongo's AsyncMongoClient, so one process can hold hundreds of
+# browse requests open while they wait on Mongo. Everything else (writes,
+# auth, other blueprints) is handed to the Flask app in a thread pool.
+# Query building, formatting and caching are shared with routes.py, so the
+# responses are byte-for-byte what the Flask routes return. Admission control,
+# metrics and the 503 for an unreachable Mongo mirror the Flask hooks.
+#   uvicorn asgi:app
+from bson import ObjectId
+from pymongo import AsyncMongoClient, errors
+from urllib.parse import parse_qsl
+from werkzeug.datastructures import MultiDict
+from werkzeug.http import parse_etags
+from a2wsgi import WSGIMiddleware
+import hashlib
+import logging
+import os
+import time
+import app.admission as admission
+import app.cache as cache
+import app.compress as compress
+import app.extensions as ext
+import app.metrics as metrics
+import app.properties.routes as routes
+from app.serialize import response_body, envelope, format_property
+
+log = logging.getLogger(__name__)
+
+PREFIX = "/api/v1/properties"
+
+# swapped for a timed encoder when metrics are on
+encode = response_body
+
+mongo_client = None
+db = None
+
+
+def connect():
+    global mongo_client, db
+    mongo_client = AsyncMongoClient(ext.MONGO_URI, **ext.mongo_options())
+    db = mongo_client[ext.DB_NAME]
+    return db
+
+
+async def close():
+    global mongo_client, db
+    if mongo_client is not None:
+        await mongo_client.close()
+    mongo_client = db = None
+
+
+class Request:
+    def __init__(self, scope):
+        self.scope = scope
+        self.headers = {k.decode("latin-1"): v.decode("latin-1") for k, v in scope["headers"]}
+        self.args = MultiDict(parse_qsl(scope["query_string"].decode("latin-1"), keep_blank_values=True))
+        self.if_none_match = parse_etags(self.headers.get("if-none-match"))
+
+    def etag_matches(self, etag):
+        return bool(etag) and self.if_none_match.contains_weak(etag)
+
+    def access_route(self):
+        return [h.strip() for h in self.headers.get("x-forwarded-for", "").split(",") if h.strip()]
+
+
+async def _send(send, req, status, body=b"", etag=None, weak=False, retry_after=None):
+    headers = [(b"content-type", b"application/json")] if body else []
+    vary = ["Accept-Encoding"] if body and compress.enabled else []
+    # same rules as compress._after_request
+    encoding = None
+    if status == 200 and len(body) >= compress.min_size and req.scope.get("method") != "HEAD":
+        encoding = compress.negotiate(req.headers.get("accept-encoding"))
+    if encoding:
+        level = compress.LEVELS["application/json"][encoding]
+        body = compress.compress_cached(body, encoding, level) if etag else compress.compress(body, encoding, level)
+        headers.append((b"content-encoding", encoding.encode()))
+        weak = True
+    headers.append((b"content-length", str(len(body)).encode()))
+    if etag:
+        headers.append((b"etag", (f'W/"{etag}"' if weak else f'"{etag}"').encode()))
+        headers.append((b"cache-control", b"no-cache"))
+    if retry_after is not None:
+        headers.append((b"retry-after", str(retry_after).encode()))
+    origin = req.headers.get("origin")
+    if origin in ext.CORS_ORIGINS:
+        headers += [(b"access-control-allow-origin", origin.encode()),
+                    (b"access-control-allow-credentials", b"true")]
+        vary.append("Origin")
+    if vary:
+        headers.append((b"vary", ", ".join(vary).encode()))
+    await send({"type": "http.response.start", "status": status, "headers": headers})
+    await send({"type": "http.response.body", "body": body})
+
+
+async def _error(send, req, status, message):
+    await _send(send, req, status, encode(envelope(False, message)))
+
+
+async def _fetch(coll, kind, spec):
+    if kind == "aggregate":
+        cursor = await coll.aggregate(spec[0])
+        return await cursor.to_list(None)
+    query, projection, sort, limit = spec
+    return await coll.find(query, projection).sort(sort).limit(limit).to_list(None)
+
+
+async def list_properties(req, send):
+    cache_key = cache.property_cache.list_key(req.args)
+    cached = cache.property_cache.get(cache_key)
+    if cached is not None:
+        body, etag = cached
+        if req.etag_matches(etag):
+            return await _send(send, req, 304, etag=etag, weak=True)
+        return await _send(send, req, 200, body, etag, weak=True)
+
+    coll = db["biz"]
+    try:
+        plan = routes.list_plan(req.args)
+    except ValueError as e:
+        return await _error(send, req, 400, str(e))
+
+    kind, *spec = routes.list_query(plan)
+    properties, meta = routes.list_page(plan, await _fetch(coll, kind, spec))
+    body = encode(envelope(True, "Properties retrieved successfully", properties, meta))
+    etag = routes.page_etag(body)
+    cache.property_cache.set(cache_key, (body, etag))
+    if req.etag_matches(etag):
+        return await _send(send, req, 304, etag=etag, weak=True)
+    await _send(send, req, 200, body, etag, weak=True)
+
+
+async def search_properties(req, send):
+    cache_key = cache.property_cache.list_key(req.args, kind="search")
+    cached = cache.property_cache.get(cache_key)
+    if cached is not None:
+        return await _send(send, req, 200, cached[0])
+
+    try:
+        pipeline, keywords, page, limit = routes.search_plan(req.args)
+    except ValueError as e:
+        return await _error(send, req, 400, str(e))
+    try:
+        out = (await (await db["biz"].aggregate(pipeline)).to_list(None))[0]
+    except errors.OperationFailure as e:
+        return await _error(send, req, 400, "Search failed: " + str(e))
+
+    properties, meta = routes.search_page(out, keywords, page, limit)
+    body = encode(envelope(True, "Search results", properties, meta))
+    cache.property_cache.set(cache_key, (body, None))
+    await _send(send, req, 200, body)
+
+
+async def get_property(req, send, prop_id):
+    try:
+        oid = ObjectId(prop_id)
+    except Exception:
+        return await _error(send, req, 400, "Invalid property ID")
+
+    cache_key = cache.property_cache.detail_key(str(oid))
+    cached = cache.property_cache.get(cache_key)
+    if cached is not None:
+        body, etag = cached
+        if req.etag_matches(etag):
+            return await _send(send, req, 304, etag=etag)
+        return await _send(send, req, 200, body, etag)
+
+    coll = db["biz"]
+    # conditional request: check the validator before loading the full doc
+    if req.if_none_match:
+        stamp = await coll.find_one({"_id": oid, "type": "property"}, routes.ETAG_PROJECTION)
+        etag = routes.property_etag(stamp) if stamp else None
+        if req.etag_matches(etag):
+            return await _send(send, req, 304, etag=etag)
+
+    prop = await coll.find_one({"_id": oid, "type": "property"})
+    if not prop:
+        return await _error(send, req, 404, "Property not found")
+
+    body = encode(envelope(True, "Property retrieved successfully", format_property(prop)))
+    # legacy docs without timestamps fall back to a body hash
+    etag = routes.property_etag(prop) or hashlib.sha1(body).hexdigest()
+    cache.property_cache.set(cache_key, (body, etag))
+    await _send(send, req, 200, body, etag)
+
+
+# handler -> the Flask endpoint it stands in for (metrics labels, admission caps)
+ENDPOINTS = {
+    list_properties: "properties.list_properties",
+    search_properties: "properties.search_properties",
+    get_property: "properties.get_property",
+}
+
+
+# GET path -> handler, or None when Flask should answer
+def _route(path):
+    if path in (PREFIX, PREFIX + "/"):
+        return list_properties, ()
+    if not path.startswith(PREFIX + "/"):
+        return None
+    rest = path[len(PREFIX) + 1:].rstrip("/")
+    if rest == "search":
+        return search_properties, ()
+    if rest and "/" not in rest:
+        return get_property, (rest,)
+    return None
+
+
+# admission (all async reads are browse), then the handler; an unreachable
+# Mongo is a 503 like extensions.database_unavailable
+async def _serve(req, send, handler, params):
+    endpoint = ENDPOINTS[handler]
+    admitted = admission.controller.enabled
+    if admitted:
+        client = admission.client_key((req.scope.get("client") or (None,))[0], req.access_route())
+        try:
+            admission.controller.admit(endpoint, admission.BROWSE, client,
+                                       admission.queued_seconds(req.headers.get("x-request-start")))
+        except admission.Shed as e:
+            return await _send(send, req, e.status, encode({"Error": admission.shed_message(e)}),
+                               retry_after=e.retry_after)
+    try:
+        await handler(req, send, *params)
+    except errors.ConnectionFailure as e:
+        log.warning("MongoDB unavailable: %s", e)
+        await _send(send, req, 503, encode({"Error": "Database unavailable"}), retry_after=1)
+    finally:
+        if admitted:
+            admission.controller.release(endpoint)
+
+
+# _serve plus the request metrics the Flask hooks would record
+async def _serve_timed(req, send, handler, params):
+    status, size = [500], [0]
+
+    async def recording_send(message):
+        if message["type"] == "http.response.start":
+            status[0] = message["status"]
+        elif message["type"] == "http.response.body":
+            size[0] += len(message.get("body", b""))
+        await send(message)
+
+    timing, token = metrics.start_timing()
+    start = time.perf_counter()
+    try:
+        await _serve(req, recording_send, handler, params)
+    finally:
+        metrics.observe_request(ENDPOINTS[handler], req.scope["method"], status[0],
+                                time.perf_counter() - start, timing, size[0])
+        metrics.stop_timing(token)
+
+
+def create_asgi_app(flask_app, threads=None):
+    global encode
+    threads = threads or int(os.environ.get("ASGI_WSGI_THREADS", 16))
+    wsgi = WSGIMiddleware(flask_app, workers=threads)
+    # create_app already read METRICS_ENABLED / ADMISSION_ENABLED
+    serve = _serve_timed if metrics.enabled else _serve
+    encode = metrics.timed_encode(response_body) if metrics.enabled else response_body
+
+    async def asgi_app(scope, receive, send):
+        if scope["type"] == "lifespan":
+            while True:
+                message = await receive()
+                if message["type"] == "lifespan.startup":
+                    connect()
+                    await send({"type": "lifespan.startup.complete"})
+                elif message["type"] == "lifespan.shutdown":
+                    await close()
+                    ext.shutdown()
+                    await send({"type": "lifespan.shutdown.complete"})
+                    return
+
+        route = _route(scope["path"]) if scope["type"] == "http" and scope["method"] == "GET" else None
+        if route is None:
+            return await wsgi(scope, receive, send)
+        if db is None:
+            connect()
+        handler, params = route
+        await serve(Request(scope), send, handler, params)
+
+    return asgi_app
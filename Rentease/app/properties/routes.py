@@ -1,71 +1,176 @@
 ﻿# Properties routes - CRUD for rental properties
-from flask import Blueprint, request, jsonify, make_response
+from flask import Blueprint, Response, request
 from bson import ObjectId
+from pymongo import ReturnDocument, errors
 from datetime import datetime
+import base64
+import hashlib
+import json
 import app.extensions as ext
+import app.cache as cache
+import app.blobstore as blobs
+import app.derivatives as derivatives
+import app.geo as geo
+import app.stats as stats
+from app.stats import PRICE_BUCKETS
+from app.images.routes import store_uploads
+from app.authz import role_required, current_user_id, current_role
+from app.serialize import get_data, api_response, format_property
 
 properties_app = Blueprint("properties", __name__)
 
-# helper to get request data
-def get_data():
-    return request.get_json() if request.is_json else request.form
-
-# helper to create api response
-def api_response(success, message, data=None, status_code=200):
-    response = {"success": success, "message": message}
-    if data is not None:
-        response["data"] = data
-    return make_response(jsonify(response), status_code)
-
-# format property for frontend
-def format_property(doc):
-    return {
-        "_id": str(doc["_id"]),
-        "title": doc.get("title", ""),
-        "description": doc.get("description", ""),
-        "type": doc.get("property_type", "apartment"),
-        "status": "available" if doc.get("available", True) else "rented",
-        "price": doc.get("price", 0),
-        "bedrooms": doc.get("bedrooms", 1),
-        "bathrooms": doc.get("bathrooms", 1),
-        "square_feet": doc.get("area", 0),
-        "location": {
-            "address": doc.get("location", ""),
-            "city": doc.get("location", ""),
-            "state": "",
-            "country": "UK",
-            "zip_code": "",
-            "latitude": 0,
-            "longitude": 0
-        },
-        "amenities": doc.get("amenities", []),
-        "images": doc.get("images", []),
-        "agent_id": doc.get("agent_id", ""),
-        "created_at": doc.get("createdAt", datetime.utcnow().isoformat()),
-        "updated_at": doc.get("updatedAt", datetime.utcnow().isoformat())
-    }
+# paging defaults for the list endpoint
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
 
+# radius search defaults (km)
+DEFAULT_RADIUS_KM = 10
+MAX_RADIUS_KM = 200
 
-# GET / - list all properties
-@properties_app.route("/", methods=["GET"])
-def list_properties():
-    if ext.db is None:
-        return api_response(False, "Database not connected", status_code=500)
-    
-    coll = ext.db["biz"]
+# sort keys allowed for cursor paging (request value -> stored field)
+SORT_KEYS = {"_id": "_id", "price": "price", "createdAt": "createdAt", "created_at": "createdAt",
+             "favorites": "favorite_count"}
+
+# output field -> stored field, used to push fields= down into the query
+FIELD_MAP = {
+    "_id": "_id",
+    "title": "title",
+    "description": "description",
+    "type": "property_type",
+    "status": "available",
+    "price": "price",
+    "bedrooms": "bedrooms",
+    "bathrooms": "bathrooms",
+    "square_feet": "area",
+    "location": "location",
+    "latitude": "geo",
+    "longitude": "geo",
+    "amenities": "amenities",
+    "images": "images",
+    "thumbnail": "images",
+    "agent_id": "agent_id",
+    "favorite_count": "favorite_count",
+    "created_at": "createdAt",
+    "updated_at": "updatedAt"
+}
+
+# serve a cached response body
+def cached_response(body, etag=None, weak=False):
+    return with_etag(Response(body, status=200, mimetype="application/json"), etag, weak)
+
+# attach a validator; no-cache makes clients revalidate instead of reusing blindly
+def with_etag(resp, etag, weak=False):
+    if etag:
+        resp.set_etag(etag, weak=weak)
+        resp.headers["Cache-Control"] = "no-cache"
+    return resp
+
+# If-None-Match always uses weak comparison
+def etag_matches(etag):
+    return bool(etag) and request.if_none_match.contains_weak(etag)
+
+def not_modified(etag, weak=False):
+    return with_etag(Response(status=304), etag, weak)
+
+# strong validator for one property - changes whenever updatedAt is bumped,
+# or favorite_count moves (favoriting leaves updatedAt alone)
+ETAG_PROJECTION = {"updatedAt": 1, "createdAt": 1, "favorite_count": 1}
+
+def property_etag(doc):
+    stamp = doc.get("updatedAt") or doc.get("createdAt")
+    if stamp is None:
+        return None
+    if isinstance(stamp, datetime):
+        stamp = stamp.isoformat()
+    raw = f"{doc['_id']}:{stamp}:{doc.get('favorite_count', 0)}"
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+# weak validator for a listing page, from the rendered body - the page query
+# is bounded by limit, unlike a count/max over the whole filter
+def page_etag(body):
+    return hashlib.sha1(body).hexdigest()
+
+# parse fields= into output names, ignoring anything we don't know
+def _parse_fields(raw):
+    if not raw:
+        return None
+    fields = {f.strip() for f in raw.split(",") if f.strip() in FIELD_MAP}
+    fields.add("_id")
+    return fields
+
+
+# build a mongo projection for the requested output fields
+# list rows only need the first image reference
+def _projection(fields, sort_key):
+    if not fields:
+        return {"images": {"$slice": 1}}
+    proj = {FIELD_MAP[f]: 1 for f in fields}
+    if "location" in fields:
+        proj["geo"] = 1
+    proj[sort_key] = 1  # needed to build the next cursor
+    if "images" in proj:
+        proj["images"] = {"$slice": 1}
+    return proj
+
+
+# cursor is base64 json of the last row's sort value and _id
+def _encode_cursor(sort_key, order, doc):
+    value = doc.get(sort_key)
+    if isinstance(value, datetime):
+        value = {"$date": value.isoformat()}
+    elif isinstance(value, ObjectId):
+        value = str(value)
+    payload = {"k": sort_key, "o": order, "v": value, "id": str(doc["_id"])}
+    raw = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def _decode_cursor(cursor):
+    padded = cursor + "=" * (-len(cursor) % 4)
+    payload = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+    value = payload["v"]
+    if isinstance(value, dict) and "$date" in value:
+        value = datetime.fromisoformat(value["$date"])
+    if payload["k"] == "_id":
+        value = ObjectId(value)
+    return payload["k"], payload["o"], value, ObjectId(payload["id"])
+
+
+# keyset condition: rows strictly after (value, _id) in the sort order
+def _after_cursor(sort_key, order, value, last_id):
+    op = "$gt" if order == 1 else "$lt"
+    if sort_key == "_id":
+        return {"_id": {op: last_id}}
+    return {"$or": [
+        {sort_key: {op: value}},
+        {sort_key: value, "_id": {op: last_id}}
+    ]}
+
+
+# keep image bytes out of property documents - store them, keep references
+def _image_refs(images):
+    if not isinstance(images, list):
+        raise blobs.BlobError("images must be a list")
+    return [blobs.to_image_ref(blobs.blob_store, i) for i in images]
+
+
+# filters shared by the list and search endpoints
+def _filter_query(args):
     query = {"type": "property"}
+    district = args.get("district")
+    city = args.get("city")
+    prop_type = args.get("type")
+    min_price = args.get("price_min", type=int)
+    max_price = args.get("price_max", type=int)
+    bedrooms = args.get("bedrooms", type=int)
+    amenities = [a for a in args.getlist("amenities") if a]
 
-    # apply filters
-    district = request.args.get("district")
-    city = request.args.get("city")
-    prop_type = request.args.get("type")
-    min_price = request.args.get("price_min", type=int)
-    max_price = request.args.get("price_max", type=int)
-
-    if district:
-        query["location"] = district
-    if city:
-        query["location"] = city
+    # location is one free-text field, so district and city both match it
+    locations = [v for v in (district, city) if v]
+    if len(locations) == 1:
+        query["location"] = locations[0]
+    elif locations:
+        query["location"] = {"$in": locations}
     if prop_type:
         query["property_type"] = prop_type
     if min_price is not None or max_price is not None:
@@ -74,10 +179,257 @@ def list_properties():
             query["price"]["$gte"] = min_price
         if max_price is not None:
             query["price"]["$lte"] = max_price
+    if bedrooms is not None:
+        query["bedrooms"] = {"$gte": bedrooms}
+    if amenities:
+        query["amenities"] = {"$all": amenities}
+
+    # bbox=minLng,minLat,maxLng,maxLat
+    bbox = args.get("bbox")
+    if bbox:
+        min_lng, min_lat, max_lng, max_lat = [float(v) for v in bbox.split(",")]
+        ring = [[min_lng, min_lat], [max_lng, min_lat], [max_lng, max_lat],
+                [min_lng, max_lat], [min_lng, min_lat]]
+        query["geo"] = {"$geoWithin": {"$geometry": {"type": "Polygon", "coordinates": [ring]}}}
+    return query
+
+
+# lat/lng/radius_km -> (point, radius in metres), None when not a radius search
+def _near_params(args):
+    lat = args.get("lat", type=float)
+    lng = args.get("lng", type=float)
+    if lat is None or lng is None:
+        return None
+    radius = args.get("radius_km", DEFAULT_RADIUS_KM, type=float)
+    radius = max(0.1, min(radius, MAX_RADIUS_KM))
+    return {"type": "Point", "coordinates": [lng, lat]}, radius * 1000
+
+
+# nearest first, keyset-paged on (distance, _id) like the other sorts
+def _find_near(coll, query, near, fields, limit, after=None):
+    return list(coll.aggregate(_near_pipeline(query, near, fields, limit, after)))
+
+
+def _near_pipeline(query, near, fields, limit, after=None):
+    point, radius_m = near
+    geo_near = {"near": point, "distanceField": "distance", "maxDistance": radius_m,
+                "query": query, "spherical": True, "key": "geo"}
+    pipeline = [{"$geoNear": geo_near}, {"$sort": {"distance": 1, "_id": 1}}]
+    if after is not None:
+        distance, last_id = after
+        geo_near["minDistance"] = distance
+        pipeline.append({"$match": {"$or": [
+            {"distance": {"$gt": distance}},
+            {"distance": distance, "_id": {"$gt": last_id}}
+        ]}})
+    pipeline.append({"$limit": limit})
+
+    first_image = {"$slice": [{"$ifNull": ["$images", []]}, 1]}
+    if fields:
+        proj = {FIELD_MAP[f]: 1 for f in fields}
+        proj.update({"distance": 1, "geo": 1})
+        if "images" in proj:
+            proj["images"] = first_image
+        pipeline.append({"$project": proj})
+    else:
+        pipeline.append({"$addFields": {"images": first_image}})
+    return pipeline
+
+
+# list request args -> everything needed to run and answer it
+# raises ValueError with the message for a 400
+def list_plan(args):
+    try:
+        query = _filter_query(args)
+        near = _near_params(args)
+    except ValueError:
+        raise ValueError("Invalid filter value")
+
+    # paging params
+    limit = args.get("limit", DEFAULT_PAGE_SIZE, type=int)
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    if near:
+        # radius searches are always nearest first
+        sort_key, order = "distance", 1
+    else:
+        sort_key = SORT_KEYS.get(args.get("sort_by", "_id"))
+        if sort_key is None:
+            raise ValueError("Invalid sort_by")
+        order = -1 if args.get("sort_order", "asc") == "desc" else 1
+
+    after = None
+    cursor = args.get("cursor")
+    if cursor:
+        try:
+            c_key, c_order, c_value, c_id = _decode_cursor(cursor)
+        except Exception:
+            raise ValueError("Invalid cursor")
+        if c_key != sort_key or c_order != order:
+            raise ValueError("Cursor does not match sort")
+        after = (c_value, c_id)
+
+    return {"query": query, "near": near, "limit": limit, "sort_key": sort_key, "order": order,
+            "fields": _parse_fields(args.get("fields")), "after": after}
 
-    docs = list(coll.find(query))
-    properties = [format_property(d) for d in docs]
-    return api_response(True, "Properties retrieved successfully", properties)
+
+# ("aggregate", pipeline) or ("find", filter, projection, sort, limit) for a plan
+# one extra row is fetched to know if there is a next page
+def list_query(plan):
+    if plan["near"]:
+        return "aggregate", _near_pipeline(plan["query"], plan["near"], plan["fields"],
+                                           plan["limit"] + 1, plan["after"])
+    query, sort_key, order = plan["query"], plan["sort_key"], plan["order"]
+    if plan["after"] is not None:
+        query = {"$and": [query, _after_cursor(sort_key, order, *plan["after"])]}
+    sort = [(sort_key, order)] if sort_key == "_id" else [(sort_key, order), ("_id", order)]
+    return "find", query, _projection(plan["fields"], sort_key), sort, plan["limit"] + 1
+
+
+# fetched rows -> (formatted page, meta)
+def list_page(plan, docs):
+    limit = plan["limit"]
+    has_next = len(docs) > limit
+    docs = docs[:limit]
+    meta = {
+        "limit": limit,
+        "has_next": has_next,
+        "next_cursor": _encode_cursor(plan["sort_key"], plan["order"], docs[-1]) if has_next else None
+    }
+    return [format_property(d, plan["fields"], view="list") for d in docs], meta
+
+
+# GET / - list all properties
+@properties_app.route("/", methods=["GET"])
+def list_properties():
+    if ext.db is None:
+        return api_response(False, "Database not connected", status_code=500)
+    
+    cache_key = cache.property_cache.list_key(request.args)
+    cached = cache.property_cache.get(cache_key)
+    if cached is not None:
+        body, etag = cached
+        if etag_matches(etag):
+            return not_modified(etag, weak=True)
+        return cached_response(body, etag, weak=True)
+
+    coll = ext.db["biz"]
+    try:
+        plan = list_plan(request.args)
+    except ValueError as e:
+        return api_response(False, str(e), status_code=400)
+
+    kind, *spec = list_query(plan)
+    if kind == "aggregate":
+        docs = list(coll.aggregate(spec[0]))
+    else:
+        query, projection, sort, limit = spec
+        docs = list(coll.find(query, projection).sort(sort).limit(limit))
+
+    properties, meta = list_page(plan, docs)
+    resp = api_response(True, "Properties retrieved successfully", properties, meta=meta)
+    etag = page_etag(resp.get_data())
+    cache.property_cache.set(cache_key, (resp.get_data(), etag))
+    if etag_matches(etag):
+        return not_modified(etag, weak=True)
+    return with_etag(resp, etag, weak=True)
+
+
+# search request args -> (pipeline, keywords, page, limit)
+# one aggregation returns the page, the total and every facet
+def search_plan(args):
+    try:
+        match = _filter_query(args)
+    except ValueError:
+        raise ValueError("Invalid filter value")
+    keywords = (args.get("q") or args.get("query") or "").strip()
+    if keywords:
+        match["$text"] = {"$search": keywords}
+
+    limit = max(1, min(args.get("limit", DEFAULT_PAGE_SIZE, type=int), MAX_PAGE_SIZE))
+    page = max(1, args.get("page", 1, type=int))
+
+    # list rows only need the first image; score is the text relevance
+    trim = {"images": {"$slice": [{"$ifNull": ["$images", []]}, 1]}}
+    if keywords:
+        trim["score"] = {"$meta": "textScore"}
+        sort = {"score": -1, "_id": 1}
+    else:
+        sort = {"_id": 1}
+
+    pipeline = [
+        {"$match": match},
+        {"$facet": {
+            "results": [{"$addFields": trim}, {"$sort": sort},
+                        {"$skip": (page - 1) * limit}, {"$limit": limit}],
+            "total": [{"$count": "n"}],
+            "types": [{"$group": {"_id": "$property_type", "count": {"$sum": 1}}},
+                      {"$sort": {"count": -1}}],
+            "locations": [{"$group": {"_id": "$location", "count": {"$sum": 1}}},
+                          {"$sort": {"count": -1}}, {"$limit": 20}],
+            "prices": [{"$bucket": {"groupBy": "$price", "boundaries": PRICE_BUCKETS,
+                                    "default": "other", "output": {"count": {"$sum": 1}}}}]
+        }}
+    ]
+    return pipeline, keywords, page, limit
+
+
+# the $facet output -> (formatted page, meta)
+def search_page(out, keywords, page, limit):
+    total = out["total"][0]["n"] if out["total"] else 0
+    properties = []
+    for d in out["results"]:
+        row = format_property(d, view="list")
+        if keywords:
+            row["score"] = round(d.get("score", 0), 4)
+        properties.append(row)
+
+    meta = {
+        "page": page,
+        "limit": limit,
+        "total_items": total,
+        "has_next": page * limit < total,
+        "facets": {
+            "types": [{"value": f["_id"], "count": f["count"]} for f in out["types"]],
+            "locations": [{"value": f["_id"], "count": f["count"]} for f in out["locations"]],
+            "price": [_price_bucket(f) for f in out["prices"]]
+        }
+    }
+    return properties, meta
+
+
+# GET /search - keyword search with facet counts
+@properties_app.route("/search", methods=["GET"])
+def search_properties():
+    if ext.db is None:
+        return api_response(False, "Database not connected", status_code=500)
+
+    cache_key = cache.property_cache.list_key(request.args, kind="search")
+    cached = cache.property_cache.get(cache_key)
+    if cached is not None:
+        return cached_response(cached[0])
+
+    coll = ext.db["biz"]
+    try:
+        pipeline, keywords, page, limit = search_plan(request.args)
+    except ValueError as e:
+        return api_response(False, str(e), status_code=400)
+    try:
+        out = list(coll.aggregate(pipeline))[0]
+    except errors.OperationFailure as e:
+        return api_response(False, "Search failed: " + str(e), status_code=400)
+
+    properties, meta = search_page(out, keywords, page, limit)
+    resp = api_response(True, "Search results", properties, meta=meta)
+    cache.property_cache.set(cache_key, (resp.get_data(), None))
+    return resp
+
+
+# {"_id": 500, "count": 3} -> {"min": 500, "max": 1000, "count": 3}
+def _price_bucket(f):
+    if f["_id"] == "other":
+        return {"min": PRICE_BUCKETS[-1], "max": None, "count": f["count"]}
+    i = PRICE_BUCKETS.index(f["_id"])
+    return {"min": f["_id"], "max": PRICE_BUCKETS[i + 1], "count": f["count"]}
 
 
 # GET /<id> - get single property
@@ -92,11 +444,32 @@ def get_property(prop_id):
     except Exception:
         return api_response(False, "Invalid property ID", status_code=400)
 
+    cache_key = cache.property_cache.detail_key(str(oid))
+    cached = cache.property_cache.get(cache_key)
+    if cached is not None:
+        body, etag = cached
+        if etag_matches(etag):
+            return not_modified(etag)
+        return cached_response(body, etag)
+
+    # conditional request: check the validator before loading the full doc
+    if request.if_none_match:
+        stamp = coll.find_one({"_id": oid, "type": "property"}, ETAG_PROJECTION)
+        etag = property_etag(stamp) if stamp else None
+        if etag_matches(etag):
+            return not_modified(etag)
+
     prop = coll.find_one({"_id": oid, "type": "property"})
     if not prop:
         return api_response(False, "Property not found", status_code=404)
 
-    return api_response(True, "Property retrieved successfully", format_property(prop))
+    resp = api_response(True, "Property retrieved successfully", format_property(prop))
+    etag = property_etag(prop)
+    if etag is None:
+        # legacy docs without timestamps fall back to a body hash
+        etag = hashlib.sha1(resp.get_data()).hexdigest()
+    cache.property_cache.set(cache_key, (resp.get_data(), etag))
+    return with_etag(resp, etag)
 
 
 # POST / - add new property
@@ -118,19 +491,26 @@ def add_property():
     except (ValueError, TypeError):
         return api_response(False, "Price must be a number", status_code=400)
 
+    try:
+        images = _image_refs(data.get("images", []))
+    except blobs.BlobError as e:
+        return api_response(False, str(e), status_code=400)
+
     new_doc = {
         "type": "property",
         "title": title,
         "description": data.get("description", ""),
         "price": price,
         "location": location,
+        "geo": geo.geocode(location),
         "property_type": data.get("type", "apartment"),
         "bedrooms": data.get("bedrooms", 1),
         "bathrooms": data.get("bathrooms", 1),
         "area": data.get("area", 0),
         "amenities": data.get("amenities", []),
-        "images": data.get("images", []),
+        "images": images,
         "available": data.get("available", True),
+        "favorite_count": 0,
         "agent_id": data.get("agent_id", ""),
         "createdAt": datetime.utcnow(),
         "updatedAt": datetime.utcnow()
@@ -138,6 +518,9 @@ def add_property():
     coll = ext.db["biz"]
     res = coll.insert_one(new_doc)
     new_doc["_id"] = res.inserted_id
+    cache.property_cache.invalidate_property(res.inserted_id)
+    stats.property_created(new_doc)
+    derivatives.enqueue(images)
     return api_response(True, "Property added successfully", format_property(new_doc), status_code=201)
 
 
@@ -166,17 +549,29 @@ def update_property(prop_id):
                     update_data[key] = int(data[key])
                 except (ValueError, TypeError):
                     return api_response(False, "Price must be a number", status_code=400)
+            elif key == "images":
+                try:
+                    update_data[key] = _image_refs(data[key])
+                except blobs.BlobError as e:
+                    return api_response(False, str(e), status_code=400)
             else:
                 update_data[key] = data[key]
 
     if len(update_data) == 1:
         return api_response(False, "No valid fields to update", status_code=400)
+    if "location" in update_data:
+        update_data["geo"] = geo.geocode(update_data["location"])
 
-    res = coll.update_one({"_id": oid, "type": "property"}, {"$set": update_data})
-    if res.matched_count == 0:
+    # old version back in the same round trip - feeds the stats counters
+    before = coll.find_one_and_update({"_id": oid, "type": "property"}, {"$set": update_data},
+                                      return_document=ReturnDocument.BEFORE)
+    if before is None:
         return api_response(False, "Property not found", status_code=404)
+    cache.property_cache.invalidate_property(oid)
+    updated_prop = dict(before, **update_data)
+    stats.property_updated(before, updated_prop)
+    derivatives.enqueue(update_data.get("images", []))
     
-    updated_prop = coll.find_one({"_id": oid})
     return api_response(True, "Property updated successfully", format_property(updated_prop))
 
 
@@ -193,7 +588,48 @@ def delete_property(prop_id):
     except Exception:
         return api_response(False, "Invalid property ID", status_code=400)
 
-    res = coll.delete_one({"_id": oid, "type": "property"})
-    if res.deleted_count == 0:
+    res = coll.find_one_and_delete({"_id": oid, "type": "property"}, projection={"available": 1, "agent_id": 1, "price": 1})
+    if res is None:
         return api_response(False, "Property not found", status_code=404)
+    cache.property_cache.invalidate_property(oid)
+    stats.property_deleted(res)
     return api_response(True, "Property deleted successfully")
+
+
+# POST /<id>/images - upload images and attach them to a property
+# agents can only add to their own listings, admins to any
+@properties_app.route("/<string:prop_id>/images", methods=["POST"])
+@role_required("agent", "admin")
+def add_property_images(prop_id):
+    if ext.db is None:
+        return api_response(False, "Database not connected", status_code=500)
+
+    coll = ext.db["biz"]
+    try:
+        oid = ObjectId(prop_id)
+    except Exception:
+        return api_response(False, "Invalid property ID", status_code=400)
+
+    # checked before storing so a non-owner can't fill the blob store
+    query = {"_id": oid, "type": "property"}
+    if current_role() != "admin":
+        query["agent_id"] = current_user_id()
+    if coll.count_documents(query, limit=1) == 0:
+        return api_response(False, "Property not found or not owner", status_code=404)
+
+    try:
+        refs = store_uploads()
+    except blobs.BlobError as e:
+        return api_response(False, str(e), status_code=400)
+    if not refs:
+        return api_response(False, "No images uploaded", status_code=400)
+
+    res = coll.update_one(
+        query,
+        {"$push": {"images": {"$each": refs}}, "$set": {"updatedAt": datetime.utcnow()}}
+    )
+    if res.matched_count == 0:
+        return api_response(False, "Property not found or not owner", status_code=404)
+    cache.property_cache.invalidate_property(oid)
+    derivatives.enqueue(refs)
+    return api_response(True, "Images uploaded successfully", [blobs.image_url(r) for r in refs], status_code=201)
@@ -0,0 +1,182 @@
+﻿# Serialization - one JSON encoder for the whole app plus the document
+# schemas the blueprints respond with
+from flask import request, jsonify, make_response
+from flask.json.provider import DefaultJSONProvider
+from bson import ObjectId
+from datetime import date, datetime, timedelta
+import json
+import app.blobstore as blobs
+import app.geo as geo
+
+try:
+    import orjson
+except ImportError:  # orjson is optional - the stdlib encoder is used without it
+    orjson = None
+
+# stored datetimes are naive UTC - say so, or browsers read them as local time
+ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_NAIVE_UTC | orjson.OPT_UTC_Z if orjson else 0
+
+
+# ISO 8601 with an explicit UTC "Z" (same output as orjson with ORJSON_OPTIONS)
+def iso_utc(value):
+    if not isinstance(value, datetime):
+        return value.isoformat()
+    if value.tzinfo is None or value.utcoffset() == timedelta(0):
+        return value.replace(tzinfo=None).isoformat() + "Z"
+    return value.isoformat()
+
+
+# ObjectId -> hex string, datetimes -> ISO 8601 UTC
+def _default(value):
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, (datetime, date)):
+        return iso_utc(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(obj):
+    if orjson is not None:
+        return orjson.dumps(obj, default=_default, option=ORJSON_OPTIONS)
+    return json.dumps(obj, default=_default, separators=(",", ":")).encode("utf-8")
+
+
+# bytes of a JSON response, as jsonify() sends them
+def response_body(obj):
+    return dumps(obj) + b"\n"
+
+
+def loads(data):
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+# app.json - jsonify(), get_json() and friends all go through dumps/loads
+class JSONProvider(DefaultJSONProvider):
+    def dumps(self, obj, **kwargs):
+        return dumps(obj).decode("utf-8")
+
+    def loads(self, s, **kwargs):
+        return loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(response_body(obj), mimetype=self.mimetype)
+
+
+def init_json(app):
+    app.json_provider_class = JSONProvider
+    app.json = JSONProvider(app)
+    app.logger.info("JSON encoder: %s", "orjson" if orjson else "stdlib")
+
+
+# --- request / response helpers ------------------------------------------
+
+def get_data():
+    return request.get_json() if request.is_json else request.form
+
+# {"success", "message", "data"?, "meta"?} envelope
+def envelope(success, message, data=None, meta=None):
+    response = {"success": success, "message": message}
+    if data is not None:
+        response["data"] = data
+    if meta is not None:
+        response["meta"] = meta
+    return response
+
+def api_response(success, message, data=None, status_code=200, meta=None):
+    return make_response(jsonify(envelope(success, message, data, meta)), status_code)
+
+
+# --- schemas -------------------------------------------------------------
+
+# whitelist of stored fields; also gives the matching find() projection
+class Schema:
+    def __init__(self, *fields):
+        self.fields = fields
+        self.projection = {f: 1 for f in fields}
+
+    def __call__(self, doc):
+        return {k: doc[k] for k in self.fields if k in doc}
+
+    def many(self, docs):
+        return [self(d) for d in docs]
+
+
+PROPERTY_DOC = Schema("_id", "type", "title", "description", "price", "location", "property_type",
+                      "bedrooms", "bathrooms", "area", "amenities", "images", "available", "agent_id",
+                      "favorite_count", "createdAt", "updatedAt")
+FAVORITE = Schema("_id", "type", "user_id", "property_id", "createdAt")
+INQUIRY = Schema("_id", "type", "user_id", "property_id", "message", "createdAt")
+
+
+# booking document -> API shape (timestamps renamed like properties)
+def format_booking(doc):
+    out = {k: v for k, v in doc.items() if k not in ("createdAt", "updatedAt")}
+    out["_id"] = str(doc["_id"])
+    out["total_guests"] = doc.get("number_of_guests", len(doc.get("guests", [])))
+    out["created_at"], out["updated_at"] = doc.get("createdAt"), doc.get("updatedAt")
+    return out
+
+
+# (output name, stored name, default) for the plain fields of the API shape
+PROPERTY_FIELDS = (
+    ("title", "title", ""),
+    ("description", "description", ""),
+    ("type", "property_type", "apartment"),
+    ("price", "price", 0),
+    ("bedrooms", "bedrooms", 1),
+    ("bathrooms", "bathrooms", 1),
+    ("square_feet", "area", 0),
+    ("amenities", "amenities", []),
+    ("agent_id", "agent_id", ""),
+    ("favorite_count", "favorite_count", 0),
+)
+
+
+# list rows carry one thumbnail instead of every full-size image
+def _list_images(images):
+    return [blobs.variant_url(images[0], "thumb")] if images else []
+
+# detail view gets full-size images plus their variants
+def _image_variants(images):
+    return [{
+        "original": blobs.image_url(i),
+        "webp": blobs.variant_url(i, "webp"),
+        "thumb": blobs.variant_url(i, "thumb")
+    } for i in images]
+
+
+# property document -> API shape; view="list" trims images to a thumbnail,
+# fields limits the output to the requested names
+def format_property(doc, fields=None, view="detail"):
+    out = {"_id": str(doc["_id"])}
+    for name, key, default in PROPERTY_FIELDS:
+        out[name] = doc.get(key, default)
+    out["status"] = "available" if doc.get("available", True) else "rented"
+
+    address = doc.get("location", "")
+    lat, lng = geo.lat_lng(doc.get("geo"))
+    out["location"] = {"address": address, "city": address, "state": "", "country": "UK",
+                       "zip_code": "", "latitude": lat, "longitude": lng}
+
+    images = doc.get("images", [])
+    if view == "list":
+        out["images"] = _list_images(images)
+        out["thumbnail"] = out["images"][0] if out["images"] else None
+    else:
+        out["images"] = [blobs.image_url(i) for i in images]
+        out["image_variants"] = _image_variants(images)
+
+    created, updated = doc.get("createdAt"), doc.get("updatedAt")
+    if created is None or updated is None:  # legacy docs without timestamps
+        now = datetime.utcnow()
+        created, updated = created or now, updated or now
+    out["created_at"], out["updated_at"] = created, updated
+
+    if "distance" in doc:
+        out["distance_km"] = round(doc["distance"] / 1000, 3)
+    if fields:
+        return {k: v for k, v in out.items() if k in fields or k == "distance_km"}
+    return out
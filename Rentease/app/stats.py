@@ -0,0 +1,233 @@
+﻿# Stats - admin statistics from one aggregation, plus an optional
+# materialized counters document that write paths keep up to date
+#   python -m app.stats --reconcile   (rebuild the counters document)
+#   python -m app.stats --favorites   (dedupe favorites, recount favorite_count)
+from bson import ObjectId
+from pymongo import UpdateOne
+from datetime import datetime
+import logging
+import os
+import sys
+import threading
+import time
+import app.extensions as ext
+
+log = logging.getLogger(__name__)
+
+# price bands shared with the search facets
+PRICE_BUCKETS = [0, 500, 1000, 1500, 2000, 3000, 5000]
+TOP_AGENTS = 20
+COUNTERS_ID = "counters"
+
+enabled = False
+reconcile_interval = 3600
+
+
+# "500" for 500 <= price < 1000, "other" past the last edge
+def price_bucket(price):
+    if not isinstance(price, (int, float)) or price < PRICE_BUCKETS[0]:
+        return "other"
+    label = "other"
+    for edge in PRICE_BUCKETS:
+        if price >= edge:
+            label = str(edge)
+    return "other" if label == str(PRICE_BUCKETS[-1]) else label
+
+
+def _agent_key(agent_id):
+    return str(agent_id) if agent_id else "_none"
+
+
+# everything the dashboard shows, in a single pass over biz
+def aggregate_stats(db):
+    out = list(db["biz"].aggregate([
+        {"$facet": {
+            "types": [{"$group": {"_id": "$type", "count": {"$sum": 1}}}],
+            "available": [{"$match": {"type": "property", "available": {"$ne": False}}}, {"$count": "n"}],
+            "agents": [{"$match": {"type": "property"}},
+                       {"$group": {"_id": "$agent_id", "count": {"$sum": 1}}}],
+            "prices": [{"$match": {"type": "property"}},
+                       {"$bucket": {"groupBy": "$price", "boundaries": PRICE_BUCKETS,
+                                    "default": "other", "output": {"count": {"$sum": 1}}}}]
+        }}
+    ]))[0]
+    return {
+        "counts": {t["_id"]: t["count"] for t in out["types"] if t["_id"]},
+        "available": out["available"][0]["n"] if out["available"] else 0,
+        "agents": {_agent_key(a["_id"]): a["count"] for a in out["agents"]},
+        "prices": {str(p["_id"]): p["count"] for p in out["prices"]}
+    }
+
+
+def read_counters(db):
+    doc = db["stats"].find_one({"_id": COUNTERS_ID})
+    if doc is None:
+        doc = reconcile(db)
+    return doc
+
+
+# dashboard response shape, from either source
+def format_stats(raw):
+    counts = raw.get("counts", {})
+    properties = counts.get("property", 0)
+    agents = sorted(((k, v) for k, v in raw.get("agents", {}).items() if v > 0),
+                    key=lambda kv: kv[1], reverse=True)[:TOP_AGENTS]
+    prices = []
+    for i, edge in enumerate(PRICE_BUCKETS[:-1]):
+        prices.append({"min": edge, "max": PRICE_BUCKETS[i + 1], "count": raw.get("prices", {}).get(str(edge), 0)})
+    prices.append({"min": PRICE_BUCKETS[-1], "max": None, "count": raw.get("prices", {}).get("other", 0)})
+    return {
+        "users": counts.get("user", 0),
+        "properties": properties,
+        "favorites": counts.get("favorite", 0),
+        "inquiries": counts.get("inquiry", 0),
+        "available": raw.get("available", 0),
+        "availability_ratio": round(raw.get("available", 0) / properties, 4) if properties else 0,
+        "listings_per_agent": [{"agent_id": k, "count": v} for k, v in agents],
+        "price_distribution": prices
+    }
+
+
+# --- materialized counters ---------------------------------------------
+
+def _apply(inc):
+    inc = {k: v for k, v in inc.items() if v}
+    if not enabled or not inc or ext.db is None:
+        return
+    # no upsert: until the first reconcile builds the document there is
+    # nothing correct to increment
+    ext.db["stats"].update_one({"_id": COUNTERS_ID}, {"$inc": inc})
+
+
+def _property_inc(doc, sign):
+    return {
+        "counts.property": sign,
+        "available": sign if doc.get("available", True) is not False else 0,
+        "agents." + _agent_key(doc.get("agent_id")): sign,
+        "prices." + price_bucket(doc.get("price")): sign
+    }
+
+
+def property_created(doc):
+    _apply(_property_inc(doc, 1))
+
+
+def property_deleted(doc):
+    if doc:
+        _apply(_property_inc(doc, -1))
+
+
+# before/after of one update - only fields that moved end up in the $inc
+def property_updated(before, after):
+    inc = _property_inc(before, -1)
+    for key, value in _property_inc(after, 1).items():
+        inc[key] = inc.get(key, 0) + value
+    _apply(inc)
+
+
+# bulk writes - one $inc for the whole batch
+def properties_created(docs):
+    inc = {}
+    for doc in docs:
+        for key, value in _property_inc(doc, 1).items():
+            inc[key] = inc.get(key, 0) + value
+    _apply(inc)
+
+
+def properties_updated(pairs):
+    inc = {}
+    for before, after in pairs:
+        for key, value in _property_inc(before, -1).items():
+            inc[key] = inc.get(key, 0) + value
+        for key, value in _property_inc(after, 1).items():
+            inc[key] = inc.get(key, 0) + value
+    _apply(inc)
+
+
+# favorites, inquiries, users
+def bump(doc_type, delta=1):
+    _apply({"counts." + doc_type: delta})
+
+
+# rebuild the counters document from the data
+def reconcile(db):
+    doc = aggregate_stats(db)
+    doc["reconciledAt"] = datetime.utcnow()
+    db["stats"].replace_one({"_id": COUNTERS_ID}, doc, upsert=True)
+    doc["_id"] = COUNTERS_ID
+    return doc
+
+
+# per-property favorite_count from the favorites themselves; also drops
+# duplicate favorites left over from before the unique index existed
+def reconcile_favorites(db):
+    coll = db["biz"]
+    groups = coll.aggregate([
+        {"$match": {"type": "favorite"}},
+        {"$group": {"_id": {"u": "$user_id", "p": "$property_id"}, "ids": {"$push": "$_id"}}}
+    ], allowDiskUse=True)
+    counts, extra = {}, []
+    for g in groups:
+        counts[g["_id"]["p"]] = counts.get(g["_id"]["p"], 0) + 1
+        extra.extend(g["ids"][1:])
+    if extra:
+        coll.delete_many({"_id": {"$in": extra}})
+    coll.update_many({"type": "property"}, {"$set": {"favorite_count": 0}})
+    ops = []
+    for pid, n in counts.items():
+        try:
+            ops.append(UpdateOne({"_id": ObjectId(pid), "type": "property"}, {"$set": {"favorite_count": n}}))
+        except Exception:
+            pass
+    for i in range(0, len(ops), 1000):
+        coll.bulk_write(ops[i:i + 1000], ordered=False)
+    return {"duplicates_removed": len(extra), "properties_counted": len(ops)}
+
+
+_reconciler_pid = None
+
+
+def _reconcile_loop():
+    while True:
+        time.sleep(reconcile_interval)
+        try:
+            if ext.db is not None:
+                reconcile(ext.db)
+        except Exception as e:
+            log.warning("Stats reconcile failed: %s", e)
+
+
+# started lazily so it runs in the serving process (and again after a fork)
+def ensure_reconciler():
+    global _reconciler_pid
+    if not enabled or _reconciler_pid == os.getpid():
+        return
+    _reconciler_pid = os.getpid()
+    threading.Thread(target=_reconcile_loop, name="stats-reconcile", daemon=True).start()
+
+
+def init_stats(app):
+    global enabled, reconcile_interval
+    app.config.setdefault("STATS_COUNTERS", os.environ.get("STATS_COUNTERS", "0") == "1")
+    app.config.setdefault("STATS_RECONCILE_SECONDS", int(os.environ.get("STATS_RECONCILE_SECONDS", 3600)))
+    enabled = app.config["STATS_COUNTERS"]
+    reconcile_interval = app.config["STATS_RECONCILE_SECONDS"]
+
+
+def main(argv=None):
+    from pymongo import MongoClient
+    from .extensions import MONGO_URI, DB_NAME
+    argv = sys.argv[1:] if argv is None else argv
+    if "--reconcile" not in argv and "--favorites" not in argv:
+        print("usage: python -m app.stats [--reconcile] [--favorites]")
+        return 1
+    db = MongoClient(MONGO_URI, serverSelectionTimeoutMS=5000)[DB_NAME]
+    if "--favorites" in argv:  # first, so the counters see the deduplicated favorites
+        print("Favorites", reconcile_favorites(db))
+    if "--reconcile" in argv:
+        print("Reconciled", format_stats(reconcile(db)))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
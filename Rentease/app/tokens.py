@@ -0,0 +1,70 @@
+﻿# Refresh tokens - opaque random tokens stored only as SHA-256 hashes
+# Each refresh rotates the token; presenting an already-used token means it
+# leaked, so the whole family (every token from that login) is revoked
+from datetime import datetime, timedelta
+import hashlib
+import os
+import secrets
+import uuid
+import app.extensions as ext
+
+DEFAULT_REFRESH_DAYS = 30
+
+
+class TokenError(Exception):
+    pass
+
+
+def _hash(raw):
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _ttl():
+    return timedelta(days=int(os.environ.get("REFRESH_TOKEN_DAYS", DEFAULT_REFRESH_DAYS)))
+
+
+# create and store a new refresh token, returns the raw value for the client
+def issue(user_id, family_id=None):
+    raw = secrets.token_urlsafe(32)
+    now = datetime.utcnow()
+    ext.db["refresh_tokens"].insert_one({
+        "token_hash": _hash(raw),
+        "user_id": user_id,
+        "family_id": family_id or uuid.uuid4().hex,
+        "used": False,
+        "revoked": False,
+        "createdAt": now,
+        "expires_at": now + _ttl()
+    })
+    return raw
+
+
+# swap a refresh token for a new one, returns (user_id, new raw token)
+def rotate(raw):
+    coll = ext.db["refresh_tokens"]
+    token_hash = _hash(raw)
+    # atomic claim - of two concurrent refreshes with the same token only one wins
+    doc = coll.find_one_and_update(
+        {"token_hash": token_hash, "used": False, "revoked": False,
+         "expires_at": {"$gt": datetime.utcnow()}},
+        {"$set": {"used": True, "used_at": datetime.utcnow()}}
+    )
+    if doc is None:
+        seen = coll.find_one({"token_hash": token_hash}, {"family_id": 1, "used": 1})
+        if seen and seen.get("used"):
+            # reuse of a rotated token - kill every token from that login
+            revoke_family(seen["family_id"])
+            raise TokenError("Refresh token reuse detected")
+        raise TokenError("Invalid or expired refresh token")
+    return doc["user_id"], issue(doc["user_id"], doc["family_id"])
+
+
+def revoke_family(family_id):
+    ext.db["refresh_tokens"].update_many({"family_id": family_id}, {"$set": {"revoked": True}})
+
+
+# revoke the family a raw token belongs to (logout)
+def revoke(raw):
+    doc = ext.db["refresh_tokens"].find_one({"token_hash": _hash(raw)}, {"family_id": 1})
+    if doc:
+        revoke_family(doc["family_id"])
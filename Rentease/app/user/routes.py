@@ -1,22 +1,30 @@
 ﻿# User routes - favorites and inquiries
-from flask import Blueprint, request, jsonify, make_response
-from flask_jwt_extended import jwt_required, get_jwt
+from flask import Blueprint, current_app, request, jsonify, make_response
+from bson import ObjectId
+from pymongo import UpdateOne, DeleteOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from datetime import datetime
 import app.extensions as ext
+import app.cache as cache
+import app.stats as stats
+from app.serialize import get_data, format_property, FAVORITE, INQUIRY
+from app.authz import role_required, current_user_id
 
 user_app = Blueprint("user", __name__)
 
-# helper to get request data
-def get_data():
-    return request.get_json() if request.is_json else request.form
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+EXPAND_VALUES = ("1", "true", "property")
+MAX_BATCH = 500
 
 # get current user id from token
 def _uid():
-    return get_jwt().get("user_id")
+    return current_user_id()
 
 
 # POST /favorites - add to favorites
 @user_app.route("/favorites", methods=["POST"])
-@jwt_required()
+@role_required()
 def add_favorite():
     if ext.db is None:
         return make_response(jsonify({"Error": "Database not connected"}), 500)
@@ -26,35 +34,32 @@ def add_favorite():
     if not pid:
         return make_response(jsonify({"Error": "property_id required"}), 400)
 
-    coll = ext.db["biz"]
-    
-    # check if already favorited
-    existing = coll.find_one({"type": "favorite", "user_id": _uid(), "property_id": pid})
-    if existing:
+    # one upsert on the unique (user_id, property_id) key - a repeat or a
+    # concurrent double-click matches the existing doc instead of adding one
+    try:
+        res = ext.db["biz"].update_one(*_favorite_upsert(_uid(), pid), upsert=True)
+        created = res.upserted_id is not None
+    except DuplicateKeyError:  # lost the race to a concurrent upsert
+        created = False
+    if not created:
         return make_response(jsonify({"msg": "Already in favorites"}), 200)
-    
-    fav = {"type": "favorite", "user_id": _uid(), "property_id": pid}
-    coll.insert_one(fav)
+    _count_favorites({pid: 1})
     return make_response(jsonify({"msg": "Added to favorites"}), 201)
 
 
 # GET /favorites - list favorites
 @user_app.route("/favorites", methods=["GET"])
-@jwt_required()
+@role_required()
 def list_favorites():
     if ext.db is None:
         return make_response(jsonify({"Error": "Database not connected"}), 500)
     
-    coll = ext.db["biz"]
-    docs = list(coll.find({"type": "favorite", "user_id": _uid()}))
-    for d in docs:
-        d["_id"] = str(d["_id"])
-    return make_response(jsonify(docs), 200)
+    return _list_user_docs("favorite", FAVORITE)
 
 
 # DELETE /favorites/<id> - remove favorite
 @user_app.route("/favorites/<string:property_id>", methods=["DELETE"])
-@jwt_required()
+@role_required()
 def remove_favorite(property_id):
     if ext.db is None:
         return make_response(jsonify({"Error": "Database not connected"}), 500)
@@ -63,12 +68,68 @@ def remove_favorite(property_id):
     res = coll.delete_one({"type": "favorite", "user_id": _uid(), "property_id": property_id})
     if res.deleted_count == 0:
         return make_response(jsonify({"Error": "Favorite not found"}), 404)
+    _count_favorites({property_id: -1})
     return make_response(jsonify({"msg": "Removed from favorites"}), 200)
 
 
+# POST /favorites/batch - sync a client's saved list in one request
+# {"add": [...], "remove": [...]} or {"set": [...]} to make the stored list
+# exactly that; property ids in, per-id result out
+@user_app.route("/favorites/batch", methods=["POST"])
+@role_required()
+def batch_favorites():
+    if ext.db is None:
+        return make_response(jsonify({"Error": "Database not connected"}), 500)
+
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return make_response(jsonify({"Error": "Expected a JSON object"}), 400)
+    lists = {k: data.get(k, []) for k in ("add", "remove", "set")}
+    if not all(isinstance(v, list) and all(isinstance(i, str) and i for i in v) for v in lists.values()):
+        return make_response(jsonify({"Error": "add, remove and set must be lists of property ids"}), 400)
+
+    coll = ext.db["biz"]
+    uid = _uid()
+    add, remove = list(dict.fromkeys(lists["add"])), list(dict.fromkeys(lists["remove"]))
+    if "set" in data:
+        wanted = list(dict.fromkeys(lists["set"]))
+        current = [d["property_id"] for d in coll.find({"type": "favorite", "user_id": uid}, {"property_id": 1})]
+        have, keep = set(current), set(wanted)
+        add = [pid for pid in wanted if pid not in have]
+        remove = [pid for pid in current if pid not in keep]
+    else:
+        adding = set(add)
+        remove = [pid for pid in remove if pid not in adding]
+        # only the removes that exist get a DeleteOne, so the counters stay exact
+        remove = [d["property_id"] for d in coll.find(
+            {"type": "favorite", "user_id": uid, "property_id": {"$in": remove}}, {"property_id": 1})] if remove else []
+    if len(add) + len(remove) > MAX_BATCH:
+        return make_response(jsonify({"Error": f"At most {MAX_BATCH} changes per request"}), 400)
+
+    ops = [UpdateOne(*_favorite_upsert(uid, pid), upsert=True) for pid in add]
+    ops += [DeleteOne({"type": "favorite", "user_id": uid, "property_id": pid}) for pid in remove]
+    added = set()
+    if ops:
+        try:
+            res = coll.bulk_write(ops, ordered=False)
+            added = {add[i] for i in res.upserted_ids}
+        except BulkWriteError as e:
+            # a concurrent upsert of the same favorite hits the unique index
+            # (11000) - that one is "unchanged", anything else is a real error
+            if any(err.get("code") != 11000 for err in e.details.get("writeErrors", [])):
+                raise
+            added = {add[u["index"]] for u in e.details.get("upserted", [])}
+    _count_favorites(dict({pid: 1 for pid in added}, **{pid: -1 for pid in remove}))
+    return make_response(jsonify({
+        "added": sorted(added),
+        "removed": remove,
+        "unchanged": [pid for pid in add if pid not in added]
+    }), 200)
+
+
 # POST /inquiries - send inquiry
 @user_app.route("/inquiries", methods=["POST"])
-@jwt_required()
+@role_required()
 def send_inquiry():
     if ext.db is None:
         return make_response(jsonify({"Error": "Database not connected"}), 500)
@@ -82,18 +143,88 @@ def send_inquiry():
     coll = ext.db["biz"]
     inquiry = {"type": "inquiry", "user_id": _uid(), "property_id": pid, "message": msg}
     coll.insert_one(inquiry)
+    stats.bump("inquiry")
     return make_response(jsonify({"msg": "Inquiry sent"}), 201)
 
 
 # GET /inquiries - list inquiries
 @user_app.route("/inquiries", methods=["GET"])
-@jwt_required()
+@role_required()
 def list_inquiries():
     if ext.db is None:
         return make_response(jsonify({"Error": "Database not connected"}), 500)
     
+    return _list_user_docs("inquiry", INQUIRY)
+
+
+# property_id strings -> list-view properties, in one $in query
+# ids that don't parse or whose property was deleted are simply absent
+def _properties_by_id(pids):
+    oids = {}
+    for pid in pids:
+        try:
+            oids[ObjectId(pid)] = pid
+        except Exception:
+            pass
+    if not oids:
+        return {}
+    found = ext.db["biz"].find({"_id": {"$in": list(oids)}, "type": "property"}, {"images": {"$slice": 1}})
+    return {oids[p["_id"]]: format_property(p, view="list") for p in found}
+
+
+# {"data", "meta"} paged newest first (limit, cursor); ?expand=1 also puts
+# each referenced property inline - null when it has been deleted
+def _list_user_docs(doc_type, schema):
     coll = ext.db["biz"]
-    docs = list(coll.find({"type": "inquiry", "user_id": _uid()}))
-    for d in docs:
-        d["_id"] = str(d["_id"])
-    return make_response(jsonify(docs), 200)
+    query = {"type": doc_type, "user_id": _uid()}
+    limit = request.args.get("limit", DEFAULT_PAGE_SIZE, type=int)
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    cursor = request.args.get("cursor")
+    if cursor:
+        try:
+            query["_id"] = {"$lt": ObjectId(cursor)}
+        except Exception:
+            return make_response(jsonify({"Error": "Bad cursor"}), 400)
+
+    docs = schema.many(coll.find(query, schema.projection).sort("_id", -1).limit(limit + 1))
+    has_next = len(docs) > limit
+    docs = docs[:limit]
+    if request.args.get("expand") in EXPAND_VALUES:
+        props = _properties_by_id(d.get("property_id") for d in docs)
+        for d in docs:
+            d["property"] = props.get(d.get("property_id"))
+    meta = {"limit": limit, "has_next": has_next, "next_cursor": str(docs[-1]["_id"]) if has_next else None}
+    return make_response(jsonify({"data": docs, "meta": meta}), 200)
+
+
+# (filter, update) for an idempotent favorite upsert
+def _favorite_upsert(uid, pid):
+    key = {"type": "favorite", "user_id": uid, "property_id": pid}
+    return key, {"$setOnInsert": dict(key, createdAt=datetime.utcnow())}
+
+
+# {property_id: +1/-1} -> admin counters plus each property's favorite_count
+# favoriting is the hottest write, so it leaves updatedAt and the shared
+# cache invalidation alone: only this worker's detail entries are dropped
+# (the detail ETag covers favorite_count). Lists and other workers show the
+# new count once their entries expire (PROPERTY_CACHE_TTL)
+def _count_favorites(deltas):
+    deltas = {pid: d for pid, d in deltas.items() if d}
+    if not deltas:
+        return
+    stats.bump("favorite", sum(deltas.values()))
+    ops, pids = [], []
+    for pid, delta in deltas.items():
+        try:
+            ops.append(UpdateOne({"_id": ObjectId(pid), "type": "property"}, {"$inc": {"favorite_count": delta}}))
+            pids.append(pid)
+        except Exception:
+            pass  # not a property id - nothing to count against
+    if not ops:
+        return
+    try:
+        ext.db["biz"].bulk_write(ops, ordered=False)
+    except BulkWriteError as e:
+        # counts that didn't apply are fixed by python -m app.stats --favorites
+        current_app.logger.warning("favorite_count update failed: %s", e.details.get("writeErrors"))
+    cache.property_cache.drop_details(pids)
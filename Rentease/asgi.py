@@ -0,0 +1,6 @@
+﻿# ASGI entry point - async property reads, everything else via the Flask app
+#   uvicorn asgi:app --host 0.0.0.0 --port 5000 --workers 4
+from app import create_app
+from app.properties.aio import create_asgi_app
+
+app = create_asgi_app(create_app())
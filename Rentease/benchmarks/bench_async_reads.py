@@ -0,0 +1,142 @@
+﻿# Benchmark - browse throughput with hundreds of simultaneous clients
+#   python -m benchmarks.bench_async_reads --base-url http://127.0.0.1:5000 --clients 500 --duration 20
+# Each client holds one keep-alive connection and loops over list, search
+# and detail requests. Run it against gunicorn (gunicorn -c gunicorn.conf.py
+# run:app) and against the async app (uvicorn asgi:app) with the same
+# workers and data. Clients are asyncio tasks, so 500+ cost one process.
+from urllib.parse import urlsplit
+import argparse
+import asyncio
+import json
+import time
+
+PATHS = ["/api/v1/properties/?limit=20", "/api/v1/properties/search?limit=20",
+         "/api/v1/properties/?limit=20&sort_by=price&sort_order=desc"]
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+class Connection:
+    def __init__(self, host, port):
+        self.host, self.port = host, port
+        self.reader = self.writer = None
+
+    async def get(self, path):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        self.writer.write(f"GET {path} HTTP/1.1\r\nHost: {self.host}:{self.port}\r\n"
+                          f"Accept-Encoding: identity\r\n\r\n".encode("latin-1"))
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionError("closed")
+        status = int(status_line.split()[1])
+        length, chunked, close = 0, False, False
+        while True:
+            line = await self.reader.readline()
+            if line in (b"\r\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            name, value = name.strip().lower(), value.strip().lower()
+            if name == "content-length":
+                length = int(value)
+            elif name == "transfer-encoding" and "chunked" in value:
+                chunked = True
+            elif name == "connection" and value == "close":
+                close = True
+        body = b""
+        if chunked:
+            while True:
+                size = int((await self.reader.readline()).split(b";")[0], 16)
+                body += (await self.reader.readexactly(size + 2))[:-2]
+                if size == 0:
+                    break
+        else:
+            body = await self.reader.readexactly(length)
+        if close:
+            self.close()
+        return status, body
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+
+async def run(base_url, clients, duration, warmup=2.0):
+    url = urlsplit(base_url)
+    host, port = url.hostname, url.port or 80
+    times, statuses, errors = [], {}, 0
+    recording = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + warmup + duration
+
+    # mix in detail requests for a few properties from the first page
+    conn = Connection(host, port)
+    try:
+        status, body = await conn.get(PATHS[0])
+    finally:
+        conn.close()
+    rows = json.loads(body).get("data", []) if status == 200 else []
+    paths = PATHS + [f"/api/v1/properties/{row['_id']}" for row in rows[:5]]
+
+    async def client(n):
+        nonlocal errors
+        c = Connection(host, port)
+        i = n
+        while loop.time() < deadline:
+            path = paths[i % len(paths)]
+            i += 1
+            start = time.perf_counter()
+            try:
+                status, _ = await c.get(path)
+            except (OSError, ConnectionError, asyncio.IncompleteReadError, ValueError):
+                c.close()
+                if recording.is_set():
+                    errors += 1
+                await asyncio.sleep(0.05)
+                continue
+            took = time.perf_counter() - start
+            if recording.is_set():
+                statuses[status] = statuses.get(status, 0) + 1
+                if status == 200:
+                    times.append(took)
+        c.close()
+
+    tasks = [asyncio.create_task(client(n)) for n in range(clients)]
+    await asyncio.sleep(warmup)
+    recording.set()
+    started = time.perf_counter()
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - started
+
+    ms = lambda v: round(v * 1000, 2)
+    return {
+        "base_url": base_url,
+        "clients": clients,
+        "duration_s": round(elapsed, 2),
+        "requests_per_s": round(len(times) / elapsed, 1),
+        "p50_ms": ms(percentile(times, 50)),
+        "p95_ms": ms(percentile(times, 95)),
+        "p99_ms": ms(percentile(times, 99)),
+        "statuses": statuses,
+        "connection_errors": errors
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--base-url", default="http://127.0.0.1:5000")
+    parser.add_argument("--clients", type=int, default=500)
+    parser.add_argument("--duration", type=float, default=20)
+    args = parser.parse_args()
+    result = asyncio.run(run(args.base_url.rstrip("/"), args.clients, args.duration))
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
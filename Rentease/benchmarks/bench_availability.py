@@ -0,0 +1,109 @@
+﻿# Benchmark - availability check latency for a property with a long history
+#   python -m benchmarks.bench_availability [--history 1000,5000,20000] [--checks 500]
+# Seeds back-to-back past bookings for one property per history size into a
+# separate database (MONGO_DB, default rentease_bench) on MONGO_URI, then
+# times the overlap query the bookings routes use, with the property_interval
+# index and forced to a collection scan.
+from datetime import datetime, timedelta
+import argparse
+import json
+import os
+import random
+import statistics
+import time
+
+STAY = timedelta(days=3)
+
+
+def seed(coll, pid, history):
+    if coll.count_documents({"property_id": pid}) >= history:
+        return
+    coll.delete_many({"property_id": pid})
+    start = datetime(2030, 1, 1) - STAY * history
+    batch = []
+    for i in range(history):
+        check_in = start + STAY * i
+        batch.append({"property_id": pid, "user_id": f"user-{i % 500}", "check_in_date": check_in,
+                      "check_out_date": check_in + STAY, "status": "cancelled" if i % 10 == 0 else "confirmed",
+                      "guests": [], "number_of_guests": 2, "total_price": 240, "createdAt": check_in})
+        if len(batch) == 5000:
+            coll.insert_many(batch, ordered=False)
+            batch = []
+    if batch:
+        coll.insert_many(batch, ordered=False)
+
+
+def timed(run, checks):
+    samples = []
+    for _ in range(checks):
+        start = time.perf_counter()
+        run()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return {"p50_ms": round(statistics.median(samples), 3),
+            "p95_ms": round(samples[int(len(samples) * 0.95) - 1], 3)}
+
+
+def examined(coll, query, hint=None):
+    cursor = coll.find(query, {"check_in_date": 1, "check_out_date": 1})
+    if hint:
+        cursor = cursor.hint(hint)
+    stats = cursor.explain()["executionStats"]
+    return {"keys": stats["totalKeysExamined"], "docs": stats["totalDocsExamined"]}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--history", default="1000,5000,20000")
+    parser.add_argument("--checks", type=int, default=500)
+    args = parser.parse_args()
+    os.environ.setdefault("MONGO_DB", "rentease_bench")
+
+    from pymongo import MongoClient
+    import app.extensions as ext
+    from app.indexes import ensure_indexes
+    from app.bookings.routes import ACTIVE_STATUSES, _overlapping
+
+    uri = os.environ.get("MONGO_URI", "mongodb://127.0.0.1:27017/")
+    ext.db = MongoClient(uri)[os.environ["MONGO_DB"]]
+    ensure_indexes(ext.db)
+    coll = ext.db["bookings"]
+
+    rnd = random.Random(1)
+    results = []
+    for history in [int(n) for n in args.history.split(",")]:
+        pid = f"bench-property-{history}"
+        seed(coll, pid, history)
+        # upcoming stays: the range nobody has booked yet, like a real check
+        windows = []
+        for _ in range(args.checks):
+            start = datetime(2030, 1, 1) + timedelta(days=rnd.randint(0, 60))
+            windows.append((start, start + timedelta(days=rnd.randint(1, 14))))
+        it = iter(windows * 2)
+
+        def indexed():
+            start, end = next(it)
+            _overlapping(pid, start, end)
+
+        def scan():
+            start, end = next(it)
+            list(coll.find({"property_id": pid, "check_out_date": {"$gt": start}, "check_in_date": {"$lt": end},
+                            "status": {"$in": ACTIVE_STATUSES}}).hint([("$natural", 1)]))
+
+        start, end = windows[0]
+        query = {"property_id": pid, "check_out_date": {"$gt": start}, "check_in_date": {"$lt": end},
+                 "status": {"$in": ACTIVE_STATUSES}}
+        results.append({
+            "history": history,
+            "indexed": dict(timed(indexed, args.checks), examined=examined(coll, query)),
+            "collscan": dict(timed(scan, args.checks), examined=examined(coll, query, [("$natural", 1)]))
+        })
+
+    print(json.dumps(results, indent=2))
+    for r in results:
+        print(f"{r['history']:>7} bookings: indexed p95 {r['indexed']['p95_ms']:.2f} ms, "
+              f"collscan p95 {r['collscan']['p95_ms']:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+﻿# Benchmark - cold start of one app process, with Mongo up and with Mongo down
+#   python -m benchmarks.bench_cold_start [--runs 5] [--down-uri mongodb://127.0.0.1:1/]
+# Each run is a fresh interpreter (like a new worker): import the app,
+# create_app(), then the first /healthz and /readyz. With Mongo down the app
+# should still boot and answer /healthz straight away; /readyz says 503.
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+PROBE = r"""
+import json, time
+t0 = time.perf_counter()
+from app import create_app
+t1 = time.perf_counter()
+app = create_app()
+t2 = time.perf_counter()
+client = app.test_client()
+health = client.get("/healthz")
+t3 = time.perf_counter()
+ready = client.get("/readyz")
+t4 = time.perf_counter()
+print(json.dumps({"import_ms": (t1 - t0) * 1000, "create_app_ms": (t2 - t1) * 1000,
+                  "healthz_ms": (t3 - t2) * 1000, "readyz_ms": (t4 - t3) * 1000,
+                  "healthz": health.status_code, "readyz": ready.status_code}))
+"""
+
+
+def run_once(env):
+    start = time.perf_counter()
+    out = subprocess.run([sys.executable, "-c", PROBE], env=env, capture_output=True, text=True, timeout=120)
+    wall = (time.perf_counter() - start) * 1000
+    if out.returncode != 0:
+        raise SystemExit(out.stderr)
+    result = json.loads(out.stdout.strip().splitlines()[-1])
+    result["process_ms"] = wall
+    return result
+
+
+def summarize(runs):
+    keys = ("process_ms", "import_ms", "create_app_ms", "healthz_ms", "readyz_ms")
+    summary = {k: round(statistics.median(r[k] for r in runs), 1) for k in keys}
+    summary["healthz"] = sorted({r["healthz"] for r in runs})
+    summary["readyz"] = sorted({r["readyz"] for r in runs})
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--down-uri", default="mongodb://127.0.0.1:1/", help="a URI where nothing listens")
+    args = parser.parse_args()
+
+    base = dict(os.environ, PYTHONPATH=os.getcwd())
+    results = {}
+    for label, uri in (("mongo_up", base.get("MONGO_URI", "mongodb://127.0.0.1:27017/")), ("mongo_down", args.down_uri)):
+        env = dict(base, MONGO_URI=uri)
+        results[label] = summarize([run_once(env) for _ in range(args.runs)])
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+﻿# Benchmark - bytes and CPU per request for compressed property list pages
+#   python -m benchmarks.bench_compression [--pages 100,1000] [--repeat 20]
+# Builds list pages the way list_properties does (format_property + the
+# response envelope), then compresses each with every available encoding at
+# a few levels, including the ones app.compress uses for JSON (marked *).
+# CPU is process time per request, so it is what a worker thread pays.
+from flask import Flask
+import argparse
+import json
+import statistics
+import time
+import app.compress as compress
+import app.serialize as serialize
+from benchmarks.bench_serialize import make_doc
+
+LEVELS = {"gzip": [1, 6, 9], "br": [1, 4, 6, 11], "zstd": [1, 3, 9, 19]}
+
+
+def page_body(n):
+    app = Flask(__name__)
+    with app.test_request_context("/", base_url="http://localhost:5000"):
+        rows = [serialize.format_property(make_doc(i), view="list") for i in range(n)]
+        return serialize.response_body(serialize.envelope(True, "Properties retrieved successfully", rows))
+
+
+def cpu_ms(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.process_time()
+        fn()
+        samples.append((time.process_time() - start) * 1000)
+    return round(statistics.median(samples), 3)
+
+
+def run(sizes, repeat):
+    results = []
+    for n in sizes:
+        body = page_body(n)
+        page = {"items": n, "identity_bytes": len(body), "encodings": []}
+        for encoding in compress.ENCODINGS:
+            used = compress.LEVELS["application/json"][encoding]
+            for level in sorted(set(LEVELS[encoding] + [used])):
+                out = compress.compress(body, encoding, level)
+                page["encodings"].append({
+                    "encoding": encoding,
+                    "level": level,
+                    "default": level == used,
+                    "bytes": len(out),
+                    "ratio": round(len(body) / len(out), 1),
+                    "cpu_ms": cpu_ms(lambda: compress.compress(body, encoding, level), repeat)
+                })
+        results.append(page)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", default="100,1000")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    results = run([int(n) for n in args.pages.split(",")], args.repeat)
+    print(json.dumps(results, indent=2))
+    for page in results:
+        print(f"{page['items']} items, {page['identity_bytes']} bytes uncompressed")
+        for e in page["encodings"]:
+            mark = "*" if e["default"] else " "
+            print(f"  {e['encoding']:>4} {e['level']:>2}{mark} {e['bytes']:>9} bytes  {e['ratio']:>5}x  {e['cpu_ms']:>8} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+﻿# Benchmark - peak RSS of the admin property listing, buffered vs streamed
+#   python -m benchmarks.bench_export_memory --docs 100000
+# Seeds a separate database (MONGO_DB, default rentease_bench) on MONGO_URI,
+# then runs each mode in a fresh subprocess so peak RSS is measured per mode.
+from datetime import datetime
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+MODES = ["json", "ndjson", "csv"]
+
+
+def seed(db, count):
+    coll = db["biz"]
+    have = coll.count_documents({"type": "property"})
+    batch = []
+    for i in range(have, count):
+        batch.append({
+            "type": "property", "title": f"Bench property {i}", "price": 500 + i % 3000,
+            "location": "London", "property_type": "apartment", "bedrooms": 1 + i % 4,
+            "bathrooms": 1, "area": 600, "available": i % 5 != 0, "agent_id": f"agent-{i % 50}",
+            "description": "Spacious flat with a garden. " * 20, "images": [],
+            "createdAt": datetime.utcnow(), "updatedAt": datetime.utcnow()
+        })
+        if len(batch) == 5000:
+            coll.insert_many(batch, ordered=False)
+            batch = []
+    if batch:
+        coll.insert_many(batch, ordered=False)
+
+
+# child process: one request through the real app, report peak RSS
+def measure(mode):
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from flask_jwt_extended import create_access_token
+    from app import create_app
+
+    app = create_app()
+    with app.app_context():
+        token = create_access_token(identity="bench", additional_claims={"role": "admin", "user_id": "bench"})
+    client = app.test_client()
+    url = "/api/v1/admin/properties" + ("" if mode == "json" else f"?format={mode}")
+
+    start = time.perf_counter()
+    resp = client.get(url, headers={"Authorization": f"Bearer {token}"}, buffered=False)
+    first_byte = None
+    size = 0
+    for chunk in resp.response:
+        if first_byte is None:
+            first_byte = time.perf_counter() - start
+        size += len(chunk)
+    total = time.perf_counter() - start
+    # ru_maxrss is KiB on Linux
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(json.dumps({"mode": mode, "bytes": size, "first_byte_s": round(first_byte or total, 3),
+                      "total_s": round(total, 3), "peak_rss_mb": round(peak_mb, 1)}))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--docs", type=int, default=100000)
+    parser.add_argument("--mode", choices=MODES)
+    args = parser.parse_args()
+    os.environ.setdefault("MONGO_DB", "rentease_bench")
+
+    if args.mode:
+        measure(args.mode)
+        return
+
+    from pymongo import MongoClient
+    uri = os.environ.get("MONGO_URI", "mongodb://127.0.0.1:27017/")
+    seed(MongoClient(uri)[os.environ["MONGO_DB"]], args.docs)
+
+    results = []
+    for mode in MODES:
+        out = subprocess.run([sys.executable, "-m", "benchmarks.bench_export_memory", "--mode", mode],
+                             capture_output=True, text=True, check=True, env=os.environ.copy())
+        results.append(json.loads(out.stdout.strip().splitlines()[-1]))
+    print(json.dumps({"documents": args.docs, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
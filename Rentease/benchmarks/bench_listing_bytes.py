@@ -0,0 +1,117 @@
+﻿# Benchmark - bytes a client downloads for one listing page
+#   python -m benchmarks.bench_listing_bytes [--page-size 20] [--images 3]
+# Compares three layouts for the same synthetic page:
+#   base64   - images embedded in documents (before the blob store)
+#   urls     - image URLs, client loads the first full-size image per row
+#   thumbs   - list view with thumbnails from the derivative pipeline
+from bson import ObjectId
+from datetime import datetime
+from io import BytesIO
+import argparse
+import base64
+import json
+import random
+import tempfile
+import app.blobstore as blobs
+from app.derivatives import build_variants
+from app.serialize import format_property
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+
+# photo-like test image: gradient with noise so it doesn't compress to nothing
+def make_photo(seed, size=(1600, 1200)):
+    rnd = random.Random(seed)
+    img = Image.linear_gradient("L").resize(size).convert("RGB")
+    noise = Image.effect_noise(size, 40).convert("RGB")
+    img = Image.blend(img, noise, 0.3)
+    tint = Image.new("RGB", size, (rnd.randint(0, 255), rnd.randint(0, 255), rnd.randint(0, 255)))
+    img = Image.blend(img, tint, 0.3)
+    out = BytesIO()
+    img.save(out, format="JPEG", quality=85)
+    return out.getvalue()
+
+
+def make_doc(i, images):
+    return {
+        "_id": ObjectId(),
+        "type": "property",
+        "title": f"Property {i}",
+        "description": "A bright flat close to shops and transport. " * 5,
+        "price": 900 + i * 10,
+        "location": "London",
+        "property_type": "apartment",
+        "bedrooms": 2,
+        "bathrooms": 1,
+        "area": 650,
+        "amenities": ["wifi", "parking"],
+        "images": images,
+        "agent_id": "agent-1",
+        "createdAt": datetime(2024, 1, 1).isoformat(),
+        "updatedAt": datetime(2024, 1, 1).isoformat()
+    }
+
+
+def page_json_bytes(rows):
+    body = {"success": True, "message": "Properties retrieved successfully", "data": rows}
+    return len(json.dumps(body, default=str).encode("utf-8"))
+
+
+def run(page_size, images_per_doc):
+    photos = [make_photo(n) for n in range(page_size * images_per_doc)]
+    store = blobs.BlobStore(tempfile.mkdtemp())
+
+    base64_docs, ref_docs, first_full, first_thumb = [], [], 0, 0
+    for i in range(page_size):
+        mine = photos[i * images_per_doc:(i + 1) * images_per_doc]
+        base64_docs.append(make_doc(i, [
+            "data:image/jpeg;base64," + base64.b64encode(p).decode("ascii") for p in mine]))
+
+        refs = []
+        for p in mine:
+            ref = store.put(p)
+            variants = build_variants(p)
+            ref["variants"] = {name: store.put(data)["key"] for name, data in variants.items()}
+            refs.append(ref)
+        ref_docs.append(make_doc(i, refs))
+        first_full += len(mine[0])
+        first_thumb += len(build_variants(mine[0])["thumb"])
+
+    # before: old format_property output with images inlined
+    legacy = []
+    for d in base64_docs:
+        row = format_property(d)
+        row.pop("image_variants")
+        legacy.append(row)
+    base64_json = page_json_bytes(legacy)
+    url_json = page_json_bytes([format_property(d) for d in ref_docs])
+    thumb_json = page_json_bytes([format_property(d, view="list") for d in ref_docs])
+
+    return {
+        "page_size": page_size,
+        "images_per_property": images_per_doc,
+        "base64": {"json_bytes": base64_json, "image_bytes": 0, "total": base64_json},
+        "urls": {"json_bytes": url_json, "image_bytes": first_full, "total": url_json + first_full},
+        "thumbs": {"json_bytes": thumb_json, "image_bytes": first_thumb, "total": thumb_json + first_thumb},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--page-size", type=int, default=20)
+    parser.add_argument("--images", type=int, default=3)
+    args = parser.parse_args()
+    if Image is None:
+        raise SystemExit("Pillow is required for this benchmark")
+
+    result = run(args.page_size, args.images)
+    print(json.dumps(result, indent=2))
+    for name in ("base64", "urls", "thumbs"):
+        print(f"{name:>7}: {result[name]['total'] / 1024:,.0f} KiB per page")
+
+
+if __name__ == "__main__":
+    main()
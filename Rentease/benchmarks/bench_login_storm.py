@@ -0,0 +1,98 @@
+﻿# Benchmark - browse latency while a login storm hits the same server
+#   python -m benchmarks.bench_login_storm --base-url http://127.0.0.1:5000 \
+#       --email bench@example.com --password secret --login-clients 50
+# Run once with no storm (--login-clients 0) for the baseline. The account
+# must exist; 429 responses from the auth pool are counted, not failed.
+from concurrent.futures import ThreadPoolExecutor
+from urllib import request as urlrequest
+from urllib.error import HTTPError
+import argparse
+import json
+import statistics
+import threading
+import time
+
+
+def _call(url, body=None):
+    data = json.dumps(body).encode("utf-8") if body is not None else None
+    req = urlrequest.Request(url, data=data, headers={"Content-Type": "application/json"})
+    start = time.perf_counter()
+    try:
+        with urlrequest.urlopen(req, timeout=30) as resp:
+            resp.read()
+            status = resp.status
+    except HTTPError as e:
+        status = e.code
+    return status, time.perf_counter() - start
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def run(base_url, email, password, login_clients, browse_clients, duration):
+    stop = threading.Event()
+    browse, logins, statuses = [], [], {}
+    lock = threading.Lock()
+
+    def login_loop():
+        while not stop.is_set():
+            status, took = _call(f"{base_url}/auth/login", {"email": email, "password": password})
+            with lock:
+                logins.append(took)
+                statuses[status] = statuses.get(status, 0) + 1
+
+    def browse_loop():
+        while not stop.is_set():
+            status, took = _call(f"{base_url}/api/v1/properties/?limit=20")
+            if status == 200:
+                with lock:
+                    browse.append(took)
+
+    with ThreadPoolExecutor(max_workers=login_clients + browse_clients) as pool:
+        for _ in range(login_clients):
+            pool.submit(login_loop)
+        for _ in range(browse_clients):
+            pool.submit(browse_loop)
+        time.sleep(duration)
+        stop.set()
+
+    ms = lambda v: round(v * 1000, 2)
+    return {
+        "login_clients": login_clients,
+        "browse_clients": browse_clients,
+        "duration_s": duration,
+        "browse": {
+            "requests": len(browse),
+            "p50_ms": ms(percentile(browse, 50)),
+            "p95_ms": ms(percentile(browse, 95)),
+            "p99_ms": ms(percentile(browse, 99)),
+            "mean_ms": ms(statistics.mean(browse)) if browse else 0
+        },
+        "login": {
+            "requests": len(logins),
+            "p50_ms": ms(percentile(logins, 50)),
+            "statuses": statuses
+        }
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--base-url", default="http://127.0.0.1:5000")
+    parser.add_argument("--email", required=True)
+    parser.add_argument("--password", required=True)
+    parser.add_argument("--login-clients", type=int, default=50)
+    parser.add_argument("--browse-clients", type=int, default=5)
+    parser.add_argument("--duration", type=float, default=20)
+    args = parser.parse_args()
+    result = run(args.base_url.rstrip("/"), args.email, args.password,
+                 args.login_clients, args.browse_clients, args.duration)
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
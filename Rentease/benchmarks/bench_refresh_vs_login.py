@@ -0,0 +1,61 @@
+﻿# Benchmark - cost per request of /auth/refresh vs /auth/login
+#   python -m benchmarks.bench_refresh_vs_login --email you@example.com --password secret
+# Runs the two sequentially against a running server; each refresh uses the
+# token returned by the previous one, as a client would.
+from urllib import request as urlrequest
+import argparse
+import json
+import statistics
+import time
+
+
+def _post(url, body):
+    req = urlrequest.Request(url, data=json.dumps(body).encode("utf-8"),
+                             headers={"Content-Type": "application/json"})
+    start = time.perf_counter()
+    with urlrequest.urlopen(req, timeout=30) as resp:
+        data = json.loads(resp.read())
+    return data, time.perf_counter() - start
+
+
+def summarize(samples):
+    samples = sorted(samples)
+    return {
+        "requests": len(samples),
+        "mean_ms": round(statistics.mean(samples) * 1000, 2),
+        "p50_ms": round(samples[len(samples) // 2] * 1000, 2),
+        "p95_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))] * 1000, 2)
+    }
+
+
+def run(base_url, email, password, count):
+    logins = []
+    data = None
+    for _ in range(count):
+        data, took = _post(f"{base_url}/auth/login", {"email": email, "password": password})
+        logins.append(took)
+
+    refreshes = []
+    refresh_token = data["data"]["refresh_token"]
+    for _ in range(count):
+        data, took = _post(f"{base_url}/auth/refresh", {"refresh_token": refresh_token})
+        refresh_token = data["data"]["refresh_token"]
+        refreshes.append(took)
+
+    login, refresh = summarize(logins), summarize(refreshes)
+    return {"login": login, "refresh": refresh,
+            "speedup": round(login["mean_ms"] / max(refresh["mean_ms"], 0.001), 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--base-url", default="http://127.0.0.1:5000")
+    parser.add_argument("--email", required=True)
+    parser.add_argument("--password", required=True)
+    parser.add_argument("--count", type=int, default=50)
+    args = parser.parse_args()
+    print(json.dumps(run(args.base_url.rstrip("/"), args.email, args.password, args.count), indent=2))
+
+
+if __name__ == "__main__":
+    main()
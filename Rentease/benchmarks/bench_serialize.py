@@ -0,0 +1,121 @@
+﻿# Benchmark - format_property + JSON encode over synthetic documents
+#   python -m benchmarks.bench_serialize [--docs 10000] [--repeat 5]
+# Compares:
+#   legacy   - the old format_property (utcnow per field) + Flask's default encoder
+#   stdlib   - app.serialize.format_property + stdlib json fallback
+#   orjson   - app.serialize.format_property + orjson (when installed)
+from bson import ObjectId
+from datetime import datetime
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+import argparse
+import json
+import time
+import app.blobstore as blobs
+import app.geo as geo
+import app.serialize as serialize
+
+
+def make_doc(i):
+    ref = {"key": "%064x.jpg" % i, "content_type": "image/jpeg",
+           "variants": {"thumb": "%064x.webp" % (i + 1), "webp": "%064x.webp" % (i + 2)}}
+    doc = {
+        "_id": ObjectId(),
+        "type": "property",
+        "title": f"Property {i}",
+        "description": "A bright flat close to shops and transport. " * 3,
+        "price": 900 + i,
+        "location": "Camden, London",
+        "geo": geo.geocode("Camden, London"),
+        "property_type": "apartment",
+        "bedrooms": 2,
+        "bathrooms": 1,
+        "area": 650,
+        "amenities": ["wifi", "parking"],
+        "images": [ref, ref],
+        "agent_id": "agent-1",
+        "createdAt": datetime(2024, 1, 1, 12, 30),
+        "updatedAt": datetime(2024, 6, 1, 9, 15)
+    }
+    if i % 10 == 0:  # some legacy rows without timestamps
+        del doc["createdAt"], doc["updatedAt"]
+    return doc
+
+
+# format_property as it was before app.serialize
+def legacy_format(doc, view="list"):
+    images = doc.get("images", [])
+    lat, lng = geo.lat_lng(doc.get("geo"))
+    out = {
+        "_id": str(doc["_id"]),
+        "title": doc.get("title", ""),
+        "description": doc.get("description", ""),
+        "type": doc.get("property_type", "apartment"),
+        "status": "available" if doc.get("available", True) else "rented",
+        "price": doc.get("price", 0),
+        "bedrooms": doc.get("bedrooms", 1),
+        "bathrooms": doc.get("bathrooms", 1),
+        "square_feet": doc.get("area", 0),
+        "location": {"address": doc.get("location", ""), "city": doc.get("location", ""), "state": "",
+                     "country": "UK", "zip_code": "", "latitude": lat, "longitude": lng},
+        "amenities": doc.get("amenities", []),
+        "images": [blobs.variant_url(images[0], "thumb")] if images else [],
+        "agent_id": doc.get("agent_id", ""),
+        "created_at": doc.get("createdAt", datetime.utcnow().isoformat()),
+        "updated_at": doc.get("updatedAt", datetime.utcnow().isoformat())
+    }
+    out["thumbnail"] = out["images"][0] if out["images"] else None
+    return out
+
+
+def stdlib_dumps(obj):
+    return json.dumps(obj, default=serialize._default, separators=(",", ":")).encode("utf-8")
+
+
+def timed(fmt, encode, docs, repeat):
+    best = None
+    size = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        rows = [fmt(d) for d in docs]
+        mid = time.perf_counter()
+        body = encode({"success": True, "message": "Properties retrieved successfully", "data": rows})
+        end = time.perf_counter()
+        if best is None or end - start < best[0] + best[1]:
+            best = (mid - start, end - mid)
+        size = len(body)
+    return {"format_ms": round(best[0] * 1000, 1), "encode_ms": round(best[1] * 1000, 1),
+            "total_ms": round(sum(best) * 1000, 1), "bytes": size}
+
+
+def run(n, repeat):
+    app = Flask(__name__)
+    flask_default = DefaultJSONProvider(app)
+    docs = [make_doc(i) for i in range(n)]
+    list_view = lambda d: serialize.format_property(d, view="list")
+
+    results = {"docs": n}
+    with app.test_request_context("/", base_url="http://localhost:5000"):
+        results["legacy"] = timed(legacy_format, lambda o: flask_default.dumps(o).encode("utf-8"), docs, repeat)
+        results["stdlib"] = timed(list_view, stdlib_dumps, docs, repeat)
+        if serialize.orjson is not None:
+            results["orjson"] = timed(list_view, serialize.dumps, docs, repeat)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--docs", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    result = run(args.docs, args.repeat)
+    print(json.dumps(result, indent=2))
+    base = result["legacy"]["total_ms"]
+    for name in ("legacy", "stdlib", "orjson"):
+        if name in result:
+            print(f"{name:>7}: {result[name]['total_ms']:8.1f} ms  ({base / result[name]['total_ms']:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+﻿# Benchmark - throughput of one server under concurrent clients
+#   python -m benchmarks.bench_serving --base-url http://127.0.0.1:5000 --clients 32 --duration 20
+# Run it once against the dev server (python run.py) and once against
+# gunicorn (gunicorn -c gunicorn.conf.py run:app) with the same data.
+from concurrent.futures import ThreadPoolExecutor
+from urllib import request as urlrequest
+from urllib.error import HTTPError, URLError
+import argparse
+import json
+import threading
+import time
+
+PATHS = ["/api/v1/properties/?limit=20", "/api/v1/properties/?limit=20&sort_by=price", "/"]
+
+
+def _get(url):
+    start = time.perf_counter()
+    try:
+        with urlrequest.urlopen(url, timeout=30) as resp:
+            resp.read()
+            status = resp.status
+    except HTTPError as e:
+        status = e.code
+    except (URLError, OSError):
+        status = 0
+    return status, time.perf_counter() - start
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def run(base_url, clients, duration, warmup=2):
+    stop = threading.Event()
+    recording = threading.Event()
+    times, statuses = [], {}
+    lock = threading.Lock()
+
+    def loop(n):
+        i = n
+        while not stop.is_set():
+            status, took = _get(base_url + PATHS[i % len(PATHS)])
+            i += 1
+            if recording.is_set():
+                with lock:
+                    statuses[status] = statuses.get(status, 0) + 1
+                    if status == 200:
+                        times.append(took)
+
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        for n in range(clients):
+            pool.submit(loop, n)
+        time.sleep(warmup)
+        recording.set()
+        started = time.perf_counter()
+        time.sleep(duration)
+        elapsed = time.perf_counter() - started
+        stop.set()
+
+    ms = lambda v: round(v * 1000, 2)
+    return {
+        "base_url": base_url,
+        "clients": clients,
+        "duration_s": round(elapsed, 2),
+        "requests_per_s": round(len(times) / elapsed, 1),
+        "p50_ms": ms(percentile(times, 50)),
+        "p95_ms": ms(percentile(times, 95)),
+        "p99_ms": ms(percentile(times, 99)),
+        "statuses": statuses
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--base-url", default="http://127.0.0.1:5000")
+    parser.add_argument("--clients", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=20)
+    args = parser.parse_args()
+    print(json.dumps(run(args.base_url.rstrip("/"), args.clients, args.duration), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+﻿# Benchmark dataset - deterministic synthetic users, properties, favorites and inquiries
+#   python -m benchmarks.dataset --properties 5000 --users 500 --favorites 20000 --inquiries 5000 [--seed 42]
+# Writes to MONGO_DB (default rentease_bench) on MONGO_URI. The same volumes
+# and seed always give the same documents, so two runs see the same data.
+# Seeding is skipped when the database already holds that dataset.
+from datetime import datetime, timedelta
+import argparse
+import json
+import os
+import random
+import bcrypt
+import app.geo as geo
+from app.passwords import DEFAULT_ROUNDS
+
+PASSWORD = "bench-password"
+ADMIN_EMAIL = "admin@bench.local"
+DEFAULT_VOLUMES = {"properties": 5000, "users": 500, "favorites": 20000, "inquiries": 5000}
+AGENT_SHARE = 10  # one user in ten is an agent
+BATCH = 5000
+
+CITIES = [name.title() for name in list(geo.PLACES)[:20]]
+TYPES = ["apartment", "house", "studio", "flat", "villa"]
+AMENITIES = ["wifi", "parking", "garden", "balcony", "gym", "pool", "pets", "furnished", "dishwasher", "lift"]
+WORDS = ["bright", "spacious", "modern", "cosy", "quiet", "central", "renovated", "sunny", "period", "family"]
+EPOCH = datetime(2024, 1, 1)
+
+
+def _insert(coll, docs):
+    for i in range(0, len(docs), BATCH):
+        coll.insert_many(docs[i:i + BATCH], ordered=False)
+
+
+def _user(i, role, password_hash):
+    return {"email": ADMIN_EMAIL if role == "admin" else f"{role}{i}@bench.local", "password_hash": password_hash,
+            "first_name": role.title(), "last_name": str(i), "role": role, "phone": ""}
+
+
+def _property(rng, i, agent_id):
+    city = rng.choice(CITIES)
+    words = rng.sample(WORDS, 2)
+    created = EPOCH + timedelta(minutes=i)
+    return {
+        "type": "property",
+        "title": f"{words[0].title()} {words[1]} {rng.choice(TYPES)} in {city}",
+        "description": " ".join(rng.choice(WORDS) for _ in range(30)),
+        "location": city,
+        "property_type": rng.choice(TYPES),
+        "price": rng.randrange(400, 4000, 25),
+        "agent_id": agent_id,
+        "available": rng.random() > 0.1,
+        "bedrooms": rng.randint(1, 5),
+        "bathrooms": rng.randint(1, 3),
+        "area": rng.randint(25, 250),
+        "amenities": rng.sample(AMENITIES, rng.randint(0, 5)),
+        "favorite_count": 0,
+        "geo": geo.geocode(city),
+        "images": [],
+        "createdAt": created,
+        "updatedAt": created
+    }
+
+
+# (user index, property index) pairs without repeats
+def _pairs(rng, n, users, properties):
+    n = min(n, users * properties)
+    seen = set()
+    while len(seen) < n:
+        seen.add((rng.randrange(users), rng.randrange(properties)))
+    return sorted(seen)
+
+
+def _manifest(volumes, seed):
+    return {"volumes": dict(volumes), "seed": seed}
+
+
+def seed_db(db, volumes=None, seed=42, rounds=None, force=False):
+    volumes = dict(DEFAULT_VOLUMES, **(volumes or {}))
+    manifest = _manifest(volumes, seed)
+    current = db["bench_meta"].find_one({"_id": "dataset"}, {"_id": 0, "seededAt": 0})
+    if current == manifest and not force:
+        return False
+
+    for name in ("users", "biz", "stats", "bench_meta", "refresh_tokens", "blacklist"):
+        db[name].delete_many({})
+    rng = random.Random(seed)
+    # every user shares one password, so only one hash is computed; it is at
+    # the app's cost so logins are as slow as real ones
+    rounds = rounds or int(os.environ.get("BCRYPT_ROUNDS", DEFAULT_ROUNDS))
+    password_hash = bcrypt.hashpw(PASSWORD.encode(), bcrypt.gensalt(rounds))
+
+    users = [_user(i, "agent" if i % AGENT_SHARE == 0 else "customer", password_hash)
+             for i in range(max(1, volumes["users"]))]
+    users.append(_user(0, "admin", password_hash))
+    _insert(db["users"], users)
+    agents = [str(u["_id"]) for u in users if u["role"] == "agent"]
+    customers = [str(u["_id"]) for u in users if u["role"] == "customer"] or agents
+
+    props = [_property(rng, i, agents[i % len(agents)]) for i in range(volumes["properties"])]
+    favorites = _pairs(rng, volumes["favorites"], len(customers), len(props)) if props else []
+    for _, p in favorites:
+        props[p]["favorite_count"] += 1
+    _insert(db["biz"], props)
+    pids = [str(p["_id"]) for p in props]
+
+    docs = [{"type": "favorite", "user_id": customers[u], "property_id": pids[p],
+             "createdAt": EPOCH + timedelta(seconds=i)} for i, (u, p) in enumerate(favorites)]
+    if pids:
+        docs += [{"type": "inquiry", "user_id": rng.choice(customers), "property_id": rng.choice(pids),
+                  "message": " ".join(rng.choice(WORDS) for _ in range(12))} for _ in range(volumes["inquiries"])]
+    _insert(db["biz"], docs)
+
+    db["bench_meta"].replace_one({"_id": "dataset"}, dict(manifest, seededAt=datetime.utcnow()), upsert=True)
+    return True
+
+
+# ids and credentials the load scenarios pick from
+def load(db, sample=5000):
+    customers = list(db["users"].find({"role": "customer"}, {"email": 1}).limit(sample))
+    admin = db["users"].find_one({"role": "admin"}, {"email": 1})
+    return {
+        "property_ids": [str(d["_id"]) for d in db["biz"].find({"type": "property"}, {"_id": 1}).limit(sample)],
+        "customers": [(str(u["_id"]), u["email"]) for u in customers],
+        "admin_id": str(admin["_id"]) if admin else None,
+        "cities": CITIES,
+        "amenities": AMENITIES,
+        "words": WORDS,
+        "password": PASSWORD
+    }
+
+
+def volume_args(parser):
+    for name, default in DEFAULT_VOLUMES.items():
+        parser.add_argument(f"--{name}", type=int, default=default)
+    parser.add_argument("--seed", type=int, default=42)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    volume_args(parser)
+    parser.add_argument("--rounds", type=int, help="bcrypt rounds of the shared password (default BCRYPT_ROUNDS)")
+    parser.add_argument("--force", action="store_true", help="reseed even if the dataset is already there")
+    args = parser.parse_args()
+    os.environ.setdefault("MONGO_DB", "rentease_bench")
+    if os.environ["MONGO_DB"] == "rentease":
+        raise SystemExit("refusing to reseed the main database, set MONGO_DB")
+
+    from pymongo import MongoClient
+    from app.indexes import ensure_indexes
+
+    db = MongoClient(os.environ.get("MONGO_URI", "mongodb://127.0.0.1:27017/"))[os.environ["MONGO_DB"]]
+    ensure_indexes(db)
+    volumes = {name: getattr(args, name) for name in DEFAULT_VOLUMES}
+    seeded = seed_db(db, volumes, args.seed, args.rounds, args.force)
+    print(json.dumps({"database": db.name, "seeded": seeded, **_manifest(volumes, args.seed)}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
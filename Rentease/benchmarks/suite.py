@@ -0,0 +1,315 @@
+﻿# Benchmark suite - per-endpoint latency/throughput of the real app on a seeded dataset
+#   python -m benchmarks.suite run --out results.json [--clients 16] [--duration 10] [--scenarios list,detail]
+#   python -m benchmarks.suite compare baseline.json results.json [--threshold 10]
+# "run" seeds MONGO_DB (default rentease_bench, see benchmarks/dataset.py),
+# builds create_app() in this process and drives it with concurrent test
+# clients, one scenario at a time. --backend memory swaps MongoDB for
+# mongomock (pip install mongomock): good for comparing Python-side cost
+# between two commits, not for absolute numbers; search and favorite_add
+# are skipped there.
+# "compare" exits 1 when an endpoint got slower or lost throughput.
+from datetime import datetime
+from pymongo import errors
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import threading
+import time
+from benchmarks import dataset
+from benchmarks.bench_serving import percentile
+
+SORTS = ["_id", "price", "createdAt", "favorites"]
+WRITES = {"favorite_add"}
+NEEDS_MONGO = {"search", "favorite_add"}  # $text, and bulk_write on this pymongo, fail in mongomock
+
+
+def _customer(rng, ctx):
+    uid, email = rng.choice(ctx["customers"])
+    return uid, email, ctx["tokens"][uid]
+
+
+def list_page(rng, ctx):
+    return "GET", f"/api/v1/properties/?limit=20&sort_by={rng.choice(SORTS)}&sort_order=desc", None, None
+
+
+def list_filtered(rng, ctx):
+    low = rng.randrange(400, 3000, 100)
+    path = (f"/api/v1/properties/?limit=20&city={rng.choice(ctx['cities'])}"
+            f"&price_min={low}&price_max={low + 1000}&bedrooms={rng.randint(1, 3)}&sort_by=price")
+    return "GET", path, None, None
+
+
+def detail(rng, ctx):
+    return "GET", f"/api/v1/properties/{rng.choice(ctx['property_ids'])}", None, None
+
+
+def search(rng, ctx):
+    words = " ".join(rng.sample(ctx["words"], 2))
+    return "GET", f"/api/v1/properties/search?q={words}&limit=20", None, None
+
+
+def login(rng, ctx):
+    _, email, _ = _customer(rng, ctx)
+    return "POST", "/auth/login", {"email": email, "password": ctx["password"]}, None
+
+
+def favorites(rng, ctx):
+    _, _, headers = _customer(rng, ctx)
+    return "GET", "/api/v1/users/favorites?expand=1", None, headers
+
+
+def inquiries(rng, ctx):
+    _, _, headers = _customer(rng, ctx)
+    return "GET", "/api/v1/users/inquiries?expand=1", None, headers
+
+
+def admin_stats(rng, ctx):
+    return "GET", "/api/v1/admin/statistics", None, ctx["admin_headers"]
+
+
+def favorite_add(rng, ctx):
+    _, _, headers = _customer(rng, ctx)
+    return "POST", "/api/v1/users/favorites", {"property_id": rng.choice(ctx["property_ids"])}, headers
+
+
+# name -> request builder (rng, ctx) -> (method, path, json body, headers)
+# writes run last so the read scenarios all see the seeded data
+SCENARIOS = {
+    "list": list_page,
+    "list_filtered": list_filtered,
+    "detail": detail,
+    "search": search,
+    "favorites": favorites,
+    "inquiries": inquiries,
+    "admin_stats": admin_stats,
+    "login": login,
+    "favorite_add": favorite_add,
+}
+
+
+def _headers(app, uid, role):
+    from flask_jwt_extended import create_access_token
+    with app.app_context():
+        token = create_access_token(identity=uid, additional_claims={"role": role, "user_id": uid})
+    return {"Authorization": "Bearer " + token}
+
+
+def drive(app, build, ctx, clients, duration, warmup, seed):
+    stop = threading.Event()
+    recording = threading.Event()
+    times, statuses = [], {}
+    lock = threading.Lock()
+
+    def loop(n):
+        rng = random.Random(seed * 1000 + n)
+        client = app.test_client()
+        while not stop.is_set():
+            method, path, body, headers = build(rng, ctx)
+            start = time.perf_counter()
+            resp = client.open(path, method=method, json=body, headers=headers)
+            took = time.perf_counter() - start
+            resp.close()
+            if recording.is_set():
+                with lock:
+                    statuses[resp.status_code] = statuses.get(resp.status_code, 0) + 1
+                    if resp.status_code < 400:
+                        times.append(took)
+
+    threads = [threading.Thread(target=loop, args=(n,), daemon=True) for n in range(clients)]
+    for t in threads:
+        t.start()
+    time.sleep(warmup)
+    recording.set()
+    started = time.perf_counter()
+    time.sleep(duration)
+    elapsed = time.perf_counter() - started
+    recording.clear()
+    stop.set()
+    for t in threads:
+        t.join()
+
+    total = sum(statuses.values())
+    ms = lambda v: round(v * 1000, 3)
+    return {
+        "requests": total,
+        "errors": total - len(times),
+        "error_rate": round((total - len(times)) / total, 4) if total else 0.0,
+        "requests_per_s": round(len(times) / elapsed, 1),
+        "mean_ms": ms(sum(times) / len(times)) if times else 0.0,
+        "p50_ms": ms(percentile(times, 50)),
+        "p95_ms": ms(percentile(times, 95)),
+        "p99_ms": ms(percentile(times, 99)),
+        "max_ms": ms(max(times)) if times else 0.0,
+        "statuses": {str(k): v for k, v in sorted(statuses.items())}
+    }
+
+
+def _commit():
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=5)
+        return out.stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def run(args):
+    if args.no_cache:
+        os.environ["PROPERTY_CACHE_ENABLED"] = "0"
+
+    import app.extensions as ext
+    # the app package is already imported (benchmarks.dataset), so set the name directly
+    ext.DB_NAME = os.environ.get("MONGO_DB", "rentease_bench")
+    if ext.DB_NAME == "rentease":
+        raise SystemExit("refusing to seed the main database, set MONGO_DB")
+    if args.backend == "memory":
+        try:
+            import mongomock
+        except ImportError:
+            raise SystemExit("--backend memory needs mongomock (pip install mongomock)")
+        ext.MongoClient = mongomock.MongoClient
+    from app import create_app
+    from app.indexes import bootstrap
+
+    app = create_app()
+    try:
+        bootstrap(ext.db)
+    except errors.ConnectionFailure:
+        raise SystemExit("MongoDB not reachable, check MONGO_URI")
+    volumes = {name: getattr(args, name) for name in dataset.DEFAULT_VOLUMES}
+    started = time.perf_counter()
+    seeded = dataset.seed_db(ext.db, volumes, args.seed, force=args.reseed)
+    seed_s = round(time.perf_counter() - started, 2)
+
+    ctx = dataset.load(ext.db)
+    ctx["tokens"] = {uid: _headers(app, uid, "customer") for uid, _ in ctx["customers"]}
+    ctx["admin_headers"] = _headers(app, ctx["admin_id"], "admin")
+
+    names = args.scenarios.split(",") if args.scenarios else list(SCENARIOS)
+    unknown = [n for n in names if n not in SCENARIOS]
+    if unknown:
+        raise SystemExit(f"unknown scenarios: {', '.join(unknown)} (have {', '.join(SCENARIOS)})")
+    names = [n for n in SCENARIOS if n in names]
+
+    endpoints, skipped = {}, []
+    for name in names:
+        if args.backend == "memory" and name in NEEDS_MONGO:
+            skipped.append(name)
+            continue
+        result = drive(app, SCENARIOS[name], ctx, args.clients, args.duration, args.warmup, args.seed)
+        method, path, _, _ = SCENARIOS[name](random.Random(0), ctx)
+        endpoints[name] = dict({"method": method, "path": path.split("?")[0]}, **result)
+        print(f"{name:14} {result['requests_per_s']:>9} req/s  p50 {result['p50_ms']:>8} ms  "
+              f"p95 {result['p95_ms']:>8} ms  p99 {result['p99_ms']:>8} ms  errors {result['errors']}")
+
+    # writes changed the dataset, the next run reseeds
+    if WRITES.intersection(endpoints):
+        ext.db["bench_meta"].delete_one({"_id": "dataset"})
+
+    report = {
+        "meta": {
+            "commit": _commit(),
+            "createdAt": datetime.utcnow().isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "backend": args.backend,
+            "database": ext.db.name,
+            "volumes": volumes,
+            "seed": args.seed,
+            "seeded": seeded,
+            "seed_s": seed_s,
+            "clients": args.clients,
+            "duration_s": args.duration,
+            "warmup_s": args.warmup,
+            "cache": not args.no_cache,
+            "skipped": skipped
+        },
+        "endpoints": endpoints
+    }
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"wrote {args.out}")
+    ext.shutdown()
+
+
+def _change(old, new):
+    if not old:
+        return 0.0
+    return (new - old) / old * 100
+
+
+# regressions between two reports: slower p50/p95/p99 beyond the threshold
+# (and more than min_ms), lower throughput, or more errors
+def compare(base, new, threshold=10.0, min_ms=0.5):
+    rows, regressions = [], []
+    for name, b in base["endpoints"].items():
+        n = new["endpoints"].get(name)
+        if n is None:
+            continue
+        flags = []
+        for key in ("p50_ms", "p95_ms", "p99_ms"):
+            if _change(b[key], n[key]) > threshold and n[key] - b[key] > min_ms:
+                flags.append(key[:-3])
+        if _change(b["requests_per_s"], n["requests_per_s"]) < -threshold:
+            flags.append("throughput")
+        if n["error_rate"] > b["error_rate"] + 0.01:
+            flags.append("errors")
+        rows.append((name, b, n, flags))
+        if flags:
+            regressions.append({"endpoint": name, "flags": flags})
+    return rows, regressions
+
+
+def _print_compare(rows, base, new):
+    for label, report in (("base", base), ("new", new)):
+        meta = report["meta"]
+        print(f"{label:5} {meta.get('commit')} {meta['backend']} clients={meta['clients']} volumes={meta['volumes']}")
+    print(f"{'endpoint':14} {'p50 ms':>20} {'p95 ms':>20} {'p99 ms':>20} {'req/s':>22}")
+    for name, b, n, flags in rows:
+        cells = [f"{b[k]:>7} -> {n[k]:<7}({_change(b[k], n[k]):+.0f}%)"
+                 for k in ("p50_ms", "p95_ms", "p99_ms", "requests_per_s")]
+        print(f"{name:14} " + " ".join(cells) + ("  REGRESSION: " + ", ".join(flags) if flags else ""))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("run")
+    dataset.volume_args(p)
+    p.add_argument("--out", default="bench-results.json")
+    p.add_argument("--backend", choices=["mongo", "memory"], default="mongo")
+    p.add_argument("--clients", type=int, default=16)
+    p.add_argument("--duration", type=float, default=10)
+    p.add_argument("--warmup", type=float, default=2)
+    p.add_argument("--scenarios", help="comma list, default all: " + ",".join(SCENARIOS))
+    p.add_argument("--no-cache", action="store_true", help="disable the property response cache")
+    p.add_argument("--reseed", action="store_true")
+
+    c = sub.add_parser("compare")
+    c.add_argument("base")
+    c.add_argument("new")
+    c.add_argument("--threshold", type=float, default=10, help="percent change that counts as a regression")
+    c.add_argument("--min-ms", type=float, default=0.5, help="ignore latency changes smaller than this")
+    args = parser.parse_args(argv)
+
+    if args.command == "run":
+        run(args)
+        return 0
+    with open(args.base) as f:
+        base = json.load(f)
+    with open(args.new) as f:
+        new = json.load(f)
+    rows, regressions = compare(base, new, args.threshold, args.min_ms)
+    _print_compare(rows, base, new)
+    if regressions:
+        print(f"{len(regressions)} endpoint(s) regressed")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
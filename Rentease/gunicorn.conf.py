@@ -0,0 +1,66 @@
+﻿# Gunicorn config - production serving profile
+#   gunicorn -c gunicorn.conf.py run:app
+# Tune with WEB_CONCURRENCY (worker processes), GUNICORN_THREADS (threads per
+# worker), BIND, and the MONGO_* pool settings read by app/extensions.py.
+import multiprocessing
+import os
+import time
+
+bind = os.environ.get("BIND", "0.0.0.0:5000")
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2 + 1))
+# threads let a worker overlap Mongo round trips; bcrypt and image work
+# already run in their own pools
+worker_class = "gthread"
+threads = int(os.environ.get("GUNICORN_THREADS", 4))
+
+# import the app once in the master; workers fork from it
+preload_app = True
+
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 30))
+graceful_timeout = int(os.environ.get("GUNICORN_GRACEFUL_TIMEOUT", 30))
+keepalive = 5
+# recycle workers now and then so slow leaks can't build up
+max_requests = int(os.environ.get("GUNICORN_MAX_REQUESTS", 5000))
+max_requests_jitter = max_requests // 10
+
+accesslog = os.environ.get("GUNICORN_ACCESS_LOG") or None
+errorlog = "-"
+
+# one pooled connection per request thread plus a few for background jobs;
+# the server sees at most workers * maxPoolSize connections
+os.environ.setdefault("MONGO_MAX_POOL_SIZE", str(threads + 4))
+# admission control (ADMISSION_ENABLED=1) counts a worker's threads as its capacity
+os.environ.setdefault("ADMISSION_CAPACITY", str(threads))
+
+
+# create collections + indexes once in the master (MONGO_BOOTSTRAP=0 when a
+# deploy step runs python -m app.indexes instead), then close its client
+# before forking. If Mongo is down workers still start; /readyz says why.
+def when_ready(server):
+    import app.extensions as ext
+    from app.indexes import bootstrap
+    if os.environ.get("MONGO_BOOTSTRAP", "1") != "0":
+        try:
+            bootstrap(ext.db)
+        except Exception as e:
+            server.log.warning("Mongo bootstrap failed: %s", e)
+    ext.close_mongo()
+
+
+# every worker gets its own MongoClient
+def post_fork(server, worker):
+    import app.extensions as ext
+    worker.forked_at = time.perf_counter()
+    ext.reconnect()
+
+
+# per-worker cold start: fork -> ready to accept
+def post_worker_init(worker):
+    worker.log.info("Worker %s ready in %.0f ms", worker.pid, (time.perf_counter() - worker.forked_at) * 1000)
+
+
+# SIGTERM: gunicorn stops accepting, finishes in-flight requests
+# (up to graceful_timeout), then this runs in the worker
+def worker_exit(server, worker):
+    import app.extensions as ext
+    ext.shutdown()
@@ -1,7 +1,17 @@
 ﻿# Entry point - run the Flask app
+# python run.py is the dev server; in production serve with gunicorn:
+#   gunicorn -c gunicorn.conf.py run:app
 from app import create_app
+from app.indexes import bootstrap
+import app.extensions as ext
+import os
 
 app = create_app()
 
 if __name__ == "__main__":
-    app.run(debug=True, host="0.0.0.0", port=5000)
+    # dev server: set up collections + indexes here (gunicorn does it in its master)
+    try:
+        bootstrap(ext.db)
+    except Exception as e:
+        app.logger.warning("Mongo bootstrap failed: %s", e)
+    app.run(debug=os.environ.get("FLASK_DEBUG", "1") == "1", host="0.0.0.0", port=5000)
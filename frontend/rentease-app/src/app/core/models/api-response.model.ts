@@ -13,12 +13,14 @@ export interface ApiResponse<T = any> {
  * Pagination metadata
  */
 export interface PaginationMeta {
-  current_page: number;
-  total_pages: number;
-  total_items: number;
-  items_per_page: number;
+  current_page?: number;
+  total_pages?: number;
+  total_items?: number;
+  items_per_page?: number;
   has_next: boolean;
-  has_prev: boolean;
+  has_prev?: boolean;
+  limit?: number;
+  next_cursor?: string | null;
 }
 
 /**
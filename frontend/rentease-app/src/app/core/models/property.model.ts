@@ -83,6 +83,8 @@ export interface PropertySearchFilters {
   sort_order?: 'asc' | 'desc';
   page?: number;
   limit?: number;
+  cursor?: string;
+  fields?: string;
 }
 
 // property payload for create/update
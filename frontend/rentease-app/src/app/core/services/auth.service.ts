@@ -91,14 +91,14 @@ export class AuthService {
   }
 
   // refresh access token
-  refreshToken(): Observable<ApiResponse<{ access_token: string }>> {
+  refreshToken(): Observable<ApiResponse<{ access_token: string; refresh_token?: string }>> {
     const refreshToken = this.refreshTokenSignal();
     if (!refreshToken) {
       return throwError(() => new Error('No refresh token available'));
     }
 
     const payload: RefreshTokenRequest = { refresh_token: refreshToken };
-    return this.http.post<ApiResponse<{ access_token: string }>>(
+    return this.http.post<ApiResponse<{ access_token: string; refresh_token?: string }>>(
       `${this.API_URL}/auth/refresh`,
       payload
     ).pipe(
@@ -108,6 +108,13 @@ export class AuthService {
           if (this.isBrowser) {
             localStorage.setItem('access_token', response.data.access_token);
           }
+          // refresh tokens are rotated - the old one is now spent
+          if (response.data.refresh_token) {
+            this.refreshTokenSignal.set(response.data.refresh_token);
+            if (this.isBrowser) {
+              localStorage.setItem('refresh_token', response.data.refresh_token);
+            }
+          }
         }
       }),
       catchError(error => {